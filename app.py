@@ -1,17 +1,23 @@
 import streamlit as st
-import streamlit as st
-import pandas as pd
-from io import BytesIO
-from ibm import extract_ibm_data_from_pdf, create_styled_excel, create_styled_excel_template2, correct_descriptions, extract_last_page_text
-from ibm_template2 import extract_ibm_template2_from_pdf, get_extraction_debug
-from sales.ibm_v2 import compare_mep_and_cost
-from sales.mibb import correct_mibb_descriptions, create_mibb_excel, extract_mibb_header_from_pdf, extract_mibb_table_from_pdf
-from template_detector import detect_ibm_template
+# Extractors, pandas, openpyxl and PyMuPDF are imported inside the tool that needs them,
+# so the page renders without loading them and the MIBB tool never loads Template 1/2 code
+from stages import content_hash
+from concurrent.futures import CancelledError
+import jobs
+import memtrace
+import metrics
+import profiling
+import timing
+import tracing
+import warmup
+import workers
 import logging
+import os
+import uuid
 
-# Configure logging
+# Configure logging (the log file is created on the first record)
 logging.basicConfig(
-    filename="output_log.log",
+    handlers=[logging.FileHandler("output_log.log", delay=True)],
     level=logging.DEBUG,
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
@@ -19,6 +25,13 @@ logging.basicConfig(
 # ✅ Must be first Streamlit command
 st.set_page_config(page_title="IBM Quotation Extractor", layout="wide")
 
+# Pre-warm the extraction worker processes (no-op unless MINDTOOL_WORKER_PROCESSES is set)
+workers.start()
+# Warm this process once per server (imports, caches, synthetic extractions) in the background
+warmup.start_background()
+# Prometheus /metrics endpoint (no-op unless MINDTOOL_METRICS_PORT is set)
+metrics.serve()
+
 # ---------------------------
 # Tool selection UI
 # ---------------------------
@@ -34,13 +47,129 @@ tool_choice = st.radio(
     
 )
 
-def load_master_map(master_file):
-    df = pd.read_excel(master_file) if master_file.name.endswith(".xlsx") else pd.read_csv(master_file)
-    df = df.iloc[:, :2]   # FIRST TWO COLUMNS ONLY
-    df.columns = ["part", "desc"]
-    df["part"] = df["part"].astype(str).str.upper().str.replace(" ", "").str.replace("-", "")
-    df["desc"] = df["desc"].fillna("").astype(str)
-    return dict(zip(df["part"], df["desc"]))
+# Per-stage timing breakdown (timing.py) under the results
+timings_on = st.toggle("⏱️ Show timing breakdown", value=timing.TIMING_DEFAULT)
+# Profiler (profiling.py), allocation tracking (memtrace.py) and extraction trace (tracing.py):
+# MINDTOOL_PROFILE=1 / MINDTOOL_TRACEMALLOC=1 / MINDTOOL_TRACE=1, or toggles shown only with
+# ?profile=1 in the URL. Such a run skips the session stage cache so every stage shows up in the report.
+profile_on = profiling.PROFILE_DEFAULT
+allocations_on = memtrace.TRACEMALLOC_DEFAULT
+trace_on = tracing.TRACE_DEFAULT
+if st.query_params.get("profile") == "1":
+    profile_on = st.toggle("🔬 Profile this run", value=profile_on)
+    allocations_on = st.toggle("🧠 Track allocations per stage", value=allocations_on)
+    trace_on = st.toggle("🧾 Write extraction trace (JSONL)", value=trace_on)
+diagnostics_on = profile_on or allocations_on or trace_on
+
+
+def upload_size(upload) -> int:
+    return upload.getbuffer().nbytes if upload is not None else 0
+
+
+def upload_pages(pdf_bytes, pdf_hash) -> int:
+    """Page count of an upload, counted once: reruns (downloads, widget changes) reuse it from the session."""
+    from pdf_io import page_count
+    counts = st.session_state.setdefault("page_counts", {})  # content hash -> pages
+    if pdf_hash not in counts:
+        if len(counts) >= 8:
+            counts.clear()
+        counts[pdf_hash] = page_count(pdf_bytes)
+    return counts[pdf_hash]
+
+
+def show_timings(timings):
+    """Timing breakdown of a run (timing.py), nested spans indented."""
+    if not timings:
+        return
+    with st.expander(f"⏱️ Timing breakdown - {timings['total_ms']:.0f} ms total"):
+        st.dataframe([
+            {"span": "· " * s["depth"] + s["span"] + (f" ({s['note']})" if s["note"] else ""),
+             "wall ms": s["wall_ms"], "cpu ms": s["cpu_ms"], "pages": s["pages"], "rows": s["rows"]}
+            for s in timings["spans"]
+        ], use_container_width=True)
+
+
+def show_profile(profile):
+    """Top hotspots of a profiled run (profiling.py) and its flamegraph input."""
+    if not profile:
+        return
+    with st.expander(f"🔬 Profile - {profile['seconds']:.2f} s, top {len(profile['hotspots'])} functions by own time"):
+        st.dataframe(profile["hotspots"], use_container_width=True)
+        files = profile["files"]
+        if files:
+            st.caption(f"pstats: {files['pstats']} · collapsed stacks: {files['collapsed']} · input: {files['input']}")
+            with open(files["collapsed"], "rb") as f:
+                st.download_button("📥 Download collapsed stacks (flamegraph)", f.read(),
+                                   file_name=os.path.basename(files["collapsed"]), mime="text/plain")
+
+
+def show_allocations(report):
+    """Per-stage allocation report of a run (memtrace.py)."""
+    if not report:
+        return
+    with st.expander(f"🧠 Allocations - net {report['net_kb']:.0f} KB, peak {report['peak_kb']:.0f} KB"):
+        st.dataframe([
+            {"stage": "· " * s["depth"] + s["stage"], "net KB": s["net_kb"], "peak KB": s["peak_kb"],
+             "top site": s["top"][0]["site"] if s["top"] else None,
+             "top site KB": s["top"][0]["size_kb"] if s["top"] else None}
+            for s in report["stages"]
+        ], use_container_width=True)
+        st.caption("Top allocating sites of the whole request")
+        st.dataframe(report["top"], use_container_width=True)
+
+
+def show_trace(trace):
+    """Event counts of a traced run (tracing.py) and the JSONL file."""
+    if not trace:
+        return
+    with st.expander(f"🧾 Extraction trace - {trace['events']} events"):
+        st.caption(f"{trace['path']} · " + ", ".join(f"{kind}: {n}" for kind, n in sorted(trace["counts"].items())))
+        with open(trace["path"], "rb") as f:
+            st.download_button("📥 Download extraction trace", f.read(), file_name=os.path.basename(trace["path"]),
+                               mime="application/jsonl")
+
+
+def run_job(name, key, label, fn, *args, memory_mb=0.0, keep_result=False, **kwargs):
+    """
+    Run fn off the script thread (see jobs.py) and show its queue position and
+    stage/page progress in st.status.
+    A rerun with different inputs cancels the superseded job; this run then stops quietly.
+    keep_result: for diagnostics runs (profile / allocations / trace), which bypass the stage
+    cache so every stage is measured - the result is kept per key in the session, so reruns
+    with the same inputs (download clicks, unrelated widgets) show it again instead of
+    computing and writing the diagnostics again.
+    """
+    kept = st.session_state.get(f"{name}_kept") if keep_result else None
+    if kept is not None and kept[0] == key:
+        return kept[1]
+    session_slot = st.session_state.setdefault("job_session", uuid.uuid4().hex)
+    try:
+        job = jobs.submit(f"{session_slot}:{name}", key, fn, *args, memory_mb=memory_mb, **kwargs)
+    except jobs.QueueFull:
+        st.error("⏳ The server is busy processing other quotations. Please try again in a minute.")
+        st.stop()
+    with st.status(label, expanded=False) as status:
+        bar = st.progress(0.0, text="Starting...")
+
+        def show(progress):
+            if progress["queue_position"]:
+                bar.progress(0.0, text=f"Waiting in queue - position {progress['queue_position']}")
+                return
+            text = progress["stage"] or "Starting..."
+            if progress["total"]:
+                text += f" ({progress['done']}/{progress['total']})"
+            bar.progress(progress["fraction"] or 0.0, text=text)
+
+        try:
+            result = jobs.wait(job, show)
+        except (jobs.JobCancelled, CancelledError):
+            status.update(label="Cancelled - inputs changed", state="error")
+            st.stop()
+        bar.empty()
+        status.update(label=f"{label} - done in {job.token.progress()['elapsed']:.1f}s", state="complete")
+    if keep_result:
+        st.session_state[f"{name}_kept"] = (key, result)
+    return result
 
 
 if tool_choice == "IBM Quotation":
@@ -70,10 +199,22 @@ if tool_choice == "IBM Quotation":
 
     if uploaded_pdf:
         from sales.ibm_v2_combo import process_ibm_combo
+        import pandas as pd
         import io
-        pdf_bytes = io.BytesIO(uploaded_pdf.getbuffer())
+        # Zero-copy view of the upload; every extractor hands it straight to PyMuPDF
+        pdf_bytes = uploaded_pdf.getbuffer()
         excel_bytes = io.BytesIO(uploaded_excel.getbuffer()) if uploaded_excel else None
-        result = process_ibm_combo(pdf_bytes, excel_bytes, country=country)
+        # Stage results live in the session, so widget reruns only redo what changed;
+        # the run itself happens off the script thread with progress in st.status
+        pdf_hash = content_hash(pdf_bytes)
+        pages = upload_pages(pdf_bytes, pdf_hash)
+        memory_mb = jobs.estimate_job_mb(pages, pdf_bytes.nbytes, upload_size(uploaded_excel))
+        result = run_job("combo", (pdf_hash, content_hash(excel_bytes), country, timings_on,
+                                   profile_on, allocations_on, trace_on),
+                         "Processing quotation", process_ibm_combo, pdf_bytes, excel_bytes, country=country,
+                         stage_cache=None if diagnostics_on else st.session_state.setdefault("combo_stages", {}),
+                         timings=timings_on, profile=profile_on, allocations=allocations_on, trace=trace_on,
+                         pages=pages, memory_mb=memory_mb, keep_result=diagnostics_on)
 
         if result['error']:
             st.error(f"❌ {result['error']}")
@@ -99,6 +240,10 @@ if tool_choice == "IBM Quotation":
                     
                     
                 )
+        show_timings(result.get('timings'))
+        show_profile(result.get('profile'))
+        show_allocations(result.get('allocations'))
+        show_trace(result.get('trace'))
 elif tool_choice == "MIBB Quotations":
     st.header("📋 MIBB Quotations")
     st.info("Upload a MIBB quotation PDF. The tool will extract header information and table data automatically.")
@@ -119,23 +264,24 @@ elif tool_choice == "MIBB Quotations":
     )
 
     if uploaded_pdf:
-        # Extract header
-        pdf_bytes = BytesIO(uploaded_pdf.getbuffer())
-        header_info = extract_mibb_header_from_pdf(pdf_bytes)
-
-        # Extract table data
-        pdf_bytes.seek(0)
-        table_data = extract_mibb_table_from_pdf(pdf_bytes)
-
-        if master_file:
-            master_map = load_master_map(master_file)
-        else:
-            master_map = None
+        from sales.mibb import process_mibb
+        # Stages are memoized in the session: a download click or an unrelated widget
+        # change reuses the extracted tables and the rendered Excel
+        pdf_bytes = uploaded_pdf.getbuffer()
+        pdf_hash = content_hash(pdf_bytes)
+        pages = upload_pages(pdf_bytes, pdf_hash)
+        memory_mb = jobs.estimate_job_mb(pages, pdf_bytes.nbytes, upload_size(master_file))
+        mibb = run_job("mibb", (pdf_hash, content_hash(master_file), timings_on, profile_on,
+                              allocations_on),
+                       "Processing MIBB quotation", process_mibb, pdf_bytes, master_file,
+                       None if diagnostics_on else st.session_state.setdefault("mibb_stages", {}), logo_path,
+                       timings=timings_on, profile=profile_on, allocations=allocations_on, pages=pages,
+                       memory_mb=memory_mb, keep_result=diagnostics_on)
+        table_data = mibb["table_data"]
+        master_map = mibb["master_map"]
+        if not master_file:
             st.warning("please upload pricelist")
 
-        # Correct descriptions
-        table_data = correct_mibb_descriptions(table_data, master_map)
-
         # Missing SKUs warning (only once)
         missing = []
         if master_map:
@@ -154,22 +300,17 @@ elif tool_choice == "MIBB Quotations":
             )
 
         # Create Excel
-        if table_data:
-            output = BytesIO()
-            create_mibb_excel(
-                data=table_data,
-                header_info=header_info,
-                logo_path=logo_path,
-                output=output
-            )
-
+        if mibb["excel_bytes"]:
             st.success("✅ Excel file generated successfully!")
 
             st.download_button(
                 label="📥 Download MIBB Quotation Excel",
-                data=output.getvalue(),
+                data=mibb["excel_bytes"],
                 file_name="MIBB_Quotation.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             )
+        show_timings(mibb.get("timings"))
+        show_profile(mibb.get("profile"))
+        show_allocations(mibb.get("allocations"))
     else:
         st.info("👆 Please upload a MIBB quotation PDF to get started.")
\ No newline at end of file
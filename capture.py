@@ -0,0 +1,210 @@
+# capture.py
+"""
+Automatic capture of slow or failing requests, for offline replay (tools/replay.py).
+request(tool, ...) wraps process_ibm_combo / sales.mibb.process_mibb; when the request takes
+longer than MINDTOOL_SLO_SECONDS, raises, or reports an error, its input bundle is written to
+MINDTOOL_CAPTURE_DIR/<bundle id>/ (the id hashes the inputs, so a repeat overwrites its bundle):
+- bundle.json   tool, country, template, reason, seconds, error / traceback, upload names
+- input.pdf, input.xlsx / master.<ext>   the uploads as received
+- lines.json    the line lists the extractors read from the PDF (note_lines), so a replay
+                can re-run the line heuristics without parsing the PDF
+load() reads a bundle back and rerun() sends it through its pipeline again (tools/replay.py,
+tools/golden.py - the golden corpus uses the same layout).
+Line lists are noted only when the extraction runs in this process (not in a worker process,
+not served from the stage cache); replay derives them from input.pdf when they are missing.
+A cancelled job (jobs.JobCancelled, or a token cancelled while the job was finishing) is never
+captured: its time says nothing about the request.
+The spool keeps the newest MINDTOOL_CAPTURE_MAX bundles. MINDTOOL_CAPTURE=0 disables capture.
+"""
+import contextvars
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import traceback
+from contextlib import contextmanager
+
+from jobs import current_token
+from stages import content_hash, stage_key
+
+logger = logging.getLogger("capture")
+
+CAPTURE_ENABLED = os.environ.get("MINDTOOL_CAPTURE", "1") != "0"
+CAPTURE_DIR = os.environ.get("MINDTOOL_CAPTURE_DIR", "captures")
+CAPTURE_MAX = int(os.environ.get("MINDTOOL_CAPTURE_MAX", "50") or 0)
+SLO_SECONDS = float(os.environ.get("MINDTOOL_SLO_SECONDS", "30") or 0)
+
+MIBB_LOGO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image.png")
+
+_bundle = contextvars.ContextVar("mindtool_capture", default=None)
+
+
+class Bundle:
+    """Inputs and outcome of one request, written only when the request breaches the SLO or fails."""
+
+    def __init__(self, tool, pdf, excel=None, master=None, **params):
+        self.tool = tool
+        self.pdf = pdf
+        self.excel = excel
+        self.master = master
+        self.params = params  # country, ... - whatever the entry point needs to re-run
+        self.template = None
+        self.error = None
+        self.traceback = None
+        self.lines = {}
+
+    def bundle_id(self) -> str:
+        inputs = [content_hash(self.pdf), content_hash(self.excel), content_hash(self.master)]
+        return stage_key(self.tool, inputs + sorted(self.params.items()))[:20]
+
+    def write(self, reason, seconds, exc_text=None) -> str:
+        from pdf_io import pdf_buffer
+        path = os.path.join(CAPTURE_DIR, self.bundle_id())
+        os.makedirs(path, exist_ok=True)
+        info = {"tool": self.tool, "reason": reason, "seconds": round(seconds, 3), "template": self.template,
+                "error": self.error, "traceback": exc_text or self.traceback, "params": self.params,
+                "captured_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": {}}
+        for field, upload, stem, default_ext in (("pdf", self.pdf, "input", ".pdf"),
+                                                 ("excel", self.excel, "input", ".xlsx"),
+                                                 ("master", self.master, "master", ".csv")):
+            if upload is None:
+                continue
+            name = getattr(upload, "name", None) or (upload if isinstance(upload, str) else None)
+            filename = stem + (os.path.splitext(name)[1] if name else default_ext)
+            data = pdf_buffer(upload)
+            if data is None and isinstance(upload, str):
+                shutil.copyfile(upload, os.path.join(path, filename))
+            else:
+                with open(os.path.join(path, filename), "wb") as f:
+                    f.write(data)
+            info["files"][field] = {"file": filename, "name": name}
+        if self.lines:
+            with open(os.path.join(path, "lines.json"), "w", encoding="utf-8") as f:
+                json.dump(self.lines, f, ensure_ascii=False)
+        with open(os.path.join(path, "bundle.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2, default=str)
+        _prune()
+        return path
+
+
+def _prune():
+    """Keep the newest CAPTURE_MAX bundles."""
+    if CAPTURE_MAX <= 0:
+        return
+    bundles = [os.path.join(CAPTURE_DIR, name) for name in os.listdir(CAPTURE_DIR)]
+    bundles = sorted((p for p in bundles if os.path.isdir(p)), key=os.path.getmtime, reverse=True)
+    for path in bundles[CAPTURE_MAX:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@contextmanager
+def request(tool, pdf, excel=None, master=None, **params):
+    """
+    Capture the enclosed request when it breaches the SLO or fails (see module docstring).
+    Yields the Bundle (None with MINDTOOL_CAPTURE=0); set bundle.template / bundle.error from
+    the result - pipelines that report errors in their result instead of raising need it.
+    """
+    if not CAPTURE_ENABLED:
+        yield None
+        return
+    bundle = Bundle(tool, pdf, excel, master, **params)
+    token = _bundle.set(bundle)
+    start = time.perf_counter()
+    exc_text = None
+    interrupted = False
+    try:
+        yield bundle
+    except Exception:
+        exc_text = traceback.format_exc()
+        raise
+    except BaseException:  # JobCancelled, KeyboardInterrupt: not a failure of the request
+        interrupted = True
+        raise
+    finally:
+        _bundle.reset(token)
+        seconds = time.perf_counter() - start
+        job = current_token()
+        reason = None
+        if interrupted or (job is not None and job.cancelled):
+            logger.info(f"Not capturing cancelled {tool} request ({seconds:.1f}s)")
+        elif exc_text is not None:
+            reason = "exception"
+        elif bundle.error:
+            reason = "error"
+        elif SLO_SECONDS and seconds > SLO_SECONDS:
+            reason = "slo"
+        if reason is not None:
+            try:
+                path = bundle.write(reason, seconds, exc_text)
+                logger.warning(f"Captured {tool} request ({reason}, {seconds:.1f}s) to {path}")
+            except Exception as e:  # capture must never fail the request itself
+                logger.warning(f"Could not capture {tool} request: {e}")
+
+
+def note_lines(extractor, lines):
+    """Keep the line lists an extractor read from the PDF with the current bundle (no-op outside request())."""
+    bundle = _bundle.get()
+    if bundle is not None:
+        bundle.lines[extractor] = lines
+
+
+def note_exception():
+    """Keep the traceback of an exception the pipeline catches and reports in its result."""
+    bundle = _bundle.get()
+    if bundle is not None:
+        bundle.traceback = traceback.format_exc()
+
+
+def load(path) -> dict:
+    """bundle.json of a captured bundle, with "path" and "lines" (None when lines.json is missing)."""
+    with open(os.path.join(path, "bundle.json"), encoding="utf-8") as f:
+        info = json.load(f)
+    info["path"] = path
+    lines_path = os.path.join(path, "lines.json")
+    info["lines"] = None
+    if os.path.exists(lines_path):
+        with open(lines_path, encoding="utf-8") as f:
+            info["lines"] = json.load(f)
+    return info
+
+
+def upload(info, field):
+    """An upload of a loaded bundle as a named BytesIO (what Streamlit hands the pipelines), or None."""
+    entry = info["files"].get(field)
+    if not entry:
+        return None
+    with open(os.path.join(info["path"], entry["file"]), "rb") as f:
+        data = io.BytesIO(f.read())
+    data.name = entry["name"] or entry["file"]
+    return data
+
+
+def rerun(info, timings=False, profile=False, allocations=False, trace=False, raw_lines=False):
+    """
+    Run a loaded bundle through its pipeline again, without stage cache.
+    trace / raw_lines: write the extraction trace (tracing.py; combo bundles - MIBB emits no events).
+    Returns (result, output): the pipeline's result dict and its comparable part,
+    {"header_info", "columns", "data", "error"}.
+    """
+    pdf = upload(info, "pdf").getbuffer()
+    if info["tool"] == "combo":
+        import tracing
+        from sales.ibm_v2_combo import process_ibm_combo
+        with tracing.request(trace, "replay-combo", pdf, raw_lines) as tracer:
+            result = process_ibm_combo(pdf, upload(info, "excel"), country=info["params"].get("country", "UAE"),
+                                       timings=timings, profile=profile, allocations=allocations, trace=False)
+        if tracer is not None:
+            result["trace"] = tracer.report()
+        output = {"header_info": result["header_info"], "columns": result["columns"], "data": result["data"],
+                  "error": result["error"]}
+    elif info["tool"] == "mibb":
+        from sales.mibb import process_mibb
+        result = process_mibb(pdf, upload(info, "master"), None, MIBB_LOGO, timings=timings, profile=profile,
+                              allocations=allocations)
+        output = {"header_info": result["header_info"], "columns": None, "data": result["table_data"],
+                  "error": None}
+    else:
+        raise ValueError(f"unknown tool {info['tool']!r}")
+    return result, output
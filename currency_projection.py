@@ -0,0 +1,130 @@
+# currency_projection.py
+"""
+Country projection of extracted quotation rows.
+Extraction is country-independent: Template 2 yields canonical USD line items and
+Template 1 yields the Excel rows in USD. The functions here turn those into the rows
+shown / written for one country (USD -> AED/SAR conversion, partner-discount math,
+Qatar formula rows), so switching the country never re-parses the PDF.
+- UAE   -> AED (3.6725)
+- KSA   -> SAR (3.75)
+- Qatar -> USD (1.0, no conversion)
+"""
+import math
+
+USD_TO_AED = 3.6725  # UAE
+USD_TO_SAR = 3.75    # KSA
+
+# country -> (currency label, USD to local rate); anything else is treated as UAE
+COUNTRY_CURRENCY = {
+    "UAE": ("AED", USD_TO_AED),
+    "KSA": ("SAR", USD_TO_SAR),
+    "QATAR": ("USD", 1.0),
+}
+
+TEMPLATE1_COLUMNS = ["SKU", "Description", "Quantity", "Start Date", "End Date", "Cost"]
+TEMPLATE1_QATAR_COLUMNS = [
+    "SKU", "Product Description", "Quantity", "Start Date", "End Date",
+    "MEP Unit Price in USD", "Extended MEP Price USD", "Unit Partner Price USD", "Total Partner Price in USD"
+]
+TEMPLATE1_QATAR_FIRST_ROW = 18  # Excel row of the first line item in the Qatar sheet
+
+# Template 2 pricing rules (how the extractor found the prices)
+PRICING_FROM_TOTAL = "total"            # line-item block: unit and partner derived from the bid total
+PRICING_FROM_TABLE = "table"            # table rows: unit and total read separately
+
+
+def _country_key(country) -> str:
+    c = (country or "").strip().upper()
+    return c if c in COUNTRY_CURRENCY else "UAE"
+
+
+def usd_to_local_rate(country) -> float:
+    return COUNTRY_CURRENCY[_country_key(country)][1]
+
+
+def currency_label(country) -> str:
+    return COUNTRY_CURRENCY[_country_key(country)][0]
+
+
+def local_mep(mep_usd: float, country):
+    """MEP in local currency, or None when the country quotes in USD (Qatar)."""
+    if _country_key(country) == "QATAR":
+        return None
+    return mep_usd * usd_to_local_rate(country)
+
+
+def _to_float(x):
+    # Normalize numeric inputs so Excel formulas can compute correctly
+    try:
+        return float(x) if x not in (None, "", "-",) else 0.0
+    except Exception:
+        return 0.0
+
+
+def project_template1_rows(data, country):
+    """
+    Template 1 rows for one country: (rows, columns).
+    Qatar gets the USD formula layout (unit / partner prices computed in Excel);
+    other countries keep the extracted rows.
+    """
+    if _country_key(country) != "QATAR":
+        return data, list(TEMPLATE1_COLUMNS)
+    rows = []
+    for excel_row, row in enumerate(data, start=TEMPLATE1_QATAR_FIRST_ROW):
+        row = list(row) + [""] * (6 - len(row))
+        sku, desc, qty, start_date, end_date, raw_cost = row[:6]  # raw_cost is the Extended MEP (total)
+        rows.append([
+            sku,                                           # A
+            desc,                                          # B
+            _to_float(qty),                                # C (numeric)
+            start_date,                                    # D
+            end_date,                                      # E
+            f"=ROUND(I{excel_row}/E{excel_row},2)",       # F = unit price
+            _to_float(raw_cost),                           # G (numeric)
+            f"=ROUND(H{excel_row}*0.99,2)",               # H = 1% discount applied to unit price
+            f"=J{excel_row}*E{excel_row}",                # I = H * qty
+        ])
+    return rows, list(TEMPLATE1_QATAR_COLUMNS)
+
+
+def project_template2_items(items, country) -> list:
+    """
+    Template 2 display rows for one country from canonical USD line items:
+    [sku, desc, qty, duration, start_date, end_date, unit_local, total_local, partner_local]
+    Rounding happens on the local amounts, as the Excel sheet does.
+    """
+    rate = usd_to_local_rate(country)
+    return [_project_template2_item(item, rate) for item in items]
+
+
+def _project_template2_item(item, rate):
+    qty = item["qty"]
+    total_usd = item["total_usd"]
+    discount = item["channel_discount"]
+    if item["pricing"] == PRICING_FROM_TOTAL:
+        # Total Price first, then Unit Price from Total;
+        # Partner = ROUNDUP(Unit Price * (1 - Channel Discount%), 2) * Qty
+        total_local = round(total_usd * rate, 2) if total_usd else None
+        unit_local = round(total_local / qty, 2) if total_local and qty > 0 else total_local
+        partner_local = None
+        if unit_local is not None and qty:
+            partner_unit = math.ceil(unit_local * (1 - discount) * 100) / 100
+            partner_local = round(partner_unit * qty, 2)
+    else:
+        unit_local = round(item["unit_usd"] * rate, 2)
+        total_local = round(total_usd * rate, 2)
+        if item.get("partner_usd") is not None:
+            partner_local = round(item["partner_usd"] * rate, 2)
+        else:
+            partner_local = round(total_usd * rate * (1 - discount), 2)
+    return [
+        item["sku"],
+        item["desc"],
+        qty,
+        item["duration"],
+        item["start_date"],
+        item["end_date"],
+        unit_local,
+        total_local,
+        partner_local,
+    ]
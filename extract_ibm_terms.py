@@ -1,59 +1,329 @@
-import fitz  # PyMuPDF
+"""
+IBM Terms and Conditions extraction.
+- Pages are scanned from the end (terms sit at the back of the quote) and the scan
+  stops as soon as the terms block is bounded by its heading.
+- Reconstructed paragraphs are hashed and interned in a local boilerplate store
+  (MINDTOOL_BOILERPLATE_STORE), keyed by the hash of the terms pages' text, so a
+  quote whose terms were seen before is a hash lookup and the rendered text is
+  shared instead of rebuilt. The store is shared by the job threads (jobs.py) under one lock;
+  new documents are written by a persisted.Writer, debounced and merged into the file under
+  a file lock, so documents other processes stored meanwhile are kept.
+- extract_ibm_terms_text(): whole terms block (used by the combo flow)
+- extract_last_page_terms(): terms on the last terms page only (ibm.extract_last_page_text)
+"""
+import hashlib
+import logging
+import os
+import threading
+from functools import lru_cache
 
+from pdf_io import open_pdf, iter_page_text, learning_enabled, register_cache
+from page_classifier import PAGE_HEADER, classify_page, is_table_page, is_terms_page
+from timing import timed
+import metrics
+import persisted
+
+logger = logging.getLogger("extract_ibm_terms")
+
+TERMS_HEADING = "IBM Terms and Conditions"
+USEFUL_HEADING = "Useful/Important web resources:"
+PARAGRAPH_STARTS = (
+    "IBM International",
+    "The quote or order",
+    "Unless specifically",
+    "The terms of the IBM",
+    "If you have any trouble",
+)
+COMPANY_HEADER_LINES = ["IBM Ireland Product", "VAT: Reg", "Building", "Mulhuddart", "Dublin"]
+
+BOILERPLATE_STORE_PATH = os.environ.get(
+    "MINDTOOL_BOILERPLATE_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "boilerplate_store.json"),
+)
+STORE_MAX_DOCUMENTS = 2000
+LAST_PAGE_SCAN_MAX = 5  # pages extract_last_page_terms looks back for a terms page
+
+_store = None  # {"paragraphs": {hash: text}, "documents": {text hash: [paragraph hashes]}}
+_store_lock = threading.RLock()  # _store and _new
+_new = {"paragraphs": {}, "documents": {}}  # added since the last write
+_cleared = False  # clear_boilerplate_store(persist=True) since the last write: replace the file
+
+
+# ----------------------------------------------------------------------
+# Boilerplate store
+# ----------------------------------------------------------------------
+def _load_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = persisted.read(BOILERPLATE_STORE_PATH)
+            store.setdefault("paragraphs", {})
+            store.setdefault("documents", {})
+            _store = store
+        return _store
+
+
+def _merge_store(on_disk):
+    """The file's store with the documents this process added since its last write (persisted.Writer)."""
+    global _cleared
+    with _store_lock:
+        if not _new["documents"] and not _cleared:
+            return None
+        base = {} if _cleared else on_disk
+        paragraphs = dict(base.get("paragraphs") or {})
+        documents = dict(base.get("documents") or {})
+        paragraphs.update(_new["paragraphs"])
+        for key, hashes in _new["documents"].items():
+            documents.pop(key, None)
+            documents[key] = hashes
+        _new["paragraphs"].clear()
+        _new["documents"].clear()
+        _cleared = False
+    if len(documents) > STORE_MAX_DOCUMENTS:
+        for key in list(documents)[:len(documents) - STORE_MAX_DOCUMENTS]:
+            del documents[key]
+        referenced = {h for doc_hashes in documents.values() for h in doc_hashes}
+        paragraphs = {h: text for h, text in paragraphs.items() if h in referenced}
+    return {"paragraphs": paragraphs, "documents": documents}
+
+
+_writer = persisted.Writer(BOILERPLATE_STORE_PATH, _merge_store, "boilerplate store", ensure_ascii=False)
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def intern_paragraphs(paragraphs) -> tuple:
+    """Add paragraphs to the store (each text is kept once) and return their hashes."""
+    hashes = tuple(_text_hash(paragraph) for paragraph in paragraphs)
+    with _store_lock:
+        stored = _load_store()["paragraphs"]
+        for h, paragraph in zip(hashes, paragraphs):
+            stored.setdefault(h, paragraph)
+    return hashes
+
+
+@lru_cache(maxsize=256)
+def render_paragraphs(hashes: tuple) -> str:
+    """Join interned paragraphs back into terms text (rendered once per distinct block)."""
+    with _store_lock:
+        paragraphs = _load_store()["paragraphs"]
+        return "\n\n".join(paragraphs[h] for h in hashes)
+
+
+register_cache("extract_ibm_terms.rendered", render_paragraphs.cache_clear)
+
+
+def _lookup(kind: str, source_text: str):
+    """Rendered terms for source text seen before, or None."""
+    key = f"{kind}:{_text_hash(source_text)}"
+    with _store_lock:
+        store = _load_store()
+        hashes = store["documents"].get(key)
+        if hashes is not None and all(h in store["paragraphs"] for h in hashes):
+            metrics.cache_lookup("boilerplate", True)
+            return render_paragraphs(tuple(hashes))
+    metrics.cache_lookup("boilerplate", False)
+    return None
+
+
+def _remember(kind: str, source_text: str, paragraphs) -> str:
+    if not learning_enabled():
+        return "\n\n".join(paragraphs)
+    key = f"{kind}:{_text_hash(source_text)}"
+    with _store_lock:
+        store = _load_store()
+        hashes = intern_paragraphs(paragraphs)
+        documents = store["documents"]
+        evicted = False
+        while key not in documents and len(documents) >= STORE_MAX_DOCUMENTS:
+            documents.pop(next(iter(documents)))
+            evicted = True
+        documents[key] = list(hashes)
+        if evicted:  # paragraphs only the evicted documents used go with them
+            referenced = {h for doc_hashes in documents.values() for h in doc_hashes}
+            stored = store["paragraphs"]
+            for h in [h for h in stored if h not in referenced]:
+                del stored[h]
+        _new["documents"][key] = list(hashes)
+        _new["paragraphs"].update((h, store["paragraphs"][h]) for h in hashes)
+        text = render_paragraphs(hashes)
+    _writer.schedule()
+    return text
+
+
+def clear_boilerplate_store(persist=False):
+    """Forget every stored paragraph (persist=True also empties the store file)."""
+    global _store, _cleared
+    with _store_lock:
+        _store = {"paragraphs": {}, "documents": {}}
+        _new["paragraphs"].clear()
+        _new["documents"].clear()
+        if persist:
+            _cleared = True
+        render_paragraphs.cache_clear()
+    if persist:
+        _writer.flush()
+
+
+# ----------------------------------------------------------------------
+# Shared helpers
+# ----------------------------------------------------------------------
+def _is_page_footer(line: str) -> bool:
+    return line.lower().startswith("page ") and line.count(" ") <= 3
+
+
+def _strip_page_footers(text: str) -> str:
+    """Page text without "Page x of y" lines, so identical terms hash identically across quotes."""
+    return "\n".join(l for l in text.splitlines() if not _is_page_footer(l.strip()))
+
+
+def reconstruct_paragraphs(terms_lines) -> list:
+    """Re-join wrapped terms lines into paragraphs (new paragraph at each known opening phrase)."""
+    paragraphs = []
+    current_paragraph = []
+    for line in terms_lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(PARAGRAPH_STARTS):
+            if current_paragraph:
+                paragraphs.append(" ".join(current_paragraph))
+            current_paragraph = [line]
+        else:
+            current_paragraph.append(line)
+    if current_paragraph:
+        paragraphs.append(" ".join(current_paragraph))
+    return paragraphs
+
+
+def _combine(paragraphs, useful_resources_lines) -> list:
+    """IBM Terms paragraphs first, then the Useful Resources section."""
+    all_content = list(paragraphs)
+    if useful_resources_lines:
+        all_content.append("")
+        all_content.extend(useful_resources_lines)
+    return all_content
+
+
+def _terms_pages_from_end(doc) -> list:
+    """
+    Texts of the pages holding the terms block, in reading order.
+    Walks back from the last page while pages are terms pages; stops once the page with
+    the terms heading has been read and the useful-resources section (if any) is covered.
+    """
+    pages = []
+    seen_heading = False
+    seen_useful = False
+    for _, page_text in iter_page_text(doc, range(len(doc) - 1, -1, -1)):
+        terms_page = is_terms_page(classify_page(page_text))
+        if seen_heading and not terms_page and USEFUL_HEADING not in page_text:
+            break
+        pages.append(page_text)
+        seen_heading = seen_heading or TERMS_HEADING in page_text
+        seen_useful = seen_useful or USEFUL_HEADING in page_text
+        if seen_heading and seen_useful:
+            break
+    pages.reverse()
+    return pages
+
+
+# ----------------------------------------------------------------------
+# Entry points
+# ----------------------------------------------------------------------
+@timed()
+@metrics.extraction("terms")
 def extract_ibm_terms_text(file_like) -> str:
-    doc = fitz.open(stream=file_like.read(), filetype="pdf")
+    with open_pdf(file_like) as doc:
+        pages = _terms_pages_from_end(doc)
+    source_text = _strip_page_footers("\n".join(pages))
+    cached = _lookup("terms", source_text)
+    if cached is not None:
+        return cached
+
     found_terms = False
     ibm_terms_lines = []
     useful_resources_lines = []
     capture_useful = False
     useful_resources_captured = False  # Track if we've already captured useful resources
-
-    for page in doc:
-        lines = (page.get_text("text") or page.get_text()).splitlines()
-        for line in lines:
+    for page_text in pages:
+        for line in page_text.splitlines():
             line = line.strip()
-            if "IBM Terms and Conditions" in line:
+            if TERMS_HEADING in line:
                 found_terms = True
                 capture_useful = False
                 continue  # skip the header itself
-            if "Useful/Important web resources:" in line and not useful_resources_captured:
+            if USEFUL_HEADING in line and not useful_resources_captured:
                 capture_useful = True
                 useful_resources_lines.append(line)
                 useful_resources_captured = True  # Mark as captured to prevent duplicates
                 continue
             if found_terms and line:
-                # Stop at page numbers or footer
-                if line.lower().startswith("page ") and line.count(" ") <= 3:
+                # Skip page numbers / footer
+                if _is_page_footer(line):
                     continue
                 ibm_terms_lines.append(line)
-            elif capture_useful and line:
+            elif capture_useful and line and not _is_page_footer(line):
                 useful_resources_lines.append(line)
 
-    # Reconstruct paragraphs as in your logic
-    reconstructed_ibm_terms = []
-    current_paragraph = []
-    for line in ibm_terms_lines:
-        if not line:
+    paragraphs = reconstruct_paragraphs(ibm_terms_lines)
+    return _remember("terms", source_text, _combine(paragraphs, useful_resources_lines))
+
+
+def extract_last_page_terms(file_like) -> str:
+    # Last page classified as terms, scanning back from the end (the last page if none is).
+    # Terms follow the line items: the scan stops at a parts / header page, and after
+    # LAST_PAGE_SCAN_MAX pages, so a quote without terms costs a few page reads, not all.
+    with open_pdf(file_like) as doc:
+        full_text = None
+        last = len(doc) - 1
+        for _, page_text in iter_page_text(doc, range(last, max(-1, last - LAST_PAGE_SCAN_MAX), -1)):
+            if full_text is None:
+                full_text = page_text
+            kinds = classify_page(page_text)
+            if is_terms_page(kinds):
+                full_text = page_text
+                break
+            if is_table_page(kinds) or PAGE_HEADER in kinds:
+                break
+    full_text = full_text or ""
+    cached = _lookup("last_page", full_text)
+    if cached is not None:
+        return cached
+
+    useful_resources_section = []
+    ibm_terms_section = []
+    capture_useful = False
+    capture_ibm_terms = False
+    for line in full_text.splitlines():
+        line = line.strip()
+
+        # Start capturing useful resources section
+        if USEFUL_HEADING in line:
+            capture_useful = True
+            useful_resources_section.append(line)
             continue
-        if (line.startswith("IBM International") or 
-            line.startswith("The quote or order") or
-            line.startswith("Unless specifically") or
-            line.startswith("The terms of the IBM") or
-            line.startswith("If you have any trouble")):
-            if current_paragraph:
-                reconstructed_ibm_terms.append(" ".join(current_paragraph))
-                current_paragraph = []
-            current_paragraph = [line]
-        else:
-            if current_paragraph:
-                current_paragraph.append(line)
-            else:
-                current_paragraph = [line]
-    if current_paragraph:
-        reconstructed_ibm_terms.append(" ".join(current_paragraph))
 
-    all_content = reconstructed_ibm_terms
-    if useful_resources_lines:
-        all_content.append("")
-        all_content.extend(useful_resources_lines)
-    return "\n\n".join(all_content)
+        # Start capturing IBM terms section
+        if TERMS_HEADING in line:
+            capture_ibm_terms = True
+            capture_useful = False  # Stop capturing useful resources
+            continue  # Skip the header itself
+
+        # Skip company header info at the top
+        if not capture_useful and not capture_ibm_terms:
+            if any(skip_pattern in line for skip_pattern in COMPANY_HEADER_LINES):
+                continue
+
+        if capture_useful and line:
+            useful_resources_section.append(line)
+
+        if capture_ibm_terms and line:
+            # Stop at page numbers
+            if _is_page_footer(line):
+                break
+            ibm_terms_section.append(line)
+
+    paragraphs = reconstruct_paragraphs(ibm_terms_section)
+    return _remember("last_page", full_text, _combine(paragraphs, useful_resources_section))
@@ -1,72 +1,25 @@
-def log_raw_pdf_lines(raw_lines, log_path="debug_full.log"):
-    """
-    Logs every line from the PDF into a separate debug file before any processing.
-    """
-    try:
-        with open(log_path, "w", encoding="utf-8") as f:
-            for i, line in enumerate(raw_lines):
-                f.write(f"Line {i}: {repr(line)}\n")
-    except Exception as e:
-        logging.error(f"Failed to write raw PDF lines to {log_path}: {e}")
 # ibm.py
 from decimal import Decimal
 import os
 import re
-import logging
 from datetime import datetime
 from io import BytesIO
 import pandas as pd
-import fitz  # PyMuPDF
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.drawing.image import Image
 from openpyxl.utils import get_column_letter
 from terms_template import get_terms_section
-
-debug_info = []
-
-def add_debug(message):
-    """Add debug info that can be displayed in Streamlit"""
-    debug_info.append(message)
-    if len(debug_info) > 300:  # Keep more debug messages
-        debug_info.pop(0)
-
-def get_debug_info():
-    """Get collected debug info"""
-    return debug_info.copy()
-
-def clear_debug():
-    """Clear debug info"""
-    debug_info.clear()
-
-# ----------------------------------------------------------------------
-# Minimal logging for Excel verification
-# ----------------------------------------------------------------------
-def setup_debug_logging():
-    """Setup minimal debug logging to debug.log file"""
-    debug_logger = logging.getLogger('ibm_debug')
-    debug_logger.setLevel(logging.INFO)  # Only INFO and above
-    
-    # Remove existing handlers
-    for handler in debug_logger.handlers[:]:
-        debug_logger.removeHandler(handler)
-    
-    # Create file handler for debug.log
-    file_handler = logging.FileHandler('debug.log', mode='w', encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
-    
-    # Create simple formatter
-    formatter = logging.Formatter('%(message)s')  # Simple format
-    file_handler.setFormatter(formatter)
-    
-    debug_logger.addHandler(file_handler)
-    return debug_logger
-
-# Initialize debug logger
-debug_logger = setup_debug_logging()
-
-# Also keep simplified logging for live environment
-logging.basicConfig(level=logging.ERROR)  # Only log errors in live
+from pdf_io import open_pdf, iter_page_text
+from tiered_extraction import accept_tier0, tier0_rows
+from page_classifier import PAGE_HEADER, classify_page, is_table_page, is_terms_only
+from extract_ibm_terms import extract_last_page_terms
+import currency_projection
+from jobs import checkpoint
+from timing import phases, span, timed
+import capture
+import metrics
+import tracing
 
 # ----------------------------------------------------------------------
 # Constants
@@ -100,25 +53,10 @@ def parse_euro_number(value: str):
     except Exception:
         return None
 
-# ----------------------------------------------------------------------
-# Debug function for data integrity
-# ----------------------------------------------------------------------
-def debug_extracted_data(extracted_data):
-    """Debug function to check data integrity"""
-    add_debug(f"[DATA DEBUG] Total extracted rows: {len(extracted_data)}")
-    for i, row in enumerate(extracted_data):
-        add_debug(f"[DATA ROW {i+1}] Length: {len(row)}, SKU: '{row[0]}', Desc: '{row[1][:30]}...'")
-        if len(row) != 7:
-            add_debug(f"[DATA ERROR] Row {i+1} has {len(row)} columns instead of 7!")
-        if not row[0]:  # Check if SKU is empty
-            add_debug(f"[DATA ERROR] Row {i+1} has empty SKU!")
-        if i == 10:  # Row 11 specifically
-            add_debug(f"[ROW 11 SPECIFIC] Full content: {row}")
-    return extracted_data
-
 # ----------------------------------------------------------------------
 # Description correction
 # ----------------------------------------------------------------------
+@timed(rows=len)
 def correct_descriptions(extracted_data, master_data=None):
     """
     Each row: [sku, desc, qty, start_date, end_date, bid_unit_svp_aed, bid_ext_svp_aed]
@@ -127,19 +65,11 @@ def correct_descriptions(extracted_data, master_data=None):
     - If master_data NOT uploaded: Set ALL descriptions to blank
     - Never use PDF descriptions
     """
-    debug_logger.info("=== DESCRIPTION CORRECTION ===")
     corrected = []
     
-    add_debug(f"[DESC CORRECTION] Starting with {len(extracted_data)} rows")
-    
-    # First debug the data before correction
-    debug_extracted_data(extracted_data)
-    
     if master_data is not None:
-        debug_logger.info(f"Using master CSV with {len(master_data)} records")
         try:
             master_map = dict(zip(master_data['SKU'], master_data['SKU DESCRIPTION']))
-            add_debug(f"[MASTER DATA] Using master CSV with {len(master_map)} SKU mappings")
             
             corrections_made = 0
             corrections_blank = 0
@@ -150,39 +80,25 @@ def correct_descriptions(extracted_data, master_data=None):
                     
                     if sku in master_map:
                         row[1] = master_map[sku]
-                        add_debug(f"[DESC FROM MASTER] Row {i+1} - SKU '{sku}': Found in master CSV")
                         corrections_made += 1
                     else:
                         row[1] = ""  # Blank if SKU not found in master
-                        add_debug(f"[DESC BLANK] Row {i+1} - SKU '{sku}' not found in master CSV")
                         corrections_blank += 1
                         
                 except Exception as e:
-                    add_debug(f"[DESC ERROR] Row {i+1} - Error: {e}")
                     row[1] = ""
                     
                 corrected.append(row)
-            
-            debug_logger.info(f"Corrections: {corrections_made} updated, {corrections_blank} blank")
                 
         except Exception as e:
-            add_debug(f"[MASTER DATA ERROR] Could not process master data: {e}")
             for row in extracted_data:
                 row[1] = ""
             corrected = extracted_data
     else:
-        add_debug(f"[NO MASTER DATA] Setting all descriptions to blank")
-        debug_logger.info("No master data - setting descriptions to blank")
         for i, row in enumerate(extracted_data):
             row[1] = ""
         corrected = extracted_data
     
-    add_debug(f"[DESC CORRECTION COMPLETE] Processed {len(corrected)} rows")
-    debug_logger.info(f"Description correction complete: {len(corrected)} rows")
-    
-    # Debug after correction
-    add_debug(f"[AFTER CORRECTION] Row 11: {corrected[10] if len(corrected) > 10 else 'N/A'}")
-    
     return corrected
 
 # ----------------------------------------------------------------------
@@ -321,44 +237,149 @@ def _extend_after_end_with_following_lines(lines, start_idx, window, max_extra_l
         ext_parts.append(" " + ln)
     return "".join(ext_parts)
 
+
+def _next_open(jump, i):
+    """
+    First line index >= i that still has untried windows. jump[p] == p for open positions,
+    p + 1 once every window at p was tried (path-compressed, so re-scans skip tried lines).
+    """
+    root = i
+    while jump[root] != root:
+        root = jump[root]
+    while jump[i] != root and i != root:
+        jump[i], i = root, jump[i]
+    return root
+
 # ----------------------------------------------------------------------
 # Core PDF extraction
 # ----------------------------------------------------------------------
+# ----------------------------------------------------------------------
+# Tier 0: words pass for pages with a regular Parts Information grid
+# ----------------------------------------------------------------------
+TEMPLATE1_TIER0_COLUMNS = {
+    "sku": ["PART NUMBER"],
+    "desc": ["DESCRIPTION"],
+    "qty": ["QUANTITY", "QTY"],
+    "start": ["COVERAGE START", "START DATE"],
+    "end": ["COVERAGE END", "END DATE"],
+    "price": ["BID EXT SVP", "BID EXTENDED"],
+}
+TEMPLATE1_TIER0_REQUIRED = ("sku", "qty", "start", "end", "price")
+
+
+def _template1_tier0_row(cells):
+    """Turn tier 0 cells into a scored row; row["row"] is the usual 7-column Template 1 row."""
+    qty_tokens = cells.get("qty", "").replace(",", "").split()
+    qty = int(qty_tokens[0]) if qty_tokens and qty_tokens[0].isdigit() else None
+    ext = parse_euro_number(cells["price"]) if cells.get("price") else None
+    if ext is not None and ext <= 10:
+        ext = None
+    row = {
+        "sku": cells["sku"],
+        "start": cells.get("start", "").replace(" ", ""),
+        "end": cells.get("end", "").replace(" ", ""),
+        "qty": qty if qty and 1 <= qty <= 999999 else None,
+        "price": ext,
+    }
+    unit = ext / row["qty"] if ext is not None and row["qty"] else None
+    row["row"] = [
+        row["sku"],
+        re.sub(r'\s+', ' ', cells.get("desc", "")).strip(),
+        row["qty"],
+        row["start"],
+        row["end"],
+        round(unit * USD_TO_AED, 2) if unit is not None else None,
+        round(ext * USD_TO_AED, 2) if ext is not None else None,
+    ]
+    return row
+
+
+@timed(rows=lambda result: len(result[0]))
+@metrics.extraction("template1")
 def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
     """
     Extracts line items and header info from an IBM Quotation PDF.
     Args:
-        file_like: PDF file stream
+        file_like: PDF memoryview/bytes, BytesIO or path (see pdf_io.open_pdf)
     Returns:
       - extracted_data: list of rows
           [sku, desc, qty, start_date, end_date, bid_unit_svp_aed, bid_ext_svp_aed]
       - header_info: dict of customer/bid metadata
     """
-    debug_logger.info("=== IBM PDF EXTRACTION STARTED ===")
-    clear_debug()  # Clear previous debug info
-    
-    # Open PDF
-    doc = fitz.open(stream=file_like.read(), filetype="pdf")
-    debug_logger.info(f"PDF: {len(doc)} pages, extracting data...")
-    
-    # Collect lines
+    with span("page_text"):
+        pages = read_template1_pages(file_like)
+    capture.note_lines("template1", pages)
+    return parse_template1_lines(pages)
+
+
+def read_template1_pages(file_like) -> dict:
+    """
+    Page pass of extract_ibm_data_from_pdf: text lines of every non-terms page, the lines left
+    for the window heuristics (with their page index) and the rows tier 0 accepted per page.
+    Returns {"lines", "item_lines", "item_line_pages", "tier0_rows": [[page, rows], ...]} -
+    plain lists, so capture.py can store them for tools/replay.py.
+    """
+    # Open PDF and collect lines (document is closed as soon as the text is read).
+    # Pure terms pages are skipped; only parts-table pages (and the header pages in front of
+    # them - the window loop's re-scan below is position dependent) are searched for line items.
+    # Parts pages that pass the tier 0 words pass keep their rows; only the lines of the
+    # remaining table pages go through the window heuristics below.
     lines = []
-    for page_num, page in enumerate(doc):
-        page_text = page.get_text("text") or page.get_text()
-        page_lines = []
-        for l in page_text.splitlines():
-            if l and l.strip():
-                lines.append(l.rstrip())
-                page_lines.append(l.rstrip())
+    item_lines = []       # lines of pages that need the window heuristics
+    item_line_pages = []  # page index of each entry in item_lines
+    tier0_by_page = {}    # page index -> rows accepted by tier 0
+    kinds = frozenset()
+    tr = tracing.current()
+    with open_pdf(file_like) as doc:
+        for page_num, page_text in iter_page_text(doc, ocr=True):
+            kinds = classify_page(page_text, kinds)
+            if tr is not None:
+                tr.event("page", extractor="template1", page=page_num + 1, kinds=sorted(kinds),
+                         terms_only=is_terms_only(kinds))
+            if is_terms_only(kinds):
+                continue
+            page_lines = [l.rstrip() for l in page_text.splitlines() if l and l.strip()]
+            lines.extend(page_lines)
+            if not (is_table_page(kinds) or PAGE_HEADER in kinds):
+                continue
+            if is_table_page(kinds) and "part number" in page_text.lower():
+                page = doc.load_page(page_num)
+                rows, score, layout = tier0_rows(page, TEMPLATE1_TIER0_COLUMNS, looks_like_valid_sku,
+                                                 _template1_tier0_row, TEMPLATE1_TIER0_REQUIRED,
+                                                 cache_namespace="template1")
+                del page
+                accepted = accept_tier0(rows, score, layout)
+                if tr is not None:
+                    tr.event("tier0", extractor="template1", page=page_num + 1, rows=len(rows),
+                             score=round(score, 3), known_layout=bool(layout and layout["known"]), accepted=accepted)
+                if accepted:
+                    tier0_by_page[page_num] = [r["row"] for r in rows]
+                    metrics.TIER_PAGES.inc(extractor="template1", tier="tier0")
+                    continue
+            if is_table_page(kinds):
+                metrics.TIER_PAGES.inc(extractor="template1", tier="window_heuristics")
+            item_lines.extend(page_lines)
+            item_line_pages.extend([page_num] * len(page_lines))
+    return {"lines": lines, "item_lines": item_lines, "item_line_pages": item_line_pages,
+            "tier0_rows": [[page_num, rows] for page_num, rows in tier0_by_page.items()]}
 
-    # Log every raw line before any processing
-    log_raw_pdf_lines(lines)
 
-    debug_logger.info(f"Total lines extracted: {len(lines)}")
-    add_debug(f"[PDF INFO] Total lines extracted: {len(lines)}")
+def parse_template1_lines(pages) -> tuple[list, dict]:
+    """
+    Header fields and line items from the page pass (read_template1_pages); needs no PDF,
+    so tools/replay.py can re-run these heuristics on captured line lists.
+    """
+    phase = phases()  # timing spans: header, window loop
+    lines = pages["lines"]
+    item_lines = pages["item_lines"]
+    item_line_pages = pages["item_line_pages"]
+    tier0_rows_by_page = pages["tier0_rows"]
+    tr = tracing.current()
+    if tr is not None and tr.raw_lines:
+        tr.event("raw_lines", extractor="template1", lines=lines)
     
     # Header fields
-    debug_logger.info("Extracting header information...")
+    phase.next("header")
     header_info = {
         "Customer Name": "",
         "Bid Number": "",
@@ -421,7 +442,6 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                     mep_value = parse_euro_number(mep_clean)
                     if mep_value:
                         header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
-                        debug_logger.info(f"MEP found in same line: '{mep_part}' -> cleaned: '{mep_clean}' -> {mep_value}")
                         header_fields_found += 1
                 elif i + 1 < len(lines):
                     next_line = lines[i + 1].strip()
@@ -430,89 +450,97 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                     mep_value = parse_euro_number(next_clean)
                     if mep_value:
                         header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
-                        debug_logger.info(f"MEP found in next line: '{next_line}' -> cleaned: '{next_clean}' -> {mep_value}")
                         header_fields_found += 1
-        # Parse header info (simple look-ahead by 1 line, with improved logic for Bid and PA Agreement Numbers)
-        header_fields_found = 0
-        for i, line in enumerate(lines):
-            if "Customer Name:" in line:
-                header_info["Customer Name"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-                header_fields_found += 1
-            if "Reseller Name:" in line:
-                header_info["Reseller Name"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-            if "Bid Number:" in line or "Quote Number:" in line:
-                header_info["Bid Number"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-      
-            if "PA Agreement Number:" in line:
-                # Accept only if next line is numeric
-                if i + 1 < len(lines):
-                    val = lines[i + 1].strip()
-                    if re.fullmatch(r"\d+", val):
-                        header_info["PA Agreement Number"] = val
-            if "PA Site Number:" in line:
-                header_info["PA Site Number"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-                header_fields_found += 1
-            if "Select Territory:" in line:
-                header_info["Select Territory"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-                header_fields_found += 1
-            if "Government Entity" in line:
-                header_info["Government Entity (GOE)"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-                header_fields_found += 1
-            if "City:" in line:
-                header_info["City"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-                header_fields_found += 1
-            if "Country:" in line:
-                header_info["Country"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-                header_fields_found += 1
-            if "Bid Expiration Date:" in line or "Quote Expiration Date:" in line:
-                header_info["Bid Expiration Date"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
-                header_fields_found += 1
-            if "Maximum End User Price" in line or "MEP" in line:
-                # Look for MEP value in same line or next line
-                if ":" in line:
-                    mep_part = line.split(":", 1)[1].strip()
-                    if mep_part:
-                        # Remove currency suffixes like "USD", "AED", etc.
-                        mep_clean = re.sub(r'\s*(USD).*$', '', mep_part).strip()
-                        # Parse European number format and convert to proper value
-                        mep_value = parse_euro_number(mep_clean)
-                        if mep_value:
-                            header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
-                            debug_logger.info(f"MEP found in same line: '{mep_part}' -> cleaned: '{mep_clean}' -> {mep_value}")
-                            header_fields_found += 1
-                    elif i + 1 < len(lines):
-                        next_line = lines[i + 1].strip()
-                        # Remove currency suffixes like "USD", "AED", etc.
-                        next_clean = re.sub(r'\s*(USD|AED|EUR).*$', '', next_line).strip()
-                        mep_value = parse_euro_number(next_clean)
-                        if mep_value:
-                            header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
-                            debug_logger.info(f"MEP found in next line: '{next_line}' -> cleaned: '{next_clean}' -> {mep_value}")
-                            header_fields_found += 1
-    
-    debug_logger.info(f"Header fields found: {header_fields_found}")
-    debug_logger.info(f"MEP extracted: '{header_info.get('Maximum End User Price (MEP)', 'Not found')}')")
-    debug_logger.info(f"Bid Expiration Date: '{header_info.get('Bid Expiration Date', 'Not found')}')")
+    # Second pass (improved Bid / PA Agreement Number logic): runs after the first one, not inside it,
+    # and overrides it wherever it finds a value
+    header_fields_found = 0
+    for i, line in enumerate(lines):
+        if "Customer Name:" in line:
+            header_info["Customer Name"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            header_fields_found += 1
+        if "Reseller Name:" in line:
+            header_info["Reseller Name"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+        if "Bid Number:" in line or "Quote Number:" in line:
+            header_info["Bid Number"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+  
+        if "PA Agreement Number:" in line:
+            # Accept only if next line is numeric
+            if i + 1 < len(lines):
+                val = lines[i + 1].strip()
+                if re.fullmatch(r"\d+", val):
+                    header_info["PA Agreement Number"] = val
+        if "PA Site Number:" in line:
+            header_info["PA Site Number"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            header_fields_found += 1
+        if "Select Territory:" in line:
+            header_info["Select Territory"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            header_fields_found += 1
+        if "Government Entity" in line:
+            header_info["Government Entity (GOE)"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            header_fields_found += 1
+        if "City:" in line:
+            header_info["City"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            header_fields_found += 1
+        if "Country:" in line:
+            header_info["Country"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            header_fields_found += 1
+        if "Bid Expiration Date:" in line or "Quote Expiration Date:" in line:
+            header_info["Bid Expiration Date"] = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            header_fields_found += 1
+        if "Maximum End User Price" in line or "MEP" in line:
+            # Look for MEP value in same line or next line
+            if ":" in line:
+                mep_part = line.split(":", 1)[1].strip()
+                if mep_part:
+                    # Remove currency suffixes like "USD", "AED", etc.
+                    mep_clean = re.sub(r'\s*(USD).*$', '', mep_part).strip()
+                    # Parse European number format and convert to proper value
+                    mep_value = parse_euro_number(mep_clean)
+                    if mep_value:
+                        header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
+                        header_fields_found += 1
+                elif i + 1 < len(lines):
+                    next_line = lines[i + 1].strip()
+                    # Remove currency suffixes like "USD", "AED", etc.
+                    next_clean = re.sub(r'\s*(USD|AED|EUR).*$', '', next_line).strip()
+                    mep_value = parse_euro_number(next_clean)
+                    if mep_value:
+                        header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
+                        header_fields_found += 1
+    if tr is not None:
+        tr.event("header", extractor="template1", fields={k: v for k, v in header_info.items() if v})
 
     # === Line Item Extraction ===
     # ...existing line item extraction code continues here...
+    phase.next("window_loop")
 
     # === Line Item Extraction ===
-    debug_logger.info("Extracting line items...")
     extracted_data = []
+    row_pages = []  # page index of each heuristic row, to merge with tier 0 rows in page order
+    lines = item_lines  # header parsing above used every page; items only need the non-tier-0 pages
     i = 0
     max_window = 12  # Try wider chunks first to capture wrapped rows
     processed_positions = set()  # Track processed line positions to avoid duplicates
-    
-    add_debug(f"[EXTRACTION START] Beginning extraction from {len(lines)} lines")
+    # A window's outcome depends only on its lines and processed_positions, and trying it either
+    # rejects it or adds its SKU position: a window tried once is skipped ever after. Keep the
+    # largest untried window per line and jump over fully tried lines, so the re-scans after each
+    # row (below) cost nothing and every window is analysed once - linear in the number of lines.
+    next_window = [min(max_window, len(lines) - p) for p in range(len(lines))]
+    jump = list(range(len(lines) + 1))
     
     while i < len(lines):
+        i = _next_open(jump, i)
+        if i >= len(lines):
+            break
+        checkpoint()  # per row: stop here if the job was superseded
         matched = False
+        row_page = item_line_pages[i]
         
         # Prefer larger chunks first (helps capture qty + amounts in one chunk)
-        for window in range(max_window, 0, -1):
-            if i + window > len(lines):
-                continue
+        for window in range(next_window[i], 0, -1):
+            next_window[i] = window - 1
+            if next_window[i] == 0:
+                jump[i] = i + 1
             chunk_lines = lines[i:i + window]
             chunk = " | ".join(chunk_lines)
             
@@ -529,8 +557,9 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
             # ENHANCED SKU identification - look for the ACTUAL SKU, not serial numbers
             sku = None
             desc_start_index = None
-            
-            add_debug(f"[CHUNK ANALYSIS] Lines {i}-{i+window}: {[line.strip() for line in chunk_lines]}")
+            if tr is not None:
+                tr.event("chunk", extractor="template1", start=i, window=window, page=row_page + 1,
+                         lines=[line.strip() for line in chunk_lines])
             
             # Strategy: Find all valid SKUs, then pick the one that's NOT a serial number
             valid_skus_found = []
@@ -547,11 +576,9 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                     if looks_like_valid_sku(candidate):
                         # Additional check: reject obvious serial numbers
                         if candidate.startswith('IE') and len(candidate) > 8:
-                            add_debug(f"[SKU REJECT] Serial number: '{candidate}' in line {line_idx}")
                             continue
                         
                         valid_skus_found.append((candidate, line_idx, line))
-                        add_debug(f"[SKU CANDIDATE] Found '{candidate}' in line {line_idx}: '{line}'")
 
             # Pick the BEST SKU (prefer shorter, IBM-style part numbers)
             if valid_skus_found:
@@ -565,16 +592,21 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                 best_sku_info = sorted(valid_skus_found, key=sku_priority)[0]
                 sku, sku_line_idx, _ = best_sku_info
                 desc_start_index = sku_line_idx + 1  # Description starts after SKU line
-                add_debug(f"[SKU SELECTED] Best SKU: '{sku}' from {len(valid_skus_found)} candidates")
+                if tr is not None:
+                    tr.event("sku", extractor="template1", start=i, window=window, sku=sku, line=sku_line_idx,
+                             candidates=[c for c, _, _ in valid_skus_found])
                     
             else:
-                add_debug(f"[SKU NOT FOUND] No valid SKUs in chunk lines {i}-{i+window}")
+                if tr is not None:
+                    tr.event("skip", extractor="template1", start=i, window=window, reason="no valid SKU")
                 continue
 
             # Additional validation: Avoid processing same SKU position multiple times 
             sku_position_key = f"{i + sku_line_idx}_{sku}"  # Use SKU line position + SKU name
             if sku_position_key in processed_positions:
-                add_debug(f"[POSITION SKIP] Already processed SKU '{sku}' at position {i + sku_line_idx}")
+                if tr is not None:
+                    tr.event("skip", extractor="template1", start=i, window=window, sku=sku,
+                             reason="SKU position already processed")
                 continue
             processed_positions.add(sku_position_key)
             
@@ -586,6 +618,9 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                 if money_with_sep_re.search(window_text):
                     near_money = True
             if not near_money:
+                if tr is not None:
+                    tr.event("skip", extractor="template1", start=i, window=window, sku=sku,
+                             reason="no money token near the start date")
                 continue
             
             # Enhanced description extraction with cleaning
@@ -607,7 +642,6 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                 # Remove any remaining pipe characters and clean up
                 desc = re.sub(r'\s*\|\s*', ' ', desc)
                 desc = re.sub(r'\s+', ' ', desc).strip()
-                add_debug(f"[DESC CLEANED] SKU '{sku}': '{desc[:50]}...'")
             else:
                 # Fallback description extraction
                 pos_sku = chunk.find(sku)
@@ -615,7 +649,6 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                 desc = chunk[pos_sku + len(sku):pos_date0].strip() if pos_sku >= 0 and pos_date0 > pos_sku else ""
                 desc = re.sub(r'\s*\|\s*', ' ', desc)
                 desc = re.sub(r'\s+', ' ', desc).strip()
-                add_debug(f"[DESC FALLBACK] SKU '{sku}': '{desc[:50]}...'")
             
             # ---- Robust Qty inference (ANY value) ----
             chunk_flat = " ".join(chunk_lines)
@@ -627,16 +660,7 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
             
             # 1) First pass qty + tokens
             qty, prorate, money_tokens = infer_qty_and_prorate(after_end, abs_tol=0.02)
-            
-            # Show raw PDF content for debugging
-            debug_logger.info(f"=== RAW PDF CONTENT FOR SKU {sku} ===")
-            debug_logger.info(f"Chunk lines from PDF:")
-            for idx, line in enumerate(chunk_lines):
-                debug_logger.info(f"  Line {idx}: '{line.strip()}'")
-            debug_logger.info(f"Money tokens found: {money_tokens}")
-            debug_logger.info(f"Date range: {start_date} to {end_date}")
-            debug_logger.info("=" * 50)
-            add_debug(f"[QTY] sku={sku} qty={qty}, money_tokens={len(money_tokens)}")
+            qty_rule = None if qty is None else "money tokens"
             
             # 2) If we didn't get all money tokens, extend with a few following lines
             if len(money_tokens) < 5:
@@ -646,15 +670,9 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                     # keep first valid qty but prefer longer token list
                     if qty is None and qty2 is not None:
                         qty, prorate = qty2, prorate2
+                        qty_rule = "money tokens with following lines"
                     if len(money_tokens2) > len(money_tokens):
                         money_tokens = money_tokens2
-                        add_debug(f"[EXTENDED] Extended tokens for sku={sku}: {len(money_tokens)} tokens")
-            
-            
-            
-                        # Replace the fallback quantity detection section around line 395-405:
-            
-                        # Replace the fallback quantity detection:
             
             if qty is None:
                 # Strategy 1: Look for decimal quantities FIRST (like 1.780)
@@ -667,7 +685,7 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                             decimal_qty = float(line)
                             if 0.1 <= decimal_qty <= 100:  # Allow up to 100.999 (becomes 100,999)
                                 qty = int(decimal_qty * 1000)  # 1.780 * 1000 = 1780
-                                add_debug(f"[DECIMAL QTY] sku={sku} converted {line} to {qty} (x1000) at position {line_idx}")
+                                qty_rule = "decimal line x1000"
                                 break
                         except ValueError:
                             continue
@@ -676,7 +694,7 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                         comma_qty = int(line.replace(',', ''))
                         if 1 <= comma_qty <= 100000:
                             qty = comma_qty
-                            add_debug(f"[COMMA QTY] sku={sku} converted {line} to {qty} at position {line_idx}")
+                            qty_rule = "thousands separator line"
                             break
                 
                 # Strategy 2: Only use first line if no decimal found
@@ -684,37 +702,35 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                     first_line = chunk_lines[0].strip()
                     if first_line.isdigit() and 1 <= int(first_line) <= 100000:
                         qty = int(first_line)
-                        add_debug(f"[FALLBACK QTY] sku={sku} using first line qty={qty}")
+                        qty_rule = "first line"
+            if tr is not None:
+                tr.event("qty", extractor="template1", start=i, sku=sku, qty=qty, rule=qty_rule, prorate=prorate,
+                         money_tokens=money_tokens)
             
             if qty is None or not (1 <= qty <= 999999):
-                add_debug(f"[QTY INVALID] sku={sku} invalid qty={qty}")
+                if tr is not None:
+                    tr.event("skip", extractor="template1", start=i, window=window, sku=sku, reason="invalid quantity")
                 continue
             
             # ---- Extract Standard/List Price instead of Bid Price ----
             bid_unit_svp = None
             bid_ext_svp = None
+            price_rule = None
             try:
                 # Strategy: Look for the highest value in money_tokens as it's likely the Standard Price
                 if len(money_tokens) >= 1:
-                    debug_logger.info(f"=== PRICE ANALYSIS FOR SKU {sku} ===")
-                    debug_logger.info(f"All money tokens from PDF: {money_tokens}")
                     
                     # Parse all money values and find the Standard Price (usually the highest unit price)
                     parsed_values = []
-                    for i, token in enumerate(money_tokens):
+                    for token_idx, token in enumerate(money_tokens):  # not `i`: that is the row cursor
                         try:
                             value = parse_euro_number(token)
                             if value and value > 0:
-                                parsed_values.append((value, i, token))
-                                debug_logger.info(f"  Token {i}: '{token}' = {value}")
+                                parsed_values.append((value, token_idx, token))
                         except:
-                            debug_logger.info(f"  Token {i}: '{token}' = PARSE ERROR")
                             continue
                     
                     if parsed_values:
-                        debug_logger.info(f"All parsed values:")
-                        for val, idx, token in parsed_values:
-                            debug_logger.info(f"  Position {idx}: '{token}' = {val}")
                         
                         # Strategy: Extract both unit cost and extended cost from positions 4 & 5
                         cost_value = None
@@ -727,21 +743,19 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                             if idx == 4:  # Extended cost is typically at position 4
                                 ext_cost_value = val
                                 ext_cost_token = token
-                                debug_logger.info(f"FOUND EXTENDED COST: Position 4 '{token}' = {val}")
                             elif idx == 5:  # Unit cost at position 5
                                 cost_value = val
                                 cost_token = token
-                                debug_logger.info(f"FOUND UNIT COST: Position 5 '{token}' = {val}")
                         
                         # Use extended cost if found, otherwise fallback logic
                         if ext_cost_value is not None and ext_cost_value > 10:  # Allow smaller extended costs
                             bid_unit_svp = cost_value if cost_value and cost_value > 100 else ext_cost_value / qty if qty > 0 else ext_cost_value
                             bid_ext_svp = ext_cost_value
-                            debug_logger.info(f"USING EXTENDED COST: Unit={bid_unit_svp}, Extended={bid_ext_svp}")
+                            price_rule = "extended cost (token 4)"
                         elif cost_value is not None and cost_value > 100:
                             bid_unit_svp = cost_value
                             bid_ext_svp = cost_value * qty if qty else cost_value
-                            debug_logger.info(f"USING UNIT COST: Unit={bid_unit_svp}, Extended={bid_ext_svp}")
+                            price_rule = "unit cost (token 5)"
                         else:
                             # Fallback to highest reasonable value
                             reasonable_values = [x for x in parsed_values if x[0] > 1000]
@@ -749,33 +763,31 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
                                 reasonable_values.sort(key=lambda x: x[0], reverse=True)
                                 fallback_value = reasonable_values[0][0]
                                 fallback_token = reasonable_values[0][2]
-                                debug_logger.info(f"FALLBACK TO HIGHEST REASONABLE: '{fallback_token}' = {fallback_value}")
                                 bid_unit_svp = fallback_value
                                 bid_ext_svp = fallback_value * qty if qty else fallback_value
+                                price_rule = "highest value over 1000"
                             else:
                                 # Last resort: use highest value regardless
                                 parsed_values.sort(key=lambda x: x[0], reverse=True)
                                 fallback_value = parsed_values[0][0]
                                 fallback_token = parsed_values[0][2]
-                                debug_logger.info(f"FALLBACK TO HIGHEST: '{fallback_token}' = {fallback_value}")
                                 bid_unit_svp = fallback_value
                                 bid_ext_svp = fallback_value * qty if qty else fallback_value
-                        
-                        debug_logger.info(f"SELECTED: Using Extended={bid_ext_svp}, Unit={bid_unit_svp}")
-                        debug_logger.info(f"FINAL: Unit={bid_unit_svp}, Total={bid_ext_svp}")
-                        debug_logger.info("=" * 50)
-                        
-                        add_debug(f"[COST PRICE] SKU '{sku}' - Unit={bid_unit_svp}, Extended={bid_ext_svp}")
+                                price_rule = "highest value"
                     
                 if bid_unit_svp is None and len(money_tokens) >= 5:
                     # Fallback to original logic if Standard Price detection fails
                     bid_unit_svp = parse_euro_number(money_tokens[3])
                     bid_ext_svp  = parse_euro_number(money_tokens[4])
-                    debug_logger.info(f"FALLBACK: Using tokens[3]={money_tokens[3]} -> {bid_unit_svp}")
-                    add_debug(f"[FALLBACK PRICE] SKU '{sku}' - BidUnit={bid_unit_svp}, BidExt={bid_ext_svp}")
+                    price_rule = "tokens 3 and 4"
+                if tr is not None:
+                    tr.event("price", extractor="template1", start=i, sku=sku, unit=bid_unit_svp, extended=bid_ext_svp,
+                             rule=price_rule)
                     
             except Exception as e:
-                add_debug(f"[PRICE ERROR] sku={sku} err={e}")
+                if tr is not None:
+                    tr.event("price", extractor="template1", start=i, sku=sku, unit=bid_unit_svp, extended=bid_ext_svp,
+                             rule=price_rule, error=str(e))
             
             # Convert to AED
             bid_unit_svp_aed = round(bid_unit_svp * USD_TO_AED, 2) if bid_unit_svp is not None else None
@@ -785,124 +797,41 @@ def extract_ibm_data_from_pdf(file_like) -> tuple[list, dict]:
             desc = re.sub(r'\s{2,}', ' ', desc).strip()
             
             extracted_data.append([sku, desc, qty, start_date, end_date, bid_unit_svp_aed, bid_ext_svp_aed])
-            i += window
+            row_pages.append(row_page)
+            if tr is not None:
+                tr.event("row", extractor="template1", row=len(extracted_data), start=i, window=window,
+                         page=row_page + 1, values=extracted_data[-1])
+            # Resume near the top, not after this row: re-scanning picks up rows an earlier match jumped
+            # over (appended in the order found). Tried windows are skipped, so this is cheap.
+            i = (len(money_tokens) - 1 if money_tokens else i) + window
             matched = True
-            add_debug(f"[ROW EXTRACTED] Row {len(extracted_data)}: SKU='{sku}', Qty={qty}")
             break  # break window loop
         if not matched:
             i += 1
-    
-    add_debug(f"[EXTRACTION COMPLETE] Total rows extracted: {len(extracted_data)}")
-    debug_logger.info(f"=== EXTRACTION COMPLETE ===")
-    debug_logger.info(f"Total line items: {len(extracted_data)}")
-    
-    # Log summary for Excel verification
-    if extracted_data:
-        total_value = sum(row[6] for row in extracted_data if len(row) > 6 and row[6])
-        debug_logger.info(f"Total quotation value: AED {total_value:,.2f}")
-        debug_logger.info("=== FINAL EXCEL DATA ===")
-        for i, row in enumerate(extracted_data, 1):
-            if len(row) >= 7:
-                debug_logger.info(f"Row {i}: {row[0]} | Qty: {row[2]} | Unit: AED {row[5]:.2f} | Total: AED {row[6]:.2f}")
-    
+    phase.count(rows=len(extracted_data))
+    phase.end()
+
+    if tier0_rows_by_page:
+        # Merge tier 0 pages back in page order (each page came from exactly one tier)
+        merged = [(p, r) for p, r in zip(row_pages, extracted_data)]
+        merged += [(p, r) for p, rows in tier0_rows_by_page for r in rows]
+        merged.sort(key=lambda pr: pr[0])
+        extracted_data = [r for _, r in merged]
+
     return extracted_data, header_info
 
 # ----------------------------------------------------------------------
 # Extract last page text (for "IBM Terms" sheet)
 # ----------------------------------------------------------------------
 def extract_last_page_text(file_like) -> str:
-    doc = fitz.open(stream=file_like.read(), filetype="pdf")
-    last_page = doc[-1]
-    full_text = last_page.get_text("text") or last_page.get_text()
-    
-    # Filter to extract IBM terms content
-    lines = full_text.splitlines()
-    
-    # First, collect the "Useful/Important web resources" section if it appears before IBM Terms
-    useful_resources_section = []
-    ibm_terms_section = []
-    
-    # Split into sections
-    capture_useful = False
-    capture_ibm_terms = False
-    
-    for line in lines:
-        line = line.strip()
-        
-        # Start capturing useful resources section
-        if "Useful/Important web resources:" in line:
-            capture_useful = True
-            useful_resources_section.append(line)
-            continue
-            
-        # Start capturing IBM terms section
-        if "IBM Terms and Conditions" in line:
-            capture_ibm_terms = True
-            capture_useful = False  # Stop capturing useful resources
-            continue  # Skip the header itself
-            
-        # Skip company header info at the top
-        if not capture_useful and not capture_ibm_terms:
-            if any(skip_pattern in line for skip_pattern in ["IBM Ireland Product", "VAT: Reg", "Building", "Mulhuddart", "Dublin"]):
-                continue
-                
-        # Capture useful resources content
-        if capture_useful and line:
-            useful_resources_section.append(line)
-            
-        # Capture IBM terms content  
-        if capture_ibm_terms and line:
-            # Stop at page numbers
-            if line.lower().startswith("page ") and line.count(" ") <= 3:
-                break
-            ibm_terms_section.append(line)
-    
-    # Now reconstruct the IBM terms section into proper paragraphs
-    reconstructed_ibm_terms = []
-    current_paragraph = []
-    
-    for line in ibm_terms_section:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Check if this line starts a new section/paragraph
-        if (line.startswith("IBM International") or 
-            line.startswith("The quote or order") or
-            line.startswith("Unless specifically") or
-            line.startswith("The terms of the IBM") or
-            line.startswith("If you have any trouble")):
-            
-            # Save previous paragraph if exists
-            if current_paragraph:
-                reconstructed_ibm_terms.append(" ".join(current_paragraph))
-                current_paragraph = []
-            
-            # Start new paragraph
-            current_paragraph = [line]
-        else:
-            # Continue current paragraph
-            if current_paragraph:
-                current_paragraph.append(line)
-            else:
-                current_paragraph = [line]
-    
-    # Add the last paragraph
-    if current_paragraph:
-        reconstructed_ibm_terms.append(" ".join(current_paragraph))
-    
-    # Combine sections: IBM Terms first, then Useful Resources at the end
-    all_content = reconstructed_ibm_terms
-    if useful_resources_section:
-        all_content.append("")  # Add spacing
-        all_content.extend(useful_resources_section)
-    
-    result = "\n\n".join(all_content)  # Use double newlines for paragraph separation
-    return result
+    """Terms text of the last terms page (see extract_ibm_terms.extract_last_page_terms)."""
+    return extract_last_page_terms(file_like)
 
 # ----------------------------------------------------------------------
 # Excel creation with enhanced debugging
 # ----------------------------------------------------------------------
+@timed()
+@metrics.render("create_styled_excel")
 def create_styled_excel(
     data: list,
     header_info: dict,
@@ -915,8 +844,6 @@ def create_styled_excel(
     Template 1 ONLY Excel generation
     data rows: [SKU, Product Description, Quantity, Start Date, End Date, Unit Price AED, Total Price AED]
     """
-    add_debug(f"[TEMPLATE1 EXCEL] Creating Template 1 Excel with {len(data)} rows")
-    
     wb = Workbook()
     ws = wb.active
     ws.title = "Quotation"
@@ -1025,9 +952,6 @@ def create_styled_excel(
     for idx, row in enumerate(data, start=1):
         excel_row = start_row + idx - 1
         
-        # Debug: Show what we're processing
-        add_debug(f"[EXCEL WRITE] Processing row {idx}: SKU={row[0]}, Desc={row[1][:30]}...")
-        
         # Serial number in column B (2)
         cell_sl = ws.cell(row=excel_row, column=2, value=idx)
         cell_sl.font = Font(size=11, color="1F497D")
@@ -1052,20 +976,6 @@ def create_styled_excel(
         total_price_aed = cost_usd * USD_TO_AED if cost_usd else 0  # Total Price = Extended Cost × conversion
         unit_price_aed = total_price_aed / qty if qty and qty > 0 else 0  # Unit Price = Total / Quantity
         
-        # LIVE DEBUG: Cost column calculation
-        print(f"🔍 ROW {idx} DEBUG:")
-        print(f"   SKU: {sku}")
-        print(f"   Quantity: {qty}")
-        print(f"   bid_unit_svp_aed (Unit AED): {bid_unit_svp_aed}")
-        print(f"   bid_ext_svp_aed (Ext AED): {bid_ext_svp_aed}")
-        print(f"   bid_ext_svp (Ext USD): {bid_ext_svp}")
-        print(f"   cost_usd (Extended Cost): {cost_usd}")
-        print(f"   total_price_aed (ext cost × 3.6725): {total_price_aed}")
-        print(f"   unit_price_aed (total / qty): {unit_price_aed}")
-        print("---")
-        
-        # Also add to debug log
-        add_debug(f"[COST DEBUG] Row {idx}: qty={qty}, cost_usd={cost_usd}, total_price_aed={total_price_aed}, unit_price_aed={unit_price_aed}")
         # Write first 7 columns with actual values (C through I)
         excel_data = [sku, desc, qty, start_date, end_date, unit_price_aed, cost_usd]
         
@@ -1312,12 +1222,14 @@ def create_styled_excel(
     # Remove fixed scale - let fitToWidth handle scaling automatically
     ws.sheet_properties.pageSetUpPr.fitToPage = True  # Enable fit-to-page
     
-    add_debug(f"[TEMPLATE1 COMPLETE] Saved Template 1 Excel with {len(data)} data rows")
-    wb.save(output)
+    with span("wb.save"):
+        wb.save(output)
 
 # ----------------------------------------------------------------------
 # Template 2 Specific Excel Creation - 8 Column Layout
 # ----------------------------------------------------------------------
+@timed()
+@metrics.render("create_styled_excel_template2")
 def create_styled_excel_template2(
     data: list,
     header_info: dict,
@@ -1332,18 +1244,8 @@ def create_styled_excel_template2(
     data rows: [sku, desc, qty, duration, start_date, end_date, bid_unit_aed, bid_total_aed, partner_price_aed]
     country: UAE -> AED (3.6725); Qatar -> USD (1.0, same as Template 1); KSA -> SAR (3.75)
     """
-    c = (country or "").strip().upper()
-    if c == "KSA":
-        currency_label = "SAR"
-        usd_to_local = 3.75
-    elif c == "QATAR":
-        currency_label = "USD"
-        usd_to_local = 1.0
-    else:
-        currency_label = "AED"
-        usd_to_local = 3.6725
-    add_debug(f"[TEMPLATE2 EXCEL] Creating Template 2 Excel with {len(data)} rows - 8 COLUMNS ONLY")
-    print(f"🔥 TEMPLATE 2 FUNCTION CALLED! Creating {len(data)} rows with 8 columns only!")
+    currency_label = currency_projection.currency_label(country)
+    usd_to_local = currency_projection.usd_to_local_rate(country)
     
     wb = Workbook()
     ws = wb.active
@@ -1449,7 +1351,6 @@ def create_styled_excel_template2(
     
     for idx, row in enumerate(data, start=1):
         excel_row = start_row + idx - 1
-        add_debug(f"[TEMPLATE2 ROW] Processing row {idx}: SKU={row[0]}")
         
         # Serial number (column B)
         cell_sl = ws.cell(row=excel_row, column=2, value=idx)
@@ -1488,7 +1389,6 @@ def create_styled_excel_template2(
         # H (cost) = Extracted USD value
         cost_formula = f"={extracted_total_usd}"
         ws.cell(row=excel_row, column=8, value=cost_formula)  # Column H
-        add_debug(f"[TEMPLATE2 FORMULA] Cost (USD): {cost_formula}")
         
         # G (Unit Price AED) - special handling for cases with no "Bid Total Commit Value"
         # If total_price is 0, use the extracted unit_price directly (from Bid Unit Price column)
@@ -1496,31 +1396,25 @@ def create_styled_excel_template2(
         if bid_total_aed_extracted == 0 and bid_unit_aed > 0:
             # No "Bid Total Commit Value" column - use extracted unit price directly
             unit_price_formula = f"={bid_unit_aed}"
-            add_debug(f"[TEMPLATE2 FORMULA] Unit Price AED: {unit_price_formula} (from extracted Bid Unit Price)")
         elif qty and qty > 0:
             # Normal case - calculate unit price from total
             unit_price_formula = f"=I{excel_row}/E{excel_row}"
-            add_debug(f"[TEMPLATE2 FORMULA] Unit Price AED: {unit_price_formula}")
         else:
             unit_price_formula = f"=I{excel_row}"
-            add_debug(f"[TEMPLATE2 FORMULA] Unit Price AED: {unit_price_formula}")
         
         ws.cell(row=excel_row, column=7, value=unit_price_formula)  # Column G
         
         # I (Total Price in local currency) = Cost in USD * rate
         total_price_aed_formula = f"=H{excel_row}*{usd_to_local}"
         ws.cell(row=excel_row, column=9, value=total_price_aed_formula)  # Column I
-        add_debug(f"[TEMPLATE2 FORMULA] Total Price in AED: {total_price_aed_formula}")
         
         # J (Partner disc) = ROUNDUP(Unit Price * 0.99, 2)
         partner_disc_formula = f"=ROUNDUP(G{excel_row}*0.99,2)"
         ws.cell(row=excel_row, column=10, value=partner_disc_formula)  # Column J
-        add_debug(f"[TEMPLATE2 FORMULA] Partner disc: {partner_disc_formula}")
         
         # K (Partner Price in AED) = Partner disc * Quantity
         partner_price_formula = f"=J{excel_row}*E{excel_row}"
         ws.cell(row=excel_row, column=11, value=partner_price_formula)  # Column K
-        add_debug(f"[TEMPLATE2 FORMULA] Partner Price in AED: {partner_price_formula}")
         
         # Special formatting for description (column D) - left align and wrap
         ws.cell(row=excel_row, column=4).alignment = Alignment(wrap_text=True, horizontal="left", vertical="center")
@@ -1705,11 +1599,6 @@ def create_styled_excel_template2(
     ws.page_setup.paperSize = ws.PAPERSIZE_A4
     ws.sheet_properties.pageSetUpPr.fitToPage = True
     
-    add_debug(f"[TEMPLATE2 COMPLETE] Saved Template 2 Excel with {len(data)} data rows - 10 COLUMNS ONLY")
-    wb.save(output)
-
+    with span("wb.save"):
+        wb.save(output)
 
-# Function to get debug info for Streamlit display
-def get_extraction_debug():
-    """Get debug info for display in Streamlit"""
-    return get_debug_info()
\ No newline at end of file
@@ -1,98 +1,47 @@
 # extractors/ibm_template2.py
-import fitz
 import re
 from datetime import datetime
 import logging
+import os
 from pathlib import Path
 from io import BytesIO
 from terms_template import get_terms_section
+from pdf_io import open_pdf, iter_page_text, register_cache
+from page_classifier import classify_page, is_table_page, is_terms_only
+from jobs import checkpoint
+from timing import phases, span, timed
+import capture
+import metrics
+import tracing
+from currency_projection import PRICING_FROM_TABLE, PRICING_FROM_TOTAL, USD_TO_AED, project_template2_items
 
-# Configure detailed logging for template 2
-log_file_path = 'template2_extraction_debug.log'
-
-# Clear existing handlers to avoid duplicates
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
-
-# Create file handler with UTF-8 encoding
-file_handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8')
-file_handler.setLevel(logging.DEBUG)
-
-# Create console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-
-# Create formatter
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
-
-# Configure logger
+# Detailed Template 2 log (template2_extraction_debug.log + console), only with
+# MINDTOOL_TEMPLATE2_DEBUG=1; otherwise records go to the application's logging setup
+TEMPLATE2_DEBUG = os.environ.get("MINDTOOL_TEMPLATE2_DEBUG", "0") == "1"
 logger = logging.getLogger('ibm_template2')
-logger.setLevel(logging.DEBUG)
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
 
-# Prevent propagation to avoid duplicate messages
-logger.propagate = False
+if TEMPLATE2_DEBUG:
+    log_file_path = 'template2_extraction_debug.log'
 
-# Use the same debug system as ibm.py
-debug_info = []
+    # Create file handler with UTF-8 encoding (opened on the first record, not at import)
+    file_handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8', delay=True)
+    file_handler.setLevel(logging.DEBUG)
 
-# Constants: conversion rate and currency by country
-USD_TO_AED = 3.6725  # UAE
-USD_TO_SAR = 3.75    # KSA
-# Qatar Template 2: keep USD (rate 1), same as Template 1 Qatar
+    # Create console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.DEBUG)
 
-def _usd_to_local_rate(country: str):
-    c = (country or "").strip().upper()
-    if c == "KSA":
-        return USD_TO_SAR
-    if c == "QATAR":
-        return 1.0  # no conversion, keep USD
-    return USD_TO_AED
+    # Create formatter
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
 
-def add_debug(message):
-    """Add debug info to both in-memory list and log file"""
-    debug_info.append(message)
-    logger.debug(message)
-    
-    # Also write directly to file to ensure it's saved
-    try:
-        with open('template2_extraction_debug.log', 'a', encoding='utf-8') as f:
-            f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - DEBUG - {message}\n")
-            f.flush()
-    except Exception as e:
-        print(f"Warning: Could not write to log file: {e}")
-    
-    if len(debug_info) > 500:
-        debug_info.pop(0)
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
 
-def get_extraction_debug():
-    """Get collected debug info"""
-    return debug_info.copy()
-
-def clear_debug():
-    """Clear debug info and prepare log file"""
-    debug_info.clear()
-    # Clear the log file for fresh start
-    try:
-        with open('template2_extraction_debug.log', 'w', encoding='utf-8') as f:
-            f.write(f"=== TEMPLATE 2 EXTRACTION LOG - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
-    except Exception as e:
-        print(f"Warning: Could not clear log file: {e}")
-
-def save_debug_to_file():
-    """Save all debug messages to file"""
-    try:
-        with open('template2_extraction_debug.log', 'w', encoding='utf-8') as f:
-            f.write(f"=== TEMPLATE 2 EXTRACTION LOG - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
-            for message in debug_info:
-                f.write(f"{message}\n")
-            f.flush()
-        logger.info(f"Debug log saved to template2_extraction_debug.log with {len(debug_info)} messages")
-    except Exception as e:
-        logger.error(f"Failed to save debug log: {e}")
+    # Prevent propagation to avoid duplicate messages
+    logger.propagate = False
 
 def parse_number(value: str):
     """Parse numbers with various formats (including European: 107.856,00 or 1.550)"""
@@ -132,46 +81,75 @@ def parse_quantity(value: str):
 def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[list, dict]:
     """
     Extract data from IBM Template 2 (Software as a Service / Subscription format)
-    country: UAE, Qatar -> AED (3.6725); KSA -> SAR (3.75)
-    Returns: (extracted_data, header_info)
+    country: UAE -> AED (3.6725); Qatar -> USD (1.0); KSA -> SAR (3.75)
+    Returns: (extracted_data, header_info) with rows
+    [sku, desc, qty, duration, start_date, end_date, unit_local, total_local, partner_local]
     """
-    clear_debug()
-    usd_to_local = _usd_to_local_rate(country)
-    
-    try:
-        add_debug("="*80)
-        add_debug("STARTING TEMPLATE 2 EXTRACTION")
-        add_debug("="*80)
-        logger.info("Template 2 extraction started")
-    except Exception as e:
-        print(f"Error in initial logging: {e}")
+    items, header_info = extract_ibm_template2_items(file_like)
+    return project_template2_items(items, country), header_info
+
+
+@timed(rows=lambda result: len(result[0]))
+@metrics.extraction("template2")
+def extract_ibm_template2_items(file_like) -> tuple[list, dict]:
+    """
+    Country-independent Template 2 extraction.
+    Returns: (items, header_info); items are canonical USD line items (dicts), projected
+    per country by currency_projection.project_template2_items.
+    """
+    logger.info("Template 2 extraction started")
+    pages = read_template2_pages(file_like)
+    if pages is None:
         return [], {}
-    
+    capture.note_lines("template2", pages)
+    return parse_template2_lines(pages)
+
+
+@timed()
+def read_template2_pages(file_like):
+    """
+    Page pass of extract_ibm_template2_items: text lines of every non-terms page and of the
+    table pages. Returns {"lines", "item_lines"} (plain lists, see capture.py), or None if the
+    PDF cannot be read.
+    """
+    # Collect text (document is closed as soon as the text is read).
+    # Pure terms pages are skipped; only SaaS / parts pages are searched for line items.
+    lines = []       # header fields
+    item_lines = []  # line-item engine
+    tr = tracing.current()
     try:
-        doc = fitz.open(stream=file_like.read(), filetype="pdf")
-        add_debug(f"PDF opened successfully: {len(doc)} pages")
+        with open_pdf(file_like) as doc:
+            kinds = frozenset()
+            for page_num, page_text in iter_page_text(doc, ocr=True):
+                kinds = classify_page(page_text, kinds)
+                if tr is not None:
+                    tr.event("page", extractor="template2", page=page_num + 1, kinds=sorted(kinds),
+                             terms_only=is_terms_only(kinds))
+                if is_terms_only(kinds):
+                    continue
+                page_lines = [line.strip() for line in page_text.splitlines() if line and line.strip()]
+                lines.extend(page_lines)
+                if is_table_page(kinds):
+                    item_lines.extend(page_lines)
     except Exception as e:
-        add_debug(f"ERROR opening PDF: {e}")
         logger.error(f"PDF opening failed: {e}")
-        return [], {}
-    
-    # Collect all text
-    lines = []
-    for page_num, page in enumerate(doc):
-        page_text = page.get_text("text") or page.get_text()
-        page_lines = []
-        for line in page_text.splitlines():
-            if line and line.strip():
-                lines.append(line.strip())
-                page_lines.append(line.strip())
-        add_debug(f"Page {page_num + 1}: Extracted {len(page_lines)} lines")
-    
-    add_debug(f"\n[TOTAL LINES] Extracted {len(lines)} non-empty lines from PDF")
-    add_debug("\n" + "="*80)
-    add_debug("RAW TEXT DUMP (First 100 lines)")
-    add_debug("="*80)
-    for idx, line in enumerate(lines[:100]):
-        add_debug(f"Line {idx:3d}: {line}")
+        return None
+    return {"lines": lines, "item_lines": item_lines}
+
+
+@timed(rows=lambda result: len(result[0]))
+def parse_template2_lines(pages) -> tuple[list, dict]:
+    """
+    Header fields and line items from the page pass (read_template2_pages); needs no PDF,
+    so tools/replay.py can re-run these heuristics on captured line lists.
+    """
+    phase = phases()  # timing spans: header, line items
+    lines = pages["lines"]
+    item_lines = pages["item_lines"]
+    tr = tracing.current()
+    if tr is not None and tr.raw_lines:
+        tr.event("raw_lines", extractor="template2", lines=lines)
+    phase.next("header")
     
     # Header info extraction
     header_info = {
@@ -217,7 +195,6 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                 after_colon = line.split(":", 1)[1].strip().lower()
                 if after_colon in ["yes", "no"]:
                     # This is just a yes/no field, skip it - the actual value will be on another line
-                    add_debug(f"[MEP] Skipping MEP question line (yes/no): {line}")
                     continue
             
             # Look for MEP value in same line or next line
@@ -227,8 +204,6 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                 if mep_part and mep_part.lower() not in ["yes", "no"]:
                     mep_clean = re.sub(r'\s*(USD|AED|EUR).*$', '', mep_part).strip()
                     mep_value = parse_number(mep_clean)
-                    if mep_value:
-                        add_debug(f"[MEP] Found MEP value on same line: {mep_value}")
             
             # If not found in same line, check next line
             if not mep_value and i + 1 < len(lines):
@@ -236,12 +211,9 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                 if "USD" in next_line or "," in next_line:
                     mep_clean = re.sub(r'\s*(USD|AED|EUR).*$', '', next_line).strip()
                     mep_value = parse_number(mep_clean)
-                    if mep_value:
-                        add_debug(f"[MEP] Found MEP value on next line: {mep_value}")
             
             if mep_value:
                 header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
-                add_debug(f"[MEP] MEP set to: {mep_value:,.2f}")
         elif "IBM Opportunity Number:" in line:
             # Extract the opportunity number from the same or next line
             # Look for pattern after the colon - alphanumeric with mixed case
@@ -257,53 +229,33 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
             
             if opp_match:
                 header_info["IBM Opportunity Number"] = opp_match.group()
-                add_debug(f"[HEADER] IBM Opportunity Number: {opp_match.group()}")
-    
-    add_debug("\n" + "="*80)
-    add_debug("HEADER INFORMATION EXTRACTED")
-    add_debug("="*80)
-    for key, value in header_info.items():
-        add_debug(f"{key:30s}: {value}")
-    add_debug("="*80 + "\n")
     
     # Fallback: If MEP still not found, search for "Maximum End User Price" pattern with value on next line
     if not header_info.get("Maximum End User Price (MEP)"):
-        add_debug("[MEP FALLBACK] MEP not found in main loop, searching entire header...")
         for i, line in enumerate(lines):
             if ("Maximum End User Price" in line or "MEP" in line) and i + 1 < len(lines):
                 next_line = lines[i + 1].strip()
-                add_debug(f"[MEP FALLBACK] Found MEP-like line at index {i}: '{line}'")
-                add_debug(f"[MEP FALLBACK] Next line {i+1}: '{next_line}'")
                 # Check if next line contains USD amount or is a number
                 if "USD" in next_line or "," in next_line or any(c.isdigit() for c in next_line):
                     mep_clean = re.sub(r'\s*(USD|AED|EUR).*$', '', next_line).strip()
-                    add_debug(f"[MEP FALLBACK] Cleaned value: '{mep_clean}'")
                     mep_value = parse_number(mep_clean)
-                    add_debug(f"[MEP FALLBACK] Parsed number: {mep_value}")
                     if mep_value:
                         header_info["Maximum End User Price (MEP)"] = f"{mep_value:,.2f}"
-                        add_debug(f"[MEP FALLBACK SUCCESS] MEP set to: {mep_value:,.2f}")
                         break
-                else:
-                    add_debug(f"[MEP FALLBACK] Next line doesn't look like a price, skipping")
+    if tr is not None:
+        tr.event("header", extractor="template2", fields={k: v for k, v in header_info.items() if v})
     
-    # Extract line items (Subscription Parts)
+    # Extract line items (Subscription Parts) - table pages only
+    phase.next("line_items")
+    lines = item_lines
     extracted_data = []
     global_channel_discount = 0.08  # Track the channel discount globally
     
-    add_debug("\n" + "="*80)
-    add_debug("STARTING LINE ITEM EXTRACTION")
-    add_debug("="*80)
-    
     # Pattern for subscription part numbers (like D1009ZX, D100AZX, D28B4LL)
     subscription_part_re = re.compile(r'\b[A-Z][A-Z0-9]{4,8}\b')  # More flexible: 1 letter + 4-8 alphanumeric chars
     date_pattern = re.compile(r'\b\d{2}-[A-Za-z]{3}-\d{4}\b')
     
-    add_debug(f"Subscription Part Pattern: {subscription_part_re.pattern}")
-    add_debug(f"Date Pattern: {date_pattern.pattern}")
-    
     # PRE-SCAN: Detect if this is a multi-row case (e.g., rows 001-006)
-    add_debug("\n[PRE-SCAN] Checking for multi-row table case...")
     # Match row markers even when the PDF extractor puts the whole row on one line
     # Examples it should match: "001", "001 170 1-12 ...", "004 50 1-36 ..."
     table_row_pattern = re.compile(r'^(0\d{2})\b')
@@ -313,13 +265,16 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
             table_row_count += 1
     
     is_multi_row_case = table_row_count >= 2
-    add_debug(f"[PRE-SCAN] Table row markers found: {table_row_count}")
-    add_debug(f"[PRE-SCAN] Multi-row case detected: {is_multi_row_case}")
+    # Positions of each (stripped) line, for the line item lookups below instead of a scan per SKU
+    line_positions = {}
+    for j, line in enumerate(lines):
+        line_positions.setdefault(line.strip(), []).append(j)
     
     # Look for "Software as a Service" sections
     i = 0
     line_item_count = 0
     while i < len(lines):
+        checkpoint()  # per row: stop here if the job was superseded
         line = lines[i]
         
         # Check if we're in a service section
@@ -332,35 +287,33 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
         if (is_subscription_part or is_overage_part) and not is_multi_row_case:
             try:
                 line_item_count += 1
-                add_debug(f"\n{'='*60}")
-                add_debug(f"LINE ITEM #{line_item_count} - Found at line index {i}")
-                add_debug(f"{'='*60}")
-                add_debug(f"Trigger line: {line}")
                 
                 # Determine part type
                 part_type = "Overage" if is_overage_part else "Subscription"
-                add_debug(f"Part Type: {part_type}")
+                if tr is not None:
+                    tr.event("chunk", extractor="template2", strategy="service block", start=i, part_type=part_type,
+                             line=line)
                 
                 # Extract SKU from current or next line
                 sku = None
                 sku_match = subscription_part_re.search(line)
                 if sku_match:
                     sku = sku_match.group()
-                    add_debug(f"✓ SKU found in trigger line: {sku}")
                 elif i + 1 < len(lines):
                     sku_match = subscription_part_re.search(lines[i + 1])
                     if sku_match:
                         sku = sku_match.group()
-                        add_debug(f"✓ SKU found in next line: {sku} (from: {lines[i+1]})")
                 
                 if not sku:
-                    add_debug("✗ No SKU found - skipping this entry")
+                    if tr is not None:
+                        tr.event("skip", extractor="template2", start=i, reason="no part number")
                     i += 1
                     continue
+                if tr is not None:
+                    tr.event("sku", extractor="template2", start=i, sku=sku, part_type=part_type)
                 
                 # Extract service description (capture full block of information)
                 desc_lines = []
-                add_debug(f"\n[DESCRIPTION] Searching lines {max(0, i-15)} to {min(i+10, len(lines))} for full service block:")
                 
                 # First, find the main IBM service line (going backwards) - look for product/service description
                 service_line_idx = None
@@ -372,19 +325,16 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                         # Exclude generic company/distributor lines
                         if not any(x in line_text for x in ['Building', 'Industrial Park', 'Campus', 'Dublin', 'Ireland']):
                             service_line_idx = j
-                            add_debug(f"  Found service line at line {j}: {line_text}")
                             break
                 
                 if service_line_idx is not None:
                     # Collect the full service block from service line through additional billing details
                     # Extend search to include lines after the part line for billing info
                     end_range = min(i + 15, len(lines))  # Look 15 lines after part line
-                    add_debug(f"  Collecting service block from line {service_line_idx} to {end_range}:")
                     
                     for j in range(service_line_idx, end_range):
                         line_text = lines[j].strip()
                         if line_text:  # Non-empty lines
-                            add_debug(f"    Processing line {j}: '{line_text}'")
                             
                             # Exclude unwanted lines - check for exact matches and partial matches
                             exclude_patterns = [
@@ -400,7 +350,6 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                             for excl in exclude_patterns:
                                 if excl.lower() in line_text.lower():
                                     should_exclude = True
-                                    add_debug(f"    Line {j}: EXCLUDED - contains '{excl}'")
                                     break
                             
                             if should_exclude:
@@ -414,65 +363,46 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                 'Corresponding Subscription Part#', 'Overage Part#:'  # Removed 'Subscription Part#:'
                             ]):
                                 desc_lines.append(line_text)
-                                add_debug(f"    Line {j}: INCLUDED - {line_text}")
                             # Stop if we hit another service or a new major section
                             elif line_text.startswith('IBM') and j > i + 5:
-                                add_debug(f"    Stopping at line {j}: Next service section detected")
                                 break
                 
                 # Join all lines with newlines to form complete description
                 desc = '\n'.join(desc_lines) if desc_lines else ""
                 
-                if desc:
-                    add_debug(f"✓ Full service block extracted ({len(desc_lines)} lines)")
-                    add_debug(f"Complete description:")
-                    add_debug(f"    {desc}")
-                else:
+                if not desc:
                     # Fallback: Just get the IBM service name
                     for j in range(max(0, i - 10), i):
                         line_text = lines[j].strip()
                         if line_text.startswith('IBM') and len(line_text) > 15:
                             desc = line_text
-                            add_debug(f"✓ Fallback single-line description: {desc}")
                             break
                     
                     if not desc:
                         desc = f"IBM Service - {part_type} Part"
-                        add_debug(f"✗ No description found, using default: {desc}")
                 
                 # Extract start date (Projected Service Start Date)
                 start_date = ""
-                add_debug(f"\n[START DATE] Searching lines {max(0, i-5)} to {min(i+5, len(lines))}:")
                 for j in range(max(0, i - 5), min(i + 5, len(lines))):
                     if 'Start Date:' in lines[j] or 'start date' in lines[j].lower():
-                        add_debug(f"  Line {j} (Match!): {lines[j]}")
                         date_match = date_pattern.search(lines[j])
                         if date_match:
                             start_date = date_match.group()
-                            add_debug(f"✓ Start date found in same line: {start_date}")
                         elif j + 1 < len(lines):
                             date_match = date_pattern.search(lines[j + 1])
                             if date_match:
                                 start_date = date_match.group()
-                                add_debug(f"✓ Start date found in next line: {start_date}")
                         break
-                if not start_date:
-                    add_debug("✗ No start date found")
                 
                 # Extract subscription length to calculate end date
                 end_date = ""
                 subscription_length = 12  # Default
-                add_debug(f"\n[SUBSCRIPTION LENGTH] Searching lines {i} to {min(i+20, len(lines))}:")
                 for j in range(i, min(i + 20, len(lines))):
                     if 'Subscription Length:' in lines[j] or 'subscription length' in lines[j].lower():
-                        add_debug(f"  Line {j} (Match!): {lines[j]}")
                         length_match = re.search(r'(\d+)\s*Months?', lines[j], re.I)
                         if length_match:
                             subscription_length = int(length_match.group(1))
-                            add_debug(f"✓ Subscription length found: {subscription_length} months")
                         break
-                if subscription_length == 12:
-                    add_debug("  Using default: 12 months")
                 
                 # Calculate end date if we have start date
                 if start_date:
@@ -482,21 +412,16 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                         start_dt = datetime.strptime(start_date, '%d-%b-%Y')
                         end_dt = start_dt + relativedelta(months=subscription_length)
                         end_date = end_dt.strftime('%d-%b-%Y')
-                        add_debug(f"✓ End date calculated: {start_date} + {subscription_length} months = {end_date}")
                     except Exception as e:
                         end_date = ""
-                        add_debug(f"✗ Error calculating end date: {e}")
-                else:
-                    add_debug("✗ Cannot calculate end date - no start date")
                 
                 # Extract quantity (look for table data and line item mapping)
                 qty = 1  # Fallback default
-                add_debug(f"\n[QUANTITY] Searching for quantity data for SKU {sku}:")
+                qty_rule = "default"
                 
                 # Strategy 1: Look for large quantities first (for D100AZX type SKUs)
                 found_qty = False
                 if 'D100AZX' in sku:
-                    add_debug(f"  Looking for large quantity for D100AZX:")
                     # Search a wider range for large quantities like 672
                     for j in range(max(0, i - 50), min(i + 100, len(lines))):
                         line_text = lines[j].strip()
@@ -504,7 +429,7 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                         potential_qty = parse_quantity(line_text)
                         if potential_qty and 50 <= potential_qty <= 1000:  # Reasonable range for bulk quantities
                             qty = potential_qty
-                            add_debug(f"✓ Large quantity found for D100AZX at line {j}: {qty}")
+                            qty_rule = "bulk quantity near D100AZX"
                             found_qty = True
                             break
                 
@@ -519,64 +444,51 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                             distance_to_sku = abs(j - i)
                             if distance_to_sku < 50:  # Within reasonable distance
                                 line_item_number = line_text
-                                add_debug(f"  Found line item number {line_item_number} at line {j} (distance: {distance_to_sku})")
                                 break
                     
                     # Strategy 3: Extract quantity from table structure
                     if line_item_number:
-                        add_debug(f"  Looking for table data for line item {line_item_number}:")
-                        
                         # Search globally for our line item number and its table data
-                        for j in range(len(lines)):
-                            line_text = lines[j].strip()
-                            
-                            # If we find our line item number, the next few lines should contain table data
-                            if line_text == line_item_number:
-                                add_debug(f"    Found line item {line_item_number} at line {j}")
-                                # Look at the next several lines for quantity
-                                for k in range(j + 1, min(j + 15, len(lines))):
-                                    qty_text = lines[k].strip()
-                                    add_debug(f"    Line {k}: '{qty_text}'")
-                                    
-                                    # Look for quantity (numeric value, not decimal prices)
-                                    potential_qty = parse_quantity(qty_text)
-                                    if potential_qty and potential_qty >= 1 and potential_qty <= 10000:
-                                        # Avoid line item numbers like 001, 002, 003
-                                        if not (potential_qty <= 3 and len(qty_text) == 1):
-                                            qty = potential_qty
-                                            add_debug(f"✓ Quantity found for line item {line_item_number}: {qty}")
-                                            found_qty = True
-                                            break
-                                        elif potential_qty <= 10 and k <= j + 3:
-                                            # Small quantities are valid if they appear early
-                                            qty = potential_qty
-                                            add_debug(f"✓ Small quantity found for line item {line_item_number}: {qty}")
-                                            found_qty = True
-                                            break
-                                if found_qty:
-                                    break
+                        for j in line_positions.get(line_item_number, []):
+                            # Where we find our line item number, the next few lines should contain table data
+                            # Look at the next several lines for quantity
+                            for k in range(j + 1, min(j + 15, len(lines))):
+                                qty_text = lines[k].strip()
+                                
+                                # Look for quantity (numeric value, not decimal prices)
+                                potential_qty = parse_quantity(qty_text)
+                                if potential_qty and potential_qty >= 1 and potential_qty <= 10000:
+                                    # Avoid line item numbers like 001, 002, 003
+                                    if not (potential_qty <= 3 and len(qty_text) == 1):
+                                        qty = potential_qty
+                                        qty_rule = f"line item {line_item_number} table row"
+                                        found_qty = True
+                                        break
+                                    elif potential_qty <= 10 and k <= j + 3:
+                                        # Small quantities are valid if they appear early
+                                        qty = potential_qty
+                                        qty_rule = f"line item {line_item_number} table row (small)"
+                                        found_qty = True
+                                        break
+                            if found_qty:
+                                break
                     
                     # Strategy 4: If no table mapping, look for nearby quantities
                     if not found_qty:
-                        add_debug(f"  No line item/table data found, searching for nearby quantities:")
                         for j in range(max(0, i - 10), min(i + 30, len(lines))):
                             line_text = lines[j].strip()
                             potential_qty = parse_quantity(line_text)
                             # Avoid obvious line item numbers
                             if potential_qty and 1 <= potential_qty <= 10000 and str(potential_qty) not in ['001', '002', '003']:
                                 qty = potential_qty
-                                add_debug(f"✓ Nearby quantity found at line {j}: {qty}")
+                                qty_rule = "nearby line"
                                 found_qty = True
                                 break
-                
-                if not found_qty:
-                    add_debug(f"  No quantity found, using fallback: {qty}")
-                
-                add_debug(f"✓ Final quantity for {sku}: {qty}")
+                if tr is not None:
+                    tr.event("qty", extractor="template2", start=i, sku=sku, qty=qty, rule=qty_rule)
                 
                 # Extract duration (look for patterns like "1-12")
                 duration = None
-                add_debug(f"\n[DURATION] Searching for duration pattern for SKU {sku}:")
                 
                 # Look for duration patterns in nearby lines
                 for j in range(max(0, i - 20), min(i + 50, len(lines))):
@@ -589,24 +501,14 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                         # Validate it looks like a duration (reasonable range)
                         if 1 <= start_month <= end_month <= 24:
                             duration = f"{start_month}-{end_month}"
-                            add_debug(f"✓ Duration found at line {j}: '{duration}'")
-                            add_debug(f"  Source line: {line_text.strip()}")
                             break
                 
-                if not duration:
-                    add_debug("✗ No duration pattern found")
-                else:
-                    add_debug(f"✓ Final duration for {sku}: {duration}")
-                
                 # Extract pricing from table rows AND summary sections
                 bid_unit_price = None
                 bid_total_price = None
-                
-                add_debug(f"\n[PRICING] Searching for price data for SKU {sku}:")
+                price_rule = None
                 
                 # Strategy 1: Look for line-item specific prices in table format
-                add_debug(f"  Strategy 1: Looking for line-item table prices around lines {i}-{min(i+35, len(lines))}:")
-                
                 for j in range(max(0, i-10), min(i + 35, len(lines))):
                     line_text = lines[j]
                     
@@ -615,8 +517,6 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                     
                     # Also look for specific table patterns with line item numbers
                     if re.match(r'^\s*00[1-9]', line_text):  # Line starts with 001, 002, etc.
-                        add_debug(f"    Line {j}: Found line item row: {line_text[:100]}")
-                        
                         # Collect all price values from the next 10 lines after finding the row number
                         all_prices = []
                         for k in range(j+1, min(j+12, len(lines))):
@@ -627,10 +527,8 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                 # Clean USD suffix and add to collection
                                 clean_prices = [p.replace(' USD', '').strip() for p in found_prices]
                                 all_prices.extend(clean_prices)
-                                add_debug(f"             Line {k}: {price_line.strip()} -> {clean_prices}")
                         
                         if len(all_prices) >= 1:
-                            add_debug(f"             All collected prices: {all_prices}")
                             try:
                                 # For Template 2, we need to identify the "Bid Total Commit Value" column
                                 # Based on your PDF table structure, this is typically the 7th-8th price value
@@ -643,21 +541,16 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                     # Based on PDF table structure, "Bid Total Commit Value" is typically
                                     # around position 6-7 in the price sequence
                                     
-                                    add_debug(f"             Price candidates: {total_price_candidates}")
-                                    
                                     # Strategy: Look for the 4th position (index 3) for "Bid Total Commit Value"
                                     if len(total_price_candidates) >= 4:
                                         # Use 4th position (index 3) as it's typically "Bid Total Commit Value" 
                                         total_str = total_price_candidates[3]
-                                        add_debug(f"             Selected position 4 (index 3): {total_str}")
                                     elif len(total_price_candidates) >= 2:
                                         # Use 2nd position for shorter sequences
                                         total_str = total_price_candidates[1]
-                                        add_debug(f"             Selected position 2: {total_str}")
                                     else:
                                         # Only one price available
                                         total_str = total_price_candidates[0]
-                                        add_debug(f"             Selected only available: {total_str}")
                                     
                                     def parse_european_price(price_str):
                                         """Convert European format like 107.856,00 to float"""
@@ -674,25 +567,20 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                     # All prices are 0,00 - this is valid pricing
                                     total_str = all_prices[0].replace(',', '.')
                                     total_val = float(total_str)
-                                    add_debug(f"             All prices are zero - using: {total_str}")
                                 
                                 # Unit price calculation
                                 unit_val = total_val / qty if qty > 0 else total_val
                                 
                                 bid_unit_price = unit_val
                                 bid_total_price = total_val
-                                add_debug(f"✓ LINE-ITEM PRICES FOUND at line {j}: Unit=${bid_unit_price}, Total=${bid_total_price}")
-                                add_debug(f"  Selected from candidates: {total_price_candidates} -> {total_str}")
+                                price_rule = f"line item row at line {j}: total {total_str}"
                                 break
                                 
                             except Exception as e:
-                                add_debug(f"             ✗ Error parsing table row: {e}")
                                 continue
                     
                     # Original logic for lines with multiple price matches
                     elif len(price_matches) >= 2:
-                        add_debug(f"    Line {j}: Found {len(price_matches)} price values: {price_matches}")
-                        add_debug(f"             Full line: {line_text[:100]}")
                         try:
                             # Usually: [...other values...] [unit_price] [total_price] USD
                             unit_str = price_matches[-2].replace(',', '.')
@@ -701,37 +589,26 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                             unit_val = float(unit_str)
                             total_val = float(total_str)
                             
-                            add_debug(f"             Parsed: unit={unit_val}, total={total_val}")
-                            add_debug(f"             Validation: total ({total_val}) vs unit*qty ({unit_val * qty}) = diff {abs(total_val - (unit_val * qty))}")
-                            
                             # Validate that total ≈ unit * qty
                             if abs(total_val - (unit_val * qty)) < 1.0:
                                 bid_unit_price = unit_val
                                 bid_total_price = total_val
-                                add_debug(f"✓ LINE-ITEM PRICES FOUND at line {j}: Unit=${bid_unit_price}, Total=${bid_total_price}")
+                                price_rule = f"unit x qty = total at line {j}"
                                 break
-                            else:
-                                add_debug(f"             ✗ Validation failed - looking for better match...")
                         except Exception as e:
-                            add_debug(f"             ✗ Error parsing: {e}")
                             continue
                 
                 # Strategy 2: Calculate unit price if we have total but not unit
                 if bid_total_price and not bid_unit_price and qty > 0:
                     bid_unit_price = bid_total_price / qty
-                    add_debug(f"✓ CALCULATED Unit Price: ${bid_unit_price} = ${bid_total_price} / {qty}")
                 
                 # No fallback - if table prices not found, leave blank
-                if not bid_total_price:
-                    add_debug("✗ No line-item pricing found - leaving prices blank")
+                if tr is not None:
+                    tr.event("price", extractor="template2", start=i, sku=sku, unit=bid_unit_price,
+                             extended=bid_total_price, rule=price_rule)
                 
-                # Convert USD to AED - Total Price first, then Unit Price from Total
-                bid_total_aed = round(bid_total_price * usd_to_local, 2) if bid_total_price else None
-                bid_unit_aed = round(bid_total_aed / qty, 2) if bid_total_aed and qty > 0 else bid_total_aed
-                
-                # Calculate Partner Price in AED using Channel Discount
-                # Formula: ROUNDUP(Unit Price AED * (1 - Channel Discount%), 2) * Qty
-                partner_price_aed = None
+                # Partner Price is derived from the Channel Discount at projection time
+                # (currency_projection): ROUNDUP(Unit Price local * (1 - Channel Discount%), 2) * Qty
                 channel_discount_pct = 0.08  # Default 8%, will extract from PDF
                 
                 # Try to extract Channel Discount from nearby lines
@@ -742,58 +619,28 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                         discount_value = int(discount_match.group(1))
                         channel_discount_pct = discount_value / 100.0
                         global_channel_discount = channel_discount_pct  # Update global value
-                        add_debug(f"  Found Channel Discount: {discount_value}% = {channel_discount_pct}")
                         break
                 
-                if bid_unit_aed is not None and qty:
-                    # Partner unit price with discount applied and rounded up
-                    partner_unit_discounted = bid_unit_aed * (1 - channel_discount_pct)
-                    import math
-                    partner_unit_rounded = math.ceil(partner_unit_discounted * 100) / 100  # ROUNDUP to 2 decimals
-                    partner_price_aed = round(partner_unit_rounded * qty, 2)
-                    add_debug(f"  Partner Price: Unit AED {bid_unit_aed} × (1-{channel_discount_pct}) = {partner_unit_discounted}")
-                    add_debug(f"  Partner Price: ROUNDUP({partner_unit_discounted}, 2) = {partner_unit_rounded}")
-                    add_debug(f"  Partner Price: {partner_unit_rounded} × {qty} = AED {partner_price_aed}")
-                
-                add_debug(f"\n[CURRENCY CONVERSION] USD to local (rate: {usd_to_local}):")
-                add_debug(f"  Total: ${bid_total_price} → AED {bid_total_aed}")
-                add_debug(f"  Unit: AED {bid_total_aed} ÷ {qty} → AED {bid_unit_aed}")
-                add_debug(f"  Partner: AED {partner_price_aed} (with {channel_discount_pct*100}% discount)")
-                
-                # Add to extracted data
-                # Format: [sku, desc, qty, duration, start_date, end_date, bid_unit_aed, bid_total_aed, partner_price_aed]
-                row_data = [
-                    sku,
-                    desc,
-                    qty,
-                    duration,
-                    start_date,
-                    end_date,
-                    bid_unit_aed,
-                    bid_total_aed,
-                    partner_price_aed
-                ]
-                extracted_data.append(row_data)
-                
-                add_debug(f"\n{'='*60}")
-                add_debug(f"✓ LINE ITEM #{line_item_count} COMPLETE")
-                add_debug(f"{'='*60}")
-                add_debug(f"  SKU: {sku}")
-                add_debug(f"  Description (full):")
-                add_debug(f"    {desc}")
-                add_debug(f"  Quantity: {qty}")
-                add_debug(f"  Start Date: {start_date}")
-                add_debug(f"  End Date: {end_date}")
-                add_debug(f"  Unit Price (AED): {bid_unit_aed}")
-                add_debug(f"  Total Price (AED): {bid_total_aed}")
-                add_debug(f"{'='*60}\n")
+                # Add to extracted data (canonical USD line item; see currency_projection)
+                extracted_data.append({
+                    "sku": sku,
+                    "desc": desc,
+                    "qty": qty,
+                    "duration": duration,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "unit_usd": bid_unit_price,
+                    "total_usd": bid_total_price,
+                    "partner_usd": None,
+                    "channel_discount": channel_discount_pct,
+                    "pricing": PRICING_FROM_TOTAL,
+                })
+                if tr is not None:
+                    tr.event("row", extractor="template2", row=len(extracted_data), start=i, values=extracted_data[-1])
                 
             except Exception as e:
-                add_debug(f"\n✗✗✗ ERROR in line item {line_item_count} ✗✗✗")
-                add_debug(f"Exception: {str(e)}")
-                import traceback
-                add_debug(f"Traceback:\n{traceback.format_exc()}")
-                add_debug(f"{'='*60}\n")
+                if tr is not None:
+                    tr.event("skip", extractor="template2", start=i, sku=sku, reason=f"error: {e}")
         
         # STRATEGY 2: Extract from table rows (001, 002, 003, etc.) if multi-row case
         if is_multi_row_case:
@@ -805,7 +652,9 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
             if row_match:
                 try:
                     row_marker = row_match.group(1)
-                    add_debug(f"\n[STRATEGY 2] Processing table row: {row_marker} (raw: {line_stripped})")
+                    if tr is not None:
+                        tr.event("chunk", extractor="template2", strategy="table row", start=i, row_marker=row_marker,
+                                 line=line_stripped)
                     
                     # Check if "Quantity" column exists by searching backwards for column headers
                     has_quantity_column = False
@@ -813,11 +662,11 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                         header_line = lines[j].lower()
                         if 'quantity' in header_line:
                             has_quantity_column = True
-                            add_debug(f"  ℹ️ Quantity column detected in header (line {j})")
                             break
                     
                     # Extract quantity (prefer from the same row line, fallback to next line)
                     qty = 1
+                    qty_rule = "default" if has_quantity_column else "default (no Quantity column)"
                     if has_quantity_column:
                         # Try to parse quantity from the row itself when values are on the same line
                         tokens = re.split(r'\s+', line_stripped)
@@ -829,33 +678,25 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                 break
                         if parsed_from_row is not None:
                             qty = parsed_from_row
-                            add_debug(f"  ✓ Quantity parsed from row line: {qty}")
+                            qty_rule = "row line"
                         elif i + 1 < len(lines):
                             qty_line = lines[i + 1].strip()
-                            add_debug(f"  Qty line: '{qty_line}'")
                             
                             parsed_qty = parse_quantity(qty_line)
                             if parsed_qty is not None:
                                 qty = parsed_qty
-                                add_debug(f"  ✓ Quantity parsed: {qty}")
-                            else:
-                                add_debug(f"  ⚠️ Invalid quantity format '{qty_line}' - using default qty=1")
-                    elif not has_quantity_column:
-                        add_debug(f"  ⚠️ No Quantity column found - using default qty=1")
+                                qty_rule = "line after the row marker"
                     
                     # Extract duration (e.g., "1-12" or "13-24")
                     duration = "1-12"
                     duration_match = re.search(r'(\d+)-(\d+)', line_stripped)
                     if duration_match:
                         duration = f"{duration_match.group(1)}-{duration_match.group(2)}"
-                        add_debug(f"  ✓ Duration extracted from row line: {duration}")
                     elif i + 2 < len(lines):
                         duration_line = lines[i + 2].strip()
-                        add_debug(f"  Duration line: '{duration_line}'")
                         duration_match = re.search(r'(\d+)-(\d+)', duration_line)
                         if duration_match:
                             duration = f"{duration_match.group(1)}-{duration_match.group(2)}"
-                            add_debug(f"  ✓ Duration extracted: {duration}")
                     
                     # --- For each table row: prefer the label from the block ABOVE this row (backwards-only search) ---
                     sku_table = None
@@ -874,7 +715,6 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                             m = subscription_part_re.search(lines[j])
                             if m:
                                 sku_table = m.group()
-                                add_debug(f"  ✓ Overage Part SKU used for this row (backward/nearest-above): {sku_table}")
                             break
                     
                     # 1) If no overage SKU found, look BACKWARDS for a TRUE 'Subscription Part#:' (exclude 'Corresponding...')
@@ -884,7 +724,6 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                 sub_m = subscription_part_re.search(lines[j])
                                 if sub_m:
                                     sku_table = sub_m.group()
-                                    add_debug(f"  ✓ Subscription Part SKU used for this row (backward/nearest-above): {sku_table}")
                                     break
                     
                     # 2) If this row belongs to an overage block, capture its Corresponding Subscription Part (optional, only for description)
@@ -896,31 +735,34 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                     corresponding_part = match.group(1)
                                 else:
                                     corresponding_part = lines[j].split(':', 1)[-1].strip()
-                                add_debug(f"[LOGIC][STRATEGY2] Appending Corresponding Subscription Part to description: {corresponding_part}")
                                 break
                     
                     if not sku_table:
-                        add_debug(f"  ✗ No SKU found for table row {line_stripped}")
+                        if tr is not None:
+                            tr.event("skip", extractor="template2", start=i, row_marker=row_marker,
+                                     reason="no part number above the row")
                         i += 1
                         continue
+                    if tr is not None:
+                        tr.event("sku", extractor="template2", start=i, sku=sku_table,
+                                 part_type="Overage" if overage_part_line is not None else "Subscription")
+                        tr.event("qty", extractor="template2", start=i, sku=sku_table, qty=qty, rule=qty_rule)
                     
                     # Extract description using SAME LOGIC as Strategy 1 (but only once per SKU with caching)
-                    if not hasattr(extract_ibm_template2_from_pdf, '_desc_cache'):
-                        extract_ibm_template2_from_pdf._desc_cache = {}
+                    if not hasattr(extract_ibm_template2_items, '_desc_cache'):
+                        extract_ibm_template2_items._desc_cache = {}
                     
-                    desc_cache = extract_ibm_template2_from_pdf._desc_cache
+                    desc_cache = extract_ibm_template2_items._desc_cache
                     
                     if sku_table not in desc_cache:
                         # Extract description using Strategy 1 logic
                         desc_lines = []
-                        add_debug(f"  [DESC] Extracting description for {sku_table}...")
                         
                         # Find where the SKU was mentioned (subscription part line)
                         sku_line_idx = None
                         for j in range(i - 1, max(0, i - 100), -1):
                             if 'Subscription Part#:' in lines[j] or 'Overage Part#:' in lines[j]:
                                 sku_line_idx = j
-                                add_debug(f"    Found subscription part line at line {j}")
                                 break
                         
                         if sku_line_idx is None:
@@ -934,19 +776,16 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                 # Exclude generic company/distributor lines and opportunity numbers
                                 if not any(x in line_text for x in ['Building', 'Industrial Park', 'Campus', 'Dublin', 'Ireland', 'Opportunity Number']):
                                     service_line_idx = j
-                                    add_debug(f"    Found service line at line {j}: {line_text}")
                                     break
                         
                         if service_line_idx is not None:
                             # Collect the full service block from service line THROUGH billing/renewal details
                             # Go 15-20 lines after the subscription part line to capture all details
                             end_range = min(sku_line_idx + 20, len(lines))
-                            add_debug(f"    Collecting service block from line {service_line_idx} to {end_range}:")
                             
                             for j in range(service_line_idx, end_range):
                                 line_text = lines[j].strip()
                                 if line_text:  # Non-empty lines
-                                    add_debug(f"    Processing line {j}: '{line_text}'")
                                     
                                     # Exclude unwanted lines - check for exact matches and partial matches
                                     exclude_patterns = [
@@ -962,7 +801,6 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                     for excl in exclude_patterns:
                                         if excl.lower() in line_text.lower():
                                             should_exclude = True
-                                            add_debug(f"    Line {j}: EXCLUDED - contains '{excl}'")
                                             break
                                     
                                     if should_exclude:
@@ -976,24 +814,16 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                         'Corresponding Subscription Part#', 'Overage Part#:', 'Quote Rate:', 'Committed Term:'
                                     ]):
                                         desc_lines.append(line_text)
-                                        add_debug(f"    Line {j}: INCLUDED - {line_text}")
                                     # Stop if we hit the table headers (Item, Quantity, etc.)
                                     elif re.match(r'^(Item|Line|Qty|Quantity|SI|Customer|Entitled|Months|Discount|Quote)\s*$', line_text, re.I):
-                                        add_debug(f"      Stopping at line {j}: Table header detected")
                                         break
                         
                         # Join all lines with newlines to form complete description
                         full_desc = '\n'.join(desc_lines) if desc_lines else ""
                         
-                        if full_desc:
-                            add_debug(f"    ✓ Description extracted ({len(desc_lines)} lines)")
-                        else:
-                            add_debug(f"    ✗ No description found")
-                        
                         desc_cache[sku_table] = full_desc
                     
                     desc_table = desc_cache[sku_table]
-                    add_debug(f"  ✓ Using cached description for {sku_table}")
                     
                     # Extract pricing using SAME LOGIC as Strategy 1
                     # First, check which table layout we're in by searching backwards for column headers
@@ -1004,18 +834,16 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                         header_line = lines[j].lower()
                         if 'bid total commit value' in header_line or 'total commit value' in header_line:
                             has_bid_total_commit = True
-                            add_debug(f"  ℹ️ 'Bid Total Commit Value' column detected in header (line {j})")
                             break
                         if 'bid extended monthly rate' in header_line:
                             has_bid_extended_monthly = True
                         if 'partner bid extended monthly rate' in header_line:
                             has_partner_bid_extended_monthly = True
                     
-                    unit_price_aed = 0
-                    total_price_aed = 0
-                    partner_price_aed_extracted = None
-                    
-                    add_debug(f"  [PRICING] Searching lines {i+1} to {min(i+15, len(lines))} for prices (same as Strategy 1):")
+                    unit_price_usd = 0
+                    total_price_usd = 0
+                    partner_total_usd = None
+                    price_rule = None
                     
                     # Collect all price values from the row line + lines after the row marker
                     all_prices = []
@@ -1027,29 +855,22 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                             # Clean USD suffix and add to collection
                             clean_prices = [p.replace(' USD', '').strip() for p in found_prices]
                             all_prices.extend(clean_prices)
-                            add_debug(f"    Line {j}: {price_line} -> {clean_prices}")
                     
                     if len(all_prices) >= 1:
-                        add_debug(f"    All collected prices: {all_prices}")
                         try:
                             # Filter out prices that start with 0 (these are discounts or small values)
                             price_candidates = [p for p in all_prices if not p.startswith('0,')]
                             
                             if price_candidates:
-                                add_debug(f"    Price candidates (non-zero): {price_candidates}")
-                                
                                 # If "Bid Total Commit Value" column exists, use it (4th position)
                                 if has_bid_total_commit:
                                     # Use 4th position (index 3) for "Bid Total Commit Value"
                                     if len(price_candidates) >= 4:
                                         total_str = price_candidates[3]
-                                        add_debug(f"    Selected position 4 (index 3): {total_str} [Bid Total Commit Value]")
                                     elif len(price_candidates) >= 2:
                                         total_str = price_candidates[1]
-                                        add_debug(f"    Selected position 2: {total_str}")
                                     else:
                                         total_str = price_candidates[0]
-                                        add_debug(f"    Selected only available: {total_str}")
                                 
                                 def _parse_price_usd(s: str):
                                     v = parse_number(s)
@@ -1061,6 +882,7 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                     # Normal case: total_str is the total price
                                     total_price_usd = _parse_price_usd(total_str)
                                     unit_price_usd = total_price_usd / qty if qty > 0 else total_price_usd
+                                    price_rule = f"Bid Total Commit Value {total_str}"
                                 elif has_bid_extended_monthly and len(price_candidates) >= 4:
                                     # "Future Offer" / monthly rate table:
                                     # ... Unit Monthly Rate, Extended Monthly Rate, Bid Unit Monthly Rate, Bid Extended Monthly Rate, Partner Bid Unit, Partner Bid Extended ...
@@ -1068,34 +890,20 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                                     total_price_usd = _parse_price_usd(price_candidates[3])
                                     if has_partner_bid_extended_monthly and len(price_candidates) >= 6:
                                         partner_total_usd = _parse_price_usd(price_candidates[5])
-                                        partner_price_aed_extracted = partner_total_usd * usd_to_local
-                                        add_debug(f"    ✓ Partner Extended Monthly Rate detected: USD {partner_total_usd:,.2f}")
-                                    add_debug(f"    ✓ Using monthly-rate layout: Unit USD {unit_price_usd:,.2f}, Total USD {total_price_usd:,.2f}")
+                                    price_rule = "Bid Extended Monthly Rate"
                                 else:
                                     # Fallback: use "Bid Unit Price" as unit, and keep total if we can infer it
                                     if len(price_candidates) >= 3:
                                         unit_price_usd = _parse_price_usd(price_candidates[2])
-                                        add_debug(f"    Selected position 3 (index 2): {price_candidates[2]} [Unit Price fallback]")
                                     else:
                                         unit_price_usd = _parse_price_usd(price_candidates[0])
-                                        add_debug(f"    Selected only available: {price_candidates[0]} [Unit Price fallback]")
                                     total_price_usd = unit_price_usd * qty if qty > 0 else unit_price_usd
-                                    add_debug(f"    ⚠️ No total-commit column found - inferring Total = Unit × Qty")
-                                
-                                add_debug(f"    ✓ Extracted: Total USD {total_price_usd:,.2f}, Unit USD {unit_price_usd:,.2f}")
-                                
-                                # Convert USD to AED
-                                unit_price_aed = unit_price_usd * usd_to_local
-                                total_price_aed = total_price_usd * usd_to_local
-                                
-                                add_debug(f"  ✓ Prices found: USD {unit_price_usd:,.2f} → AED {unit_price_aed:,.2f}")
-                                add_debug(f"  ✓ Total: USD {total_price_usd:,.2f} → AED {total_price_aed:,.2f}")
-                            else:
-                                add_debug(f"    ✗ All prices are zero or no valid candidates")
+                                    price_rule = "Bid Unit Price x qty (no total column)"
                         except Exception as e:
-                            add_debug(f"    ✗ Error parsing prices: {e}")
-                    else:
-                        add_debug(f"  ✗ No prices found")
+                            price_rule = f"error: {e}"
+                    if tr is not None:
+                        tr.event("price", extractor="template2", start=i, sku=sku_table, unit=unit_price_usd,
+                                 extended=total_price_usd, partner=partner_total_usd, rule=price_rule, prices=all_prices)
                     
                     # Extract dates
                     start_date = ""
@@ -1109,69 +917,49 @@ def extract_ibm_template2_from_pdf(file_like, country: str = "UAE") -> tuple[lis
                             if len(date_matches) > 1:
                                 end_date = date_matches[1]
                             if start_date and end_date:
-                                add_debug(f"  ✓ Dates found: {start_date} to {end_date}")
                                 break
                     
-                    # Add extracted row to results - use same format as Strategy 1
-                    # Format: [sku, desc, qty, duration, start_date, end_date, unit_price_aed, total_price_aed, partner_price_aed]
-                    if partner_price_aed_extracted is not None:
-                        partner_price_aed = round(partner_price_aed_extracted, 2)
-                    else:
-                        partner_price_aed = round(total_price_aed * (1 - global_channel_discount), 2)
-                    row_data = [
-                        sku_table,
-                        desc_table,
-                        int(qty) if isinstance(qty, float) and qty.is_integer() else qty,
-                        duration,
-                        start_date,
-                        end_date,
-                        round(unit_price_aed, 2),
-                        round(total_price_aed, 2),
-                        partner_price_aed
-                    ]
-                    extracted_data.append(row_data)
-                    add_debug(f"  ✓ Row added: {sku_table} x {qty}")
+                    # Add extracted row to results - same canonical USD line item as Strategy 1
+                    extracted_data.append({
+                        "sku": sku_table,
+                        "desc": desc_table,
+                        "qty": int(qty) if isinstance(qty, float) and qty.is_integer() else qty,
+                        "duration": duration,
+                        "start_date": start_date,
+                        "end_date": end_date,
+                        "unit_usd": unit_price_usd,
+                        "total_usd": total_price_usd,
+                        "partner_usd": partner_total_usd,
+                        "channel_discount": global_channel_discount,
+                        "pricing": PRICING_FROM_TABLE,
+                    })
+                    if tr is not None:
+                        tr.event("row", extractor="template2", row=len(extracted_data), start=i,
+                                 values=extracted_data[-1])
                     
                 except Exception as e:
-                    add_debug(f"  ✗ Error processing table row: {e}")
-                    import traceback
-                    add_debug(f"Traceback:\n{traceback.format_exc()}")
+                    if tr is not None:
+                        tr.event("skip", extractor="template2", start=i, reason=f"error: {e}")
         
         i += 1
     
-    add_debug("\n" + "="*80)
-    add_debug("EXTRACTION COMPLETE")
-    add_debug("="*80)
-    add_debug(f"Total line items found: {line_item_count}")
-    add_debug(f"Successfully extracted: {len(extracted_data)}")
-    add_debug(f"Failed/Skipped: {line_item_count - len(extracted_data)}")
-    
-    if extracted_data:
-        add_debug("\n" + "="*80)
-        add_debug("FINAL EXTRACTED DATA SUMMARY")
-        add_debug("="*80)
-        for idx, row in enumerate(extracted_data, 1):
-            add_debug(f"\nRow {idx}:")
-            add_debug(f"  SKU: {row[0]}")
-            add_debug(f"  Description (full):")
-            add_debug(f"    {row[1]}")
-            add_debug(f"  Qty: {row[2]}")
-            add_debug(f"  Duration: {row[3]}")
-            add_debug(f"  Dates: {row[4]} to {row[5]}")
-            add_debug(f"  Prices: Unit={row[6]}, Total={row[7]}")
-    
-    add_debug("="*80 + "\n")
     logger.info(f"Template 2 extraction completed: {len(extracted_data)} items extracted")
+    phase.count(rows=len(extracted_data))
+    phase.end()
     
     # Add channel discount to header_info for Excel generation
     header_info["Channel Discount"] = f"{global_channel_discount*100:.0f}%"
     
-    # Save all debug info to file
-    save_debug_to_file()
-    
     return extracted_data, header_info
 
 
+# Per-SKU description cache used by Strategy 2; flushed when the memory ceiling is hit
+extract_ibm_template2_items._desc_cache = {}
+register_cache("ibm_template2.desc_cache", extract_ibm_template2_items._desc_cache.clear)
+
+
+@timed()
+@metrics.render("create_template2_styled_excel")
 def create_template2_styled_excel(
     data: list,
     header_info: dict,
@@ -1194,24 +982,14 @@ def create_template2_styled_excel(
     import os
     
     logger.info(f"[TEMPLATE2 EXCEL] Creating Excel with {len(data)} rows")
-    add_debug(f"[TEMPLATE2 EXCEL] Creating Excel with {len(data)} rows")
     
     # Calculate total price for terms
     total_price_sum = sum(row[7] if len(row) > 7 else 0 for row in data)
-    add_debug(f"[TEMPLATE2 EXCEL] Total price sum: AED {total_price_sum:,.2f}")
-    add_debug(f"[TEMPLATE2 EXCEL] Header info before terms: MEP='{header_info.get('Maximum End User Price (MEP)', 'EMPTY')}'")
     
     # Get terms section from template
     try:
         terms = get_terms_section(header_info, total_price_sum)
-        add_debug(f"[TEMPLATE2 EXCEL] Terms section generated with {len(terms)} cells")
-        # Show first term cell content
-        if terms and len(terms) > 1:
-            add_debug(f"[TEMPLATE2 EXCEL] First term cell: {terms[1][0]} = {str(terms[1][1])[:150]}")
     except Exception as e:
-        add_debug(f"[TEMPLATE2 EXCEL] ERROR generating terms: {e}")
-        import traceback
-        add_debug(traceback.format_exc())
         terms = []
     
     wb = Workbook()
@@ -1387,14 +1165,12 @@ def create_template2_styled_excel(
     
     # Terms and Conditions from template
     terms_start_row = total_row + 3
-    add_debug(f"[TEMPLATE2 EXCEL] Adding terms at row {terms_start_row}")
     
     if terms:
         # Apply all terms cells from get_terms_section()
         try:
             for cell_ref, value, *style_args in terms:
                 style_info = style_args[0] if style_args else {}
-                add_debug(f"[TEMPLATE2 TERMS] Writing to {cell_ref}: {str(value)[:50]}...")
                 
                 ws[cell_ref] = value
                 
@@ -1408,12 +1184,8 @@ def create_template2_styled_excel(
                 else:
                     ws[cell_ref].font = Font(size=11)
                     ws[cell_ref].alignment = Alignment(wrap_text=True, vertical='top')
-            
-            add_debug(f"[TEMPLATE2 TERMS] Successfully added {len(terms)} term cells")
         except Exception as e:
-            add_debug(f"[TEMPLATE2 TERMS] ERROR adding terms: {e}")
-    else:
-        add_debug("[TEMPLATE2 TERMS] No terms data available")
+            pass
     
     # Page setup
     ws.page_setup.orientation = ws.ORIENTATION_LANDSCAPE
@@ -1431,7 +1203,6 @@ def create_template2_styled_excel(
         terms_ws.column_dimensions['A'].width = 100
     
     # Save workbook
-    wb.save(output)
-    logger.info("Template 2 Excel file generated successfully")
-    add_debug("[TEMPLATE2 EXCEL] Workbook saved successfully")
-    add_debug(f"[TEMPLATE2 EXCEL] Final workbook has sheet: {ws.title}")
\ No newline at end of file
+    with span("wb.save"):
+        wb.save(output)
+    logger.info("Template 2 Excel file generated successfully")
\ No newline at end of file
@@ -0,0 +1,270 @@
+# jobs.py
+"""
+Background jobs for the Streamlit flows.
+- submit(): queues an extraction for a small thread pool instead of the script thread
+  and returns a Job (future + token). One job per slot (e.g. a session + tool): submitting
+  different inputs to a slot cancels the job it supersedes; resubmitting the same inputs
+  while it is pending (a plain rerun) re-attaches to it.
+- Admission control: jobs start in FIFO order, at most MINDTOOL_JOB_THREADS at a time
+  and only while the running jobs' memory estimates (estimate_job_mb: page count and
+  upload sizes) fit in MINDTOOL_JOB_MEMORY_MB. Waiting jobs report their queue position.
+- JobToken: progress + cooperative cancellation. The running job's token is held in a
+  context variable, so extractors only call checkpoint() - per page (pdf_io, ocr) and
+  per row - and a cancelled job raises JobCancelled at its next checkpoint.
+- checkpoint() is a no-op outside a job, so direct calls behave as before.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+
+logger = logging.getLogger("jobs")
+
+# Admission control (server-wide): jobs running at once, estimated memory they may
+# hold together, and how many may wait in the FIFO queue
+JOB_THREADS = int(os.environ.get("MINDTOOL_JOB_THREADS", "4") or 1)
+JOB_MEMORY_MB = int(os.environ.get("MINDTOOL_JOB_MEMORY_MB", "2048") or 0)
+JOB_QUEUE_MAX = int(os.environ.get("MINDTOOL_JOB_QUEUE_MAX", "100") or 0)
+JOB_BASE_MB = 60   # fitz document, openpyxl workbook, interpreter overhead per job
+JOB_PAGE_MB = 3    # text, words and find_tables objects per page
+
+_current_token = contextvars.ContextVar("mindtool_job_token", default=None)
+_executor = None
+_executor_lock = threading.Lock()
+_slots = {}  # slot -> Job
+_slots_lock = threading.RLock()  # re-entered by done callbacks of cancelled jobs
+_queue = deque()  # Jobs waiting for admission, oldest first
+_running = set()
+_reserved_mb = 0.0
+_admission_lock = threading.RLock()
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job at the first checkpoint after it was cancelled.
+    A BaseException (like KeyboardInterrupt) so the extractors' broad
+    `except Exception` fallbacks do not turn a cancellation into a result.
+    """
+
+
+class QueueFull(Exception):
+    """The admission queue is full; the caller should retry later."""
+
+
+class JobToken:
+    """Progress and cancellation state shared by a job and the UI polling it."""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self.stage = ""
+        self.done = 0
+        self.total = 0
+        self.started = time.time()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def report(self, stage=None, done=None, total=None):
+        with self._lock:
+            if stage is not None and stage != self.stage:
+                self.stage, self.done, self.total = stage, 0, 0
+            if done is not None:
+                self.done = done
+            if total is not None:
+                self.total = total
+
+    def progress(self) -> dict:
+        """Snapshot for the UI: stage, done, total, fraction (None if unknown), elapsed seconds."""
+        with self._lock:
+            fraction = min(1.0, self.done / self.total) if self.total else None
+            return {"stage": self.stage, "done": self.done, "total": self.total,
+                    "fraction": fraction, "elapsed": time.time() - self.started}
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(f"cancelled during {self.stage or 'start-up'}")
+
+
+def current_token():
+    """Token of the job running in this context, or None."""
+    return _current_token.get()
+
+
+def checkpoint(stage=None, done=None, total=None):
+    """Report progress and stop here if the current job was cancelled (no-op outside a job)."""
+    token = _current_token.get()
+    if token is None:
+        return
+    if stage is not None or done is not None or total is not None:
+        token.report(stage, done, total)
+    token.check()
+
+
+class Job:
+    def __init__(self, key, token, memory_mb, run):
+        self.key = key
+        self.token = token
+        self.memory_mb = memory_mb
+        self.future = Future()
+        self._run = run  # callable executed once the job is admitted
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def cancel(self):
+        self.token.cancel()
+        with _admission_lock:
+            queued = self in _queue
+            if queued:
+                _queue.remove(self)
+        if queued:
+            self.future.cancel()  # never admitted: waiters get CancelledError
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def queue_position(self) -> int:
+        """1-based position in the admission queue, 0 once admitted."""
+        with _admission_lock:
+            try:
+                return _queue.index(self) + 1
+            except ValueError:
+                return 0
+
+
+def estimate_job_mb(pdf_pages=0, pdf_bytes=0, excel_bytes=0) -> float:
+    """
+    Rough peak memory of one extraction: fitz document + per-page text/word lists and
+    find_tables objects, plus the pandas and openpyxl copies of the Excel upload.
+    """
+    mb = 1024 * 1024
+    return (JOB_BASE_MB + pdf_pages * JOB_PAGE_MB
+            + 3 * pdf_bytes / mb + 10 * excel_bytes / mb)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_THREADS, thread_name_prefix="mindtool-job")
+        return _executor
+
+
+def _run(token, fn, args, kwargs):
+    _current_token.set(token)  # runs inside the job's own copy of the submitter's context
+    token.check()
+    return fn(*args, **kwargs)
+
+
+def _admit():
+    """Start queued jobs in FIFO order while the concurrency and memory budgets allow."""
+    global _reserved_mb
+    with _admission_lock:
+        while _queue and len(_running) < JOB_THREADS:
+            job = _queue[0]
+            # The head always starts on an idle server, however large its estimate
+            if _running and _reserved_mb + job.memory_mb > JOB_MEMORY_MB:
+                break
+            _queue.popleft()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            _running.add(job)
+            _reserved_mb += job.memory_mb
+            inner = _get_executor().submit(job._run)
+            inner.add_done_callback(lambda f, job=job: _finish(job, f))
+
+
+def _finish(job, inner):
+    global _reserved_mb
+    with _admission_lock:
+        _running.discard(job)
+        _reserved_mb -= job.memory_mb
+    error = inner.exception()
+    if error is not None:
+        job.future.set_exception(error)
+    else:
+        job.future.set_result(inner.result())
+    _admit()
+
+
+def submit(slot, key, fn, *args, memory_mb=0.0, **kwargs) -> Job:
+    """
+    Queue fn(*args, **kwargs) for slot; it starts once admitted (FIFO, bounded by
+    MINDTOOL_JOB_THREADS running jobs and MINDTOOL_JOB_MEMORY_MB of estimated memory).
+    key identifies the inputs: the slot's pending job is reused when the key matches
+    and cancelled (superseded) when it differs.
+    memory_mb: estimate_job_mb() of the job. Raises QueueFull when the queue is at
+    MINDTOOL_JOB_QUEUE_MAX.
+    """
+    with _slots_lock:
+        previous = _slots.get(slot)
+        if previous is not None and not previous.done():
+            if previous.key == key and not previous.token.cancelled:
+                return previous
+            logger.info(f"Cancelling superseded job in slot {slot}")
+            previous.cancel()
+        with _admission_lock:
+            if len(_queue) >= JOB_QUEUE_MAX:
+                raise QueueFull(f"{len(_queue)} jobs already waiting")
+            token = JobToken()
+            ctx = contextvars.copy_context()
+            job = Job(key, token, memory_mb, lambda: ctx.run(_run, token, fn, args, kwargs))
+            _queue.append(job)
+        _slots[slot] = job
+    job.future.add_done_callback(lambda _: _release(slot, job))
+    _admit()
+    return job
+
+
+def _release(slot, job):
+    # Finished jobs are not kept around; results live in the caller's stage cache
+    with _slots_lock:
+        if _slots.get(slot) is job:
+            del _slots[slot]
+
+
+def cancel(slot):
+    """Cancel the slot's job, if any."""
+    with _slots_lock:
+        job = _slots.pop(slot, None)
+    if job is not None:
+        job.cancel()
+
+
+def load() -> dict:
+    """Server-wide admission state: running / queued jobs and reserved memory (MB)."""
+    with _admission_lock:
+        return {"running": len(_running), "queued": len(_queue), "reserved_mb": _reserved_mb}
+
+
+metrics.gauge_function("mindtool_jobs_running", "Extraction jobs running", lambda: load()["running"])
+metrics.gauge_function("mindtool_jobs_queued", "Extraction jobs waiting for admission", lambda: load()["queued"])
+metrics.gauge_function("mindtool_jobs_reserved_mb", "Estimated memory of the running jobs (MB)",
+                       lambda: load()["reserved_mb"])
+
+
+def wait(job, on_progress=None, interval=0.2):
+    """
+    Block until the job finishes, calling on_progress(progress dict) every interval seconds;
+    the dict carries queue_position (> 0 while the job waits for admission).
+    Streamlit interrupts this loop when the user changes a widget; the next run's submit()
+    then cancels the superseded job.
+    """
+    while True:
+        try:
+            return job.result(timeout=interval)
+        except FutureTimeout:
+            if on_progress is not None:
+                progress = job.token.progress()
+                progress["queue_position"] = job.queue_position()
+                on_progress(progress)
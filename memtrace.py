@@ -0,0 +1,188 @@
+# memtrace.py
+"""
+Allocation tracking for one request (tracemalloc), to find the stages that drive peak memory.
+- track(enabled): traces allocations of the enclosed block; yields a Tracker or None
+  (process_ibm_combo / app.process_mibb: allocations=True, MINDTOOL_TRACEMALLOC=1, or the
+  hidden "?profile=1" UI toggle)
+- stage(name): snapshot before and after the block - stages.run_stage wraps every computed
+  stage in it, so each pipeline stage gets its net growth, its peak and its top allocating
+  sites (innermost frame, plus "via": the nearest frame of this repository's own code
+  below it, skipping the stage / timing / worker wrappers)
+Tracker.report() is a plain dict:
+    {"peak_kb", "net_kb", "top": [site dicts for the whole request],
+     "stages": [{"stage", "depth", "net_kb", "peak_kb", "top": [site dicts]}]}
+Tracing is process-wide, so allocations of requests running in parallel show up too;
+snapshots cost time proportional to the live heap - a diagnostic mode, not for production.
+While tracking, workers.call() runs in this process (workers.inline()).
+"""
+import contextvars
+import logging
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import workers
+
+logger = logging.getLogger("memtrace")
+
+TRACEMALLOC_DEFAULT = os.environ.get("MINDTOOL_TRACEMALLOC", "0") == "1"
+TRACEMALLOC_FRAMES = int(os.environ.get("MINDTOOL_TRACEMALLOC_FRAMES", "8") or 8)
+TRACEMALLOC_TOP = int(os.environ.get("MINDTOOL_TRACEMALLOC_TOP", "10") or 10)
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_tracker = contextvars.ContextVar("mindtool_memtrace", default=None)
+_users_lock = threading.Lock()
+_users = 0
+_started = False  # tracing was started here (and is stopped here), not by PYTHONTRACEMALLOC
+# Wrappers every stage runs through; "via" names the first frame outside them
+_PLUMBING = {os.path.join(REPO_ROOT, name) for name in
+             ("memtrace.py", "stages.py", "singleflight.py", "workers.py", "timing.py", "metrics.py",
+              "profiling.py", "jobs.py")}
+_SKIP = (tracemalloc.__file__, __file__)
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot()
+
+
+def _where(frame) -> str:
+    filename = frame.filename
+    if filename.startswith(REPO_ROOT):
+        filename = os.path.relpath(filename, REPO_ROOT)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[-1]
+    return f"{filename}:{frame.lineno}"
+
+
+def _top_sites(after, before, top) -> list:
+    """Largest net allocations between two snapshots by site and the nearest repository frame calling it."""
+    sites = {}
+    for stat in after.compare_to(before, "traceback"):
+        if not stat.size_diff:
+            continue
+        frames = list(reversed(stat.traceback))  # innermost first
+        if frames[0].filename in _SKIP:
+            continue
+        via = next((f for f in frames if f.filename.startswith(REPO_ROOT) and f.filename not in _PLUMBING), None)
+        key = (_where(frames[0]), _where(via) if via is not None and via is not frames[0] else None)
+        size, count = sites.get(key, (0, 0))
+        sites[key] = (size + stat.size_diff, count + stat.count_diff)
+    ranked = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return [{"site": site, "via": via, "size_kb": round(size / 1024, 1), "count": count}
+            for (site, via), (size, count) in ranked if size > 0]
+
+
+class _Stage:
+    def __init__(self, tracker, name):
+        self.tracker = tracker
+        self.name = name
+        self.peak = 0
+
+    def __enter__(self):
+        self.tracker._sync_peak()
+        self.depth = len(self.tracker._stack)
+        self.tracker._stack.append(self)
+        self._before = _snapshot()
+        self._size0 = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracker._sync_peak()
+        size = tracemalloc.get_traced_memory()[0]
+        entry = {"stage": self.name, "depth": self.depth,
+                 "net_kb": round((size - self._size0) / 1024, 1),
+                 "peak_kb": round((self.peak - self._size0) / 1024, 1),
+                 "top": _top_sites(_snapshot(), self._before, self.tracker.top)}
+        self._before = None
+        self.tracker._stack.remove(self)
+        self.tracker.stages.append(entry)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+class Tracker:
+    """Per-stage allocation report of one request."""
+
+    def __init__(self, top=None):
+        self.top = top or TRACEMALLOC_TOP
+        self.stages = []  # in completion order, i.e. inner stages before the stage containing them
+        self._stack = []
+        self.peak = 0
+
+    def _sync_peak(self):
+        # reset_peak() is global: carry the peak seen so far to every open stage first
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak = max(self.peak, peak)
+        for open_stage in self._stack:
+            open_stage.peak = max(open_stage.peak, peak)
+
+    def start(self):
+        self._before = _snapshot()
+        self._size0 = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        self._sync_peak()
+        self.net = tracemalloc.get_traced_memory()[0] - self._size0
+        self.sites = _top_sites(_snapshot(), self._before, self.top)
+        self._before = None
+
+    def report(self) -> dict:
+        return {"peak_kb": round((self.peak - self._size0) / 1024, 1), "net_kb": round(self.net / 1024, 1),
+                "top": self.sites, "stages": self.stages}
+
+
+def stage(name):
+    """Snapshot allocations around the enclosed block as stage `name` (no-op when not tracking)."""
+    tracker = _tracker.get()
+    if tracker is None:
+        return _NULL
+    return _Stage(tracker, name)
+
+
+@contextmanager
+def track(enabled=None, top=None):
+    """Track allocations of the enclosed block when enabled (None: MINDTOOL_TRACEMALLOC); yields the Tracker or None."""
+    global _users, _started
+    if enabled is None:
+        enabled = TRACEMALLOC_DEFAULT
+    if not enabled:
+        yield None
+        return
+    with _users_lock:
+        if _users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _started = True
+        _users += 1
+    tracker = Tracker(top)
+    token = _tracker.set(tracker)
+    try:
+        with workers.inline():
+            tracker.start()
+            try:
+                yield tracker
+            finally:
+                tracker.stop()
+        logger.info(f"Allocations: net {tracker.net / 1024:.0f} KB, peak {(tracker.peak - tracker._size0) / 1024:.0f} KB"
+                    f" over {len(tracker.stages)} stages")
+    finally:
+        _tracker.reset(token)
+        with _users_lock:
+            _users -= 1
+            if _users == 0 and _started:
+                tracemalloc.stop()
+                _started = False
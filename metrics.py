@@ -0,0 +1,365 @@
+# metrics.py
+"""
+In-process metrics for capacity planning (aggregates, not per-request logs).
+- Counters and histograms with labels, all defined below; the extractors, Excel writers,
+  caches and the two pipelines feed them.
+- render_text(): Prometheus text format (0.0.4). Quantiles (p50/p95/p99) and rates (quotes
+  per minute) are computed on the Prometheus side: histogram_quantile() / rate().
+- dump(): writes render_text() atomically to MINDTOOL_METRICS_FILE (called after each quote,
+  at most every MINDTOOL_METRICS_DUMP_SECONDS); serve(): /metrics on MINDTOOL_METRICS_PORT, bound to
+  MINDTOOL_METRICS_HOST (default 127.0.0.1; set 0.0.0.0 to expose it on every interface).
+- Worker processes (workers.py) drain() their values after each job and the parent
+  absorb()s them, so one registry per server covers the work done in workers.
+- paused(): nothing is recorded in this context (warm-up runs on synthetic PDFs).
+"""
+import contextvars
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger("metrics")
+
+METRICS_FILE = os.environ.get("MINDTOOL_METRICS_FILE", "")
+METRICS_PORT = int(os.environ.get("MINDTOOL_METRICS_PORT", "0") or 0)
+METRICS_HOST = os.environ.get("MINDTOOL_METRICS_HOST", "127.0.0.1")
+METRICS_DUMP_SECONDS = float(os.environ.get("MINDTOOL_METRICS_DUMP_SECONDS", "15") or 0)
+
+# Latency buckets (seconds) and the page / row bands used as labels
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+PAGE_BANDS = (2, 5, 10, 20, 50, 100)
+ROW_BANDS = (10, 50, 100, 250, 500, 1000)
+
+_lock = threading.Lock()
+_registry = {}  # name -> metric
+_recording = contextvars.ContextVar("mindtool_metrics", default=True)
+_last_dump = 0.0
+_server = None
+
+
+def _band(n, bands) -> str:
+    """Label for n in bands: "1-2", "3-5", ..., "101+"."""
+    low = 1 if bands[0] >= 1 else 0
+    for high in bands:
+        if n <= high:
+            return f"{low}-{high}"
+        low = high + 1
+    return f"{bands[-1] + 1}+"
+
+
+def pages_band(pages) -> str:
+    return _band(pages or 0, PAGE_BANDS)
+
+
+def rows_band(rows) -> str:
+    return _band(rows or 0, ROW_BANDS)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labelnames, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values = {}  # label values -> float
+
+    def inc(self, amount=1, **labels):
+        if not _recording.get():
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, key)} {value:g}"
+
+    def _merge(self, values):
+        for key, value in values.items():
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        if not _recording.get():
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            slots = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    slots[i] += 1
+                    break
+            else:
+                slots[len(self.buckets)] += 1
+            slots[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the enclosed block (labels may be updated inside via the yielded dict)."""
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        for key, slots in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), slots):
+                cumulative += n
+                le = f'le="{bound}"' if bound == "+Inf" else f'le="{bound:g}"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, key, (le,))} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, key)} {slots[-1]:g}"
+            yield f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}"
+
+    def _merge(self, values):
+        for key, slots in values.items():
+            mine = self._values.setdefault(key, [0] * len(slots))
+            for i, n in enumerate(slots):
+                mine[i] += n
+
+
+class GaugeFunction:
+    """Gauge read from a callback at render time (e.g. the admission queue depth)."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        self.name, self.help, self.fn = name, help_text, fn
+        self._values = {}
+
+    def _samples(self):
+        try:
+            yield f"{self.name} {float(self.fn()):g}"
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+
+    def _merge(self, values):
+        pass
+
+
+def _register(metric):
+    with _lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name, help_text, labelnames=()) -> Counter:
+    return _register(Counter(name, help_text, labelnames))
+
+
+def histogram(name, help_text, labelnames=(), buckets=SECONDS_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labelnames, buckets))
+
+
+def gauge_function(name, help_text, fn) -> GaugeFunction:
+    return _register(GaugeFunction(name, help_text, fn))
+
+
+# ----------------------------------------------------------------------
+# The metrics
+# ----------------------------------------------------------------------
+QUOTES = counter("mindtool_quotes_total", "Quotations processed", ("tool", "template", "outcome"))
+QUOTE_SECONDS = histogram("mindtool_quote_seconds", "Whole-request latency (cached stages included)",
+                          ("tool", "template", "pages"))
+EXTRACTION_SECONDS = histogram("mindtool_extraction_seconds", "PDF extraction latency by page-count band",
+                               ("extractor", "pages"))
+RENDER_SECONDS = histogram("mindtool_excel_render_seconds", "Excel render latency by row-count band",
+                           ("writer", "rows"))
+CACHE_REQUESTS = counter("mindtool_cache_requests_total", "Cache lookups by cache and result (hit / miss / shared)",
+                         ("cache", "result"))
+TIER_PAGES = counter("mindtool_extraction_tier_pages_total", "Table pages by the tier that produced their rows",
+                     ("extractor", "tier"))
+OCR_PAGES = counter("mindtool_ocr_pages_total", "Pages sent to OCR (page images not found in the OCR cache)")
+SHADOW_RUNS = counter("mindtool_shadow_runs_total", "Shadow runs by result (agree / differ / error / dropped)",
+                      ("shadow", "result"))
+SHADOW_SECONDS = histogram("mindtool_shadow_seconds", "Extraction latency of the primary and candidate in shadow runs",
+                           ("shadow", "side"))
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_quote(tool, template, ok, seconds, pages):
+    """One processed quotation (called by the pipelines); also refreshes the metrics file."""
+    template = template or "unknown"
+    QUOTES.inc(tool=tool, template=template, outcome="ok" if ok else "error")
+    QUOTE_SECONDS.observe(seconds, tool=tool, template=template, pages=pages_band(pages))
+    dump()
+
+
+# ----------------------------------------------------------------------
+# Decorators for the extractors and writers
+# ----------------------------------------------------------------------
+_pages = contextvars.ContextVar("mindtool_metrics_pages", default=None)
+
+
+def note_pages(pages):
+    """Called by pdf_io.open_pdf: page count for the extraction being measured, if any."""
+    holder = _pages.get()
+    if holder is not None and not holder:
+        holder.append(pages)
+
+
+def extraction(extractor):
+    """Decorator: observe the call in EXTRACTION_SECONDS, labelled with the PDF's page-count band."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _recording.get():
+                return fn(*args, **kwargs)
+            holder = []
+            token = _pages.set(holder)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _pages.reset(token)
+                EXTRACTION_SECONDS.observe(time.perf_counter() - start, extractor=extractor,
+                                           pages=pages_band(holder[0] if holder else 0))
+        return wrapper
+    return decorate
+
+
+def render(writer):
+    """Decorator for Excel writers taking data=rows: observe RENDER_SECONDS by row-count band."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _recording.get():
+                return fn(*args, **kwargs)
+            data = kwargs.get("data", args[0] if args else None)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                RENDER_SECONDS.observe(time.perf_counter() - start, writer=writer,
+                                       rows=rows_band(len(data) if data else 0))
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def paused():
+    """Record nothing inside this context (this thread / job only)."""
+    token = _recording.set(False)
+    try:
+        yield
+    finally:
+        _recording.reset(token)
+
+
+# ----------------------------------------------------------------------
+# Worker processes
+# ----------------------------------------------------------------------
+def drain() -> dict:
+    """Values recorded since the last drain (worker side); the registry is reset."""
+    with _lock:
+        values = {name: m._values for name, m in _registry.items() if m._values and m.kind != "gauge"}
+        for name in values:
+            _registry[name]._values = {}
+    return values
+
+
+def absorb(values):
+    """Add values drained in a worker process to this registry."""
+    if not values:
+        return
+    with _lock:
+        for name, metric_values in values.items():
+            metric = _registry.get(name)
+            if metric is not None:
+                metric._merge(metric_values)
+
+
+# ----------------------------------------------------------------------
+# Exposition
+# ----------------------------------------------------------------------
+def render_text() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric._samples())
+    return "\n".join(lines) + "\n"
+
+
+def dump(path=None, force=False):
+    """Write render_text() to path (default MINDTOOL_METRICS_FILE) atomically; rate-limited unless force."""
+    global _last_dump
+    path = path or METRICS_FILE
+    if not path:
+        return
+    now = time.monotonic()
+    if not force and now - _last_dump < METRICS_DUMP_SECONDS:
+        return
+    _last_dump = now
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".metrics.", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(render_text())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {path}: {e}")
+
+
+def serve(port=None):
+    """Serve /metrics over HTTP on port (default MINDTOOL_METRICS_PORT) in a daemon thread; once per process."""
+    global _server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _lock:
+        if _server is not None:
+            return _server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer((METRICS_HOST, port), Handler)
+        except OSError as e:
+            logger.warning(f"Could not serve metrics on port {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="mindtool-metrics", daemon=True).start()
+        logger.info(f"Serving metrics on {METRICS_HOST}:{port}/metrics")
+    return _server
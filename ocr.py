@@ -0,0 +1,184 @@
+# ocr.py
+"""
+OCR fallback for scanned quotation pages.
+- Only pages without a usable text layer (and with at least one image) are rasterized
+- Rasterization uses PyMuPDF pixmaps at MINDTOOL_OCR_DPI (default 300)
+- Pages are OCR'd in a process pool (pytesseract; spawned, never forked from the threaded
+  Streamlit server) and the text is cached by page-image hash, so the same scanned page is
+  never OCR'd twice in this process
+- While the pool works the job is checkpointed, so a cancelled job stops waiting for it
+- If pytesseract / Pillow / the tesseract binary are missing, pages are returned unchanged
+"""
+import atexit
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import metrics
+from jobs import checkpoint
+from pdf_io import register_cache
+
+logger = logging.getLogger("ocr")
+
+OCR_ENABLED = os.environ.get("MINDTOOL_OCR", "1") != "0"
+OCR_DPI = int(os.environ.get("MINDTOOL_OCR_DPI", "300"))
+OCR_LANG = os.environ.get("MINDTOOL_OCR_LANG", "eng")
+OCR_WORKERS = int(os.environ.get("MINDTOOL_OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+MIN_TEXT_CHARS = 20  # fewer non-space characters than this = no usable text layer
+CACHE_MAX_PAGES = 256
+POLL_INTERVAL = 0.1  # seconds between cancellation checks while the pool works
+
+_ocr_cache = OrderedDict()  # page-image hash -> text
+register_cache("ocr.page_text", _ocr_cache.clear)
+
+_pool = None
+_pool_lock = threading.Lock()
+_available = None
+
+
+def ocr_available() -> bool:
+    """True if pytesseract, Pillow and the tesseract binary can be used."""
+    global _available
+    if _available is None:
+        try:
+            import pytesseract
+            from PIL import Image  # noqa: F401
+            pytesseract.get_tesseract_version()
+            _available = True
+        except Exception as e:
+            logger.info(f"OCR disabled: {e}")
+            _available = False
+    return _available
+
+
+def page_needs_ocr(page, text: str) -> bool:
+    """A page needs OCR when it has (almost) no text but does contain an image."""
+    if len("".join((text or "").split())) >= MIN_TEXT_CHARS:
+        return False
+    try:
+        return bool(page.get_images(full=False))
+    except Exception:
+        return False
+
+
+def _ocr_png(png_bytes: bytes, lang: str) -> str:
+    """Worker: OCR a single PNG page image (runs in a child process)."""
+    import pytesseract
+    from PIL import Image
+    with Image.open(io.BytesIO(png_bytes)) as img:
+        return pytesseract.image_to_string(img, lang=lang)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # never fork the threaded Streamlit server (see workers.py)
+            _pool = ProcessPoolExecutor(max_workers=max(1, OCR_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the OCR worker processes (called automatically at exit)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _cache_get(key):
+    text = _ocr_cache.get(key)
+    if text is not None:
+        _ocr_cache.move_to_end(key)
+    return text
+
+
+def _cache_put(key, text):
+    _ocr_cache[key] = text
+    _ocr_cache.move_to_end(key)
+    while len(_ocr_cache) > CACHE_MAX_PAGES:
+        _ocr_cache.popitem(last=False)
+
+
+def ocr_pages(doc, page_indices, dpi=None, lang=None) -> dict:
+    """
+    OCR the given pages of an open document.
+    Returns {page_index: text}. Cached pages are not rasterized to PNG or sent to the pool.
+    """
+    dpi = dpi or OCR_DPI
+    lang = lang or OCR_LANG
+    results = {}
+    pending = {}  # cache key -> (png bytes, [page indices])
+    for page_index in page_indices:
+        checkpoint()
+        page = doc.load_page(page_index)
+        pix = page.get_pixmap(dpi=dpi, colorspace="gray")
+        del page
+        digest = hashlib.sha256(pix.samples_mv).hexdigest()
+        key = f"{digest}:{dpi}:{lang}"
+        cached = _cache_get(key)
+        metrics.cache_lookup("ocr", cached is not None)
+        if cached is not None:
+            results[page_index] = cached
+        elif key in pending:
+            pending[key][1].append(page_index)
+        else:
+            pending[key] = (pix.tobytes("png"), [page_index])
+        del pix
+
+    if pending:
+        logger.info(f"OCR: {len(pending)} page image(s) at {dpi} dpi")
+        metrics.OCR_PAGES.inc(len(pending))
+        pool = _get_pool()
+        futures = {pool.submit(_ocr_png, png, lang): key for key, (png, _) in pending.items()}
+        waiting = set(futures)
+        try:
+            while waiting:
+                done, waiting = wait(waiting, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures[future]
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        logger.error(f"OCR failed: {e}")
+                        text = ""
+                    _cache_put(key, text)
+                    for page_index in pending[key][1]:
+                        results[page_index] = text
+                checkpoint()
+        finally:
+            for future in waiting:  # cancelled job: pages not started yet are dropped
+                future.cancel()
+    return results
+
+
+def page_texts_with_ocr(doc, page_indices=None):
+    """
+    Like pdf_io.iter_page_text() but OCR's pages that have no usable text layer.
+    Returns a list of (page_index, text) in page order.
+    """
+    indices = list(range(len(doc)) if page_indices is None else page_indices)
+    texts = []
+    needs_ocr = []
+    for n, page_index in enumerate(indices):
+        checkpoint(done=n, total=len(indices))
+        page = doc.load_page(page_index)
+        text = page.get_text("text") or page.get_text()
+        if OCR_ENABLED and page_needs_ocr(page, text):
+            needs_ocr.append(page_index)
+        del page
+        texts.append((page_index, text))
+
+    if needs_ocr and ocr_available():
+        ocr_text = ocr_pages(doc, needs_ocr)
+        texts = [(i, ocr_text.get(i) or text) for i, text in texts]
+    return texts
@@ -0,0 +1,86 @@
+# page_classifier.py
+"""
+Cheap per-page classifier for IBM / MIBB quotation PDFs.
+Each page gets a set of kinds (a page can hold the end of the parts table and the
+start of the terms):
+- header: customer / bid metadata
+- parts:  Parts Information table (Template 1, MIBB)
+- saas:   Software as a Service blocks (Template 2)
+- terms:  IBM Terms and Conditions, "Useful/Important web resources", other legal prose
+- other:  none of the above
+Only table pages (parts/saas) go to the line-item engines; only terms pages go to
+the terms extractors. Pages with no signal of their own ("other") continue the
+table or terms section of the previous page.
+"""
+import re
+
+PAGE_HEADER = "header"
+PAGE_PARTS = "parts"
+PAGE_SAAS = "saas"
+PAGE_TERMS = "terms"
+PAGE_OTHER = "other"
+
+TABLE_KINDS = frozenset({PAGE_PARTS, PAGE_SAAS})
+
+HEADER_MARKERS = ("customer name:", "bid number:", "quote number:", "reseller name:", "bid expiration date:",
+                  "quote expiration date:", "pa site number:")
+SAAS_MARKERS = ("subscription part#", "overage part#", "software as a service")
+PARTS_MARKERS = ("parts information",)
+PARTS_HEADER_WORDS = ("coverage start", "coverage end", "bid ext", "quantity")
+TERMS_MARKERS = ("ibm terms and conditions", "useful/important web resources", "passport advantage agreement",
+                 "the quote or order", "terms and conditions:")
+
+date_re = re.compile(r'\b(?:\d{2}[‐‑–-][A-Za-z]{3}[‐‑–-]\d{4}|\d{2}/\d{2}/\d{4})\b')
+sku_re = re.compile(r'\b(?=[A-Z0-9]*\d)[A-Z][A-Z0-9]{5,11}\b')
+money_re = re.compile(r'\b\d{1,3}(?:[.,]\d{3})*[.,]\d{2}\b')
+
+PROSE_MIN_WORDS = 150      # legal pages are long...
+PROSE_MAX_DIGIT_RATIO = 0.05  # ...and almost free of numbers
+
+
+def _looks_like_prose(text: str) -> bool:
+    words = text.split()
+    if len(words) < PROSE_MIN_WORDS:
+        return False
+    digits = sum(ch.isdigit() for ch in text)
+    return digits / max(1, len(text)) <= PROSE_MAX_DIGIT_RATIO
+
+
+def classify_page(text: str, previous=frozenset()) -> frozenset:
+    """
+    Classify one page from its text. previous: kinds of the page before, used for
+    continuation pages. Returns a frozenset of PAGE_* kinds.
+    """
+    text = text or ""
+    low = text.lower()
+    kinds = set()
+
+    if any(m in low for m in HEADER_MARKERS):
+        kinds.add(PAGE_HEADER)
+    if any(m in low for m in SAAS_MARKERS):
+        kinds.add(PAGE_SAAS)
+    parts_header = "part number" in low and sum(w in low for w in PARTS_HEADER_WORDS) >= 2
+    if parts_header or any(m in low for m in PARTS_MARKERS) or (
+        len(date_re.findall(text)) >= 2 and sku_re.search(text) and money_re.search(text)
+    ):
+        kinds.add(PAGE_PARTS)
+    if any(m in low for m in TERMS_MARKERS) or (not kinds and _looks_like_prose(text)):
+        kinds.add(PAGE_TERMS)
+
+    if not kinds:
+        # Continuation page: inherits the table / terms section it sits in
+        kinds = set(previous & (TABLE_KINDS | {PAGE_TERMS})) or {PAGE_OTHER}
+    return frozenset(kinds)
+
+
+def is_table_page(kinds) -> bool:
+    return bool(kinds & TABLE_KINDS)
+
+
+def is_terms_page(kinds) -> bool:
+    return PAGE_TERMS in kinds
+
+
+def is_terms_only(kinds) -> bool:
+    """Pure legal text: no header fields or line items to look for."""
+    return kinds == frozenset({PAGE_TERMS})
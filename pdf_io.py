@@ -0,0 +1,223 @@
+# pdf_io.py
+"""
+Shared PyMuPDF document handling for all extractors.
+- open_pdf(): context manager that always closes the fitz document. Accepts a
+  memoryview/bytes, anything with getbuffer() (BytesIO, Streamlit UploadedFile),
+  a path, or a plain file object. Buffers are handed to MuPDF without a copy;
+  large non-buffer streams are spooled to a temporary file and opened by path.
+- page_count(): cheap page count (used for job memory estimates)
+- opening is a "fitz.open" timing span; the page count is added to the caller's span
+- iter_page_text(): yields (page_index, text) and drops each page object as soon as it is read;
+  each page is a jobs.checkpoint() (progress + cancellation of superseded jobs)
+- Memory ceiling: caches register a clear function; once process RSS goes over
+  MINDTOOL_MAX_RSS_MB the registered caches and MuPDF's own store are flushed. RSS rarely
+  drops back under the ceiling, so a further eviction needs RSS to have grown by
+  EVICT_REGROWTH_MB since the last one, or MINDTOOL_EVICT_COOLDOWN_S to have passed.
+- no_learning(): inside it (per thread / job context) the persisted caches - layout
+  cache, boilerplate store - are read but not added to (warm-up runs on synthetic PDFs).
+"""
+import contextvars
+import gc
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+
+import metrics
+from jobs import checkpoint
+from timing import count, span
+
+logger = logging.getLogger("pdf_io")
+
+# Per-process RSS ceiling in MB (0 disables the check)
+MAX_RSS_MB = int(os.environ.get("MINDTOOL_MAX_RSS_MB", "1024") or 0)
+EVICT_REGROWTH_MB = MAX_RSS_MB / 10
+EVICT_COOLDOWN_S = float(os.environ.get("MINDTOOL_EVICT_COOLDOWN_S", "60") or 0)
+
+# Streams without a buffer that are larger than this are spooled to disk
+SPOOL_THRESHOLD_MB = int(os.environ.get("MINDTOOL_PDF_SPOOL_MB", "32") or 0)
+
+_cache_clearers = {}
+_eviction_lock = threading.Lock()
+_last_eviction = None  # (monotonic time, RSS in MB after the eviction)
+_learning = contextvars.ContextVar("mindtool_cache_learning", default=True)
+
+
+def register_cache(name, clear_fn):
+    """Register a cache that should be emptied when the memory ceiling is hit."""
+    _cache_clearers[name] = clear_fn
+
+
+@contextmanager
+def no_learning():
+    """Run extractions without adding to the persisted caches (see learning_enabled)."""
+    token = _learning.set(False)
+    try:
+        yield
+    finally:
+        _learning.reset(token)
+
+
+def learning_enabled() -> bool:
+    """False inside no_learning(): persisted caches must not be updated."""
+    return _learning.get()
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or None if it cannot be measured."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        return None
+
+
+def evict_caches():
+    """Empty every registered cache plus the MuPDF object store."""
+    for name, clear_fn in list(_cache_clearers.items()):
+        try:
+            clear_fn()
+        except Exception as e:
+            logger.error(f"Failed to clear cache '{name}': {e}")
+    try:
+        fitz.TOOLS.store_shrink(100)
+    except Exception:
+        pass
+    gc.collect()
+
+
+def enforce_memory_ceiling():
+    """Evict caches if RSS is over the ceiling (see the module docstring). Returns True if an eviction ran."""
+    global _last_eviction
+    if MAX_RSS_MB <= 0:
+        return False
+    rss = current_rss_mb()
+    if rss is None or rss <= MAX_RSS_MB:
+        return False
+    with _eviction_lock:
+        if _last_eviction is not None:
+            evicted_at, rss_after = _last_eviction
+            if rss < rss_after + EVICT_REGROWTH_MB and time.monotonic() - evicted_at < EVICT_COOLDOWN_S:
+                return False
+        logger.warning(f"RSS {rss:.0f} MB over ceiling {MAX_RSS_MB} MB - evicting caches")
+        evict_caches()
+        _last_eviction = (time.monotonic(), current_rss_mb() or rss)
+    return True
+
+
+def pdf_buffer(source):
+    """
+    Return a zero-copy bytes-like view of the PDF, or None if the source
+    is a path or a stream without an underlying buffer.
+    """
+    if isinstance(source, (bytes, memoryview)):
+        return source
+    if isinstance(source, bytearray):
+        return memoryview(source)
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer()
+    return None
+
+
+def _stream_size(file_like):
+    """Total size of a seekable stream (rewound to the start), or None if unknown."""
+    try:
+        file_like.seek(0, os.SEEK_END)
+        size = file_like.tell()
+        file_like.seek(0)
+        return size
+    except Exception:
+        return None
+
+
+def _spool_to_temp_file(file_like):
+    """Copy a stream to a named temporary file in chunks and return its path."""
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        shutil.copyfileobj(file_like, tmp, 1024 * 1024)
+        return tmp.name
+
+
+@contextmanager
+def open_pdf(source):
+    """
+    Open a PDF with PyMuPDF and guarantee the document is closed.
+    The source is never copied into a new bytes object when it exposes a buffer.
+    Usage:
+        with open_pdf(uploaded_pdf.getbuffer()) as doc:
+            ...
+    """
+    owned_view = None
+    tmp_path = None
+    with span("fitz.open"):
+        if isinstance(source, (str, os.PathLike)):
+            doc = fitz.open(source, filetype="pdf")
+        else:
+            buffer = pdf_buffer(source)
+            if buffer is not None:
+                if buffer is not source:
+                    owned_view = buffer
+                doc = fitz.open(stream=buffer, filetype="pdf")
+            else:
+                size = _stream_size(source)
+                if size is None or size > SPOOL_THRESHOLD_MB * 1024 * 1024:
+                    tmp_path = _spool_to_temp_file(source)
+                    doc = fitz.open(tmp_path, filetype="pdf")
+                else:
+                    doc = fitz.open(stream=source.read(), filetype="pdf")
+    count(pages=len(doc))  # on the caller's span (the extractor / stage reading this document)
+    metrics.note_pages(len(doc))
+    try:
+        yield doc
+    finally:
+        doc.close()
+        if owned_view is not None:
+            try:
+                owned_view.release()
+            except Exception:
+                pass
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        enforce_memory_ceiling()
+
+
+def page_count(source) -> int:
+    """Number of pages (0 if the PDF cannot be opened); only the document trailer is parsed."""
+    try:
+        with open_pdf(source) as doc:
+            return len(doc)
+    except Exception as e:
+        logger.warning(f"Could not count pages: {e}")
+        return 0
+
+
+def iter_page_text(doc, page_indices=None, ocr=False):
+    """
+    Yield (page_index, text) for each page, releasing the page object before
+    moving on so only one page is alive at a time.
+    ocr=True: pages without a usable text layer are OCR'd (see ocr.py).
+    """
+    if ocr:
+        from ocr import page_texts_with_ocr
+        yield from page_texts_with_ocr(doc, page_indices)
+        return
+    indices = range(len(doc)) if page_indices is None else page_indices
+    for n, page_index in enumerate(indices):
+        checkpoint(done=n, total=len(indices))
+        page = doc.load_page(page_index)
+        text = page.get_text("text") or page.get_text()
+        del page
+        yield page_index, text
@@ -0,0 +1,112 @@
+# persisted.py
+"""
+JSON files that several processes learn into (the tiered_extraction layout cache, the
+extract_ibm_terms boilerplate store).
+- Writer(path, merge): one per file. schedule() asks for a write and returns at once; the write
+  happens on a background timer at most every MINDTOOL_CACHE_SAVE_SECONDS (0: at once, inline),
+  so a burst of new entries costs one write, off the request path. Pending writes are flushed
+  at exit.
+- A write holds an OS lock on <path>.lock (fcntl.flock; where fcntl is missing only the
+  in-process lock), re-reads the file and writes merge(on_disk): the owner folds the changes
+  it made since its last write into what is on disk, so entries other processes (job worker
+  processes, other app instances) wrote meanwhile are kept. The file is replaced atomically
+  (temp file + rename), so readers never see half a file.
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: the lock is per process there
+    fcntl = None
+
+logger = logging.getLogger("persisted")
+
+SAVE_SECONDS = float(os.environ.get("MINDTOOL_CACHE_SAVE_SECONDS", "2") or 0)
+
+_writers = []
+
+
+def read(path) -> dict:
+    """The file's JSON object, or {} if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on <path>.lock, across processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Writer:
+    """Debounced, merging writer of one persisted JSON file."""
+
+    def __init__(self, path, merge, what, **dump_kwargs):
+        self.path = path
+        self.merge = merge  # on-disk content -> content to write (None: nothing to write)
+        self.what = what
+        self.dump_kwargs = dump_kwargs
+        self._lock = threading.Lock()  # one write at a time in this process
+        self._timer_lock = threading.Lock()
+        self._timer = None
+        _writers.append(self)
+
+    def schedule(self):
+        """Write within SAVE_SECONDS (at once when it is 0)."""
+        if SAVE_SECONDS <= 0:
+            self.flush()
+            return
+        with self._timer_lock:
+            if self._timer is None:
+                self._timer = threading.Timer(SAVE_SECONDS, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self) -> bool:
+        return self._timer is not None
+
+    def flush(self):
+        """Merge the owner's changes into the file now."""
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with self._lock:
+            try:
+                with file_lock(self.path):
+                    content = self.merge(read(self.path))
+                    if content is None:
+                        return
+                    directory = os.path.dirname(self.path) or "."
+                    prefix = "." + os.path.splitext(os.path.basename(self.path))[0] + "."
+                    fd, tmp_path = tempfile.mkstemp(prefix=prefix, dir=directory)
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(content, f, **self.dump_kwargs)
+                    os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not persist {self.what}: {e}")
+
+
+@atexit.register
+def _flush_pending():
+    for writer in _writers:
+        if writer.pending():
+            writer.flush()
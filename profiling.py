@@ -0,0 +1,138 @@
+# profiling.py
+"""
+Opt-in per-request profiling (MINDTOOL_PROFILE=1, or the hidden "?profile=1" UI toggle).
+capture() runs the enclosed block under cProfile plus a stack sampler on the same thread and
+writes, into MINDTOOL_PROFILE_DIR, next to a copy of the input named by its content hash:
+- <hash>.pdf                     the input, to reproduce the run
+- <hash>-<tool>-<time>.pstats    cProfile stats (python -m pstats / snakeviz)
+- <hash>-<tool>-<time>.collapsed sampled stacks, one "frame;frame;... count" line per stack
+                                 (flamegraph.pl, speedscope, inferno)
+The report (Profile.report()) lists the top MINDTOOL_PROFILE_TOP functions by own time.
+While profiling, workers.call() runs in this process (workers.inline()) so the profiler
+sees the extraction instead of a wait on a worker pipe.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import workers
+from stages import content_hash
+
+logger = logging.getLogger("profiling")
+
+PROFILE_DEFAULT = os.environ.get("MINDTOOL_PROFILE", "0") == "1"
+PROFILE_DIR = os.environ.get("MINDTOOL_PROFILE_DIR", "profiles")
+PROFILE_TOP = int(os.environ.get("MINDTOOL_PROFILE_TOP", "20") or 20)
+SAMPLE_INTERVAL = float(os.environ.get("MINDTOOL_PROFILE_INTERVAL_MS", "5") or 5) / 1000
+
+
+class _Sampler(threading.Thread):
+    """Samples the stack of one thread every SAMPLE_INTERVAL seconds into collapsed-stack counts."""
+
+    def __init__(self, thread_id):
+        super().__init__(name="mindtool-profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self, tool, source):
+        from pdf_io import pdf_buffer
+        self.tool = tool
+        self.source = pdf_buffer(source)
+        if self.source is None and isinstance(source, str) and os.path.isfile(source):
+            with open(source, "rb") as f:
+                self.source = f.read()
+        self.input_hash = content_hash(self.source)
+        self.profiler = cProfile.Profile()
+        self.sampler = _Sampler(threading.get_ident())
+        self.seconds = 0.0
+        self.paths = {}
+
+    def start(self):
+        self._start = time.perf_counter()
+        self.sampler.start()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.seconds = time.perf_counter() - self._start
+
+    def save(self, directory=None):
+        """Write the input copy, the pstats file and the collapsed stacks; returns their paths."""
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{self.input_hash}-{self.tool}-{time.strftime('%Y%m%d-%H%M%S')}")
+        input_path = os.path.join(directory, f"{self.input_hash}.pdf")
+        if not os.path.exists(input_path) and self.source is not None:
+            with open(input_path, "wb") as f:
+                f.write(self.source)
+        self.profiler.dump_stats(f"{stem}.pstats")
+        with open(f"{stem}.collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.paths = {"input": input_path, "pstats": f"{stem}.pstats", "collapsed": f"{stem}.collapsed"}
+        return self.paths
+
+    def hotspots(self, top=None) -> list:
+        """Top functions by own (exclusive) time."""
+        stats = pstats.Stats(self.profiler).stats
+        rows = []
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.items():
+            rows.append({"function": name, "location": f"{os.path.basename(filename)}:{line}",
+                         "calls": calls, "own_ms": round(tottime * 1000, 2), "cumulative_ms": round(cumtime * 1000, 2)})
+        rows.sort(key=lambda r: r["own_ms"], reverse=True)
+        return rows[:top or PROFILE_TOP]
+
+    def report(self) -> dict:
+        return {"seconds": round(self.seconds, 3), "input_hash": self.input_hash, "files": self.paths,
+                "samples": sum(self.sampler.stacks.values()), "hotspots": self.hotspots()}
+
+
+@contextmanager
+def capture(enabled, tool, source):
+    """
+    Profile the enclosed block when enabled (None: MINDTOOL_PROFILE); yields the Profile or None.
+    source: the input PDF (bytes / memoryview / BytesIO / path), saved under its content hash.
+    Artifacts are written when the block exits, also when it raised.
+    """
+    if enabled is None:
+        enabled = PROFILE_DEFAULT
+    if not enabled:
+        yield None
+        return
+    profile = Profile(tool, source)
+    with workers.inline():
+        profile.start()
+        try:
+            yield profile
+        finally:
+            profile.stop()
+            try:
+                paths = profile.save()
+                logger.info(f"Profile of {tool} {profile.input_hash[:12]} ({profile.seconds:.2f}s) saved to {paths['pstats']}")
+            except OSError as e:
+                logger.warning(f"Could not save profile: {e}")
@@ -8,6 +8,8 @@ from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.drawing.image import Image
 from openpyxl.utils import get_column_letter
 from terms_template import get_terms_section
+from timing import span, timed
+import metrics
 
 def compare_mep_and_cost(header_info, data):
     """
@@ -93,6 +95,8 @@ def estimate_line_count(text, max_chars_per_line=80):
     return total_lines
 
 
+@timed()
+@metrics.render("create_styled_excel_v2")
 def create_styled_excel_v2(
     data: list,
     header_info: dict,
@@ -482,10 +486,12 @@ def create_styled_excel_v2(
     wb.calculation.fullCalcOnLoad = True
 
     # Save to the provided BytesIO
-    wb.save(output)
+    with span("wb.save"):
+        wb.save(output)
     output.seek(0)
 
 
+@timed(rows=len)
 def parse_uploaded_excel(file_path):
     """
     Parses the uploaded Excel log file and extracts relevant data for the table.
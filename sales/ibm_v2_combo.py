@@ -17,19 +17,214 @@ from ibm import (
     correct_descriptions,
     extract_last_page_text
 )
-from ibm_template2 import extract_ibm_template2_from_pdf
+from currency_projection import project_template1_rows, project_template2_items
 from template_detector import detect_ibm_template
+from stages import computed, content_hash, run_stage
+from pdf_io import page_count
+import capture
+import memtrace
+import metrics
+import profiling
+import timing
+import tracing
+import workers
 from io import BytesIO
+import copy
 import logging
+import time
 
 
-def process_ibm_combo(pdf_file, excel_file=None, master_csv=None, country="UAE"):
+def _extract_template1(pdf_file):
+    """Template 1 PDF stage: rows (kept for the date validation), header info and IBM terms."""
+    extracted = {'pdf_data': [], 'header_info': {}, 'ibm_terms_text': "", 'error': None}
+    try:
+        pdf_data, extracted_header_info = extract_ibm_data_from_pdf(pdf_file)
+        extracted['pdf_data'] = pdf_data
+        extracted['header_info'].update(extracted_header_info)
+        extracted['ibm_terms_text'] = extract_ibm_terms_text(pdf_file)
+    except Exception as e:
+        capture.note_exception()
+        extracted['error'] = f"Failed to extract header info or IBM Terms: {e}"
+    return extracted
+
+
+def _parse_excel(excel_file):
+    """Template 1 Excel stage: line items from the uploaded Excel. Returns (data, error)."""
+    try:
+        return parse_uploaded_excel(excel_file), None
+    except Exception as e:
+        capture.note_exception()
+        return [], f"Failed to extract data from Excel: {e}"
+
+
+def _validate_template1(pdf_data, data, header_info, excel_file):
+    """Template 1 validation stage: Excel vs PDF dates, MEP vs cost, bid number."""
+    validation = {'date_validation_msg': None, 'mep_cost_msg': None, 'bid_number_error': None}
+
+    # Date validation: Compare Excel dates with PDF dates for template 1
+    if excel_file and data:
+        try:
+            logging.info("Starting date validation for template 1")
+            logging.info(f"Extracted {len(pdf_data)} rows from PDF")
+
+            # Create mapping of SKU to (start_date, end_date) from PDF
+            pdf_sku_dates = {}
+            for row in pdf_data:
+                if len(row) >= 5:
+                    sku = str(row[0]).strip() if row[0] else ""
+                    start_date = str(row[3]).strip() if len(row) > 3 and row[3] else ""
+                    end_date = str(row[4]).strip() if len(row) > 4 and row[4] else ""
+                    if sku:
+                        pdf_sku_dates[sku] = (start_date, end_date)
+            logging.info(f"Created PDF SKU mapping with {len(pdf_sku_dates)} SKUs")
+
+            # Validate dates for each Excel row
+            validation_messages = []
+            for i, row in enumerate(data, 1):
+                if len(row) >= 5:
+                    sku = str(row[0]).strip() if row[0] else ""
+                    excel_start = str(row[3]).strip() if len(row) > 3 and row[3] else ""
+                    excel_end = str(row[4]).strip() if len(row) > 4 and row[4] else ""
+                    logging.info(f"Validating row {i}: SKU={sku}, Excel dates={excel_start}-{excel_end}")
+
+                    if sku in pdf_sku_dates:
+                        pdf_start, pdf_end = pdf_sku_dates[sku]
+                        logging.info(f"Found PDF dates for SKU {sku}: {pdf_start}-{pdf_end}")
+                        if excel_start == pdf_start and excel_end == pdf_end:
+                            validation_messages.append(f"Row {i} (SKU {sku}): Dates match between Excel and PDF")
+                        else:
+                            validation_messages.append(f"Row {i} (SKU {sku}): Dates do NOT match - Excel: {excel_start}-{excel_end}, PDF: {pdf_start}-{pdf_end}")
+                    else:
+                        validation_messages.append(f"Row {i} (SKU {sku}): SKU not found in PDF data")
+                        logging.warning(f"SKU {sku} not found in PDF data")
+
+            if validation_messages:
+                validation['date_validation_msg'] = "\n".join(validation_messages)
+                logging.info(f"Generated {len(validation_messages)} validation messages")
+            else:
+                validation['date_validation_msg'] = "No data to validate"
+                logging.info("No validation messages generated")
+
+        except Exception as e:
+            logging.error(f"Date validation failed: {e}")
+            validation['date_validation_msg'] = f"Failed to perform date validation: {e}"
+
+    # MEP/cost check
+    if header_info and data:
+        validation['mep_cost_msg'] = compare_mep_and_cost(header_info, data)
+    # Bid number check
+    if header_info and data and excel_file:
+        pdf_bid_number = header_info.get('Bid Number', '')
+        excel_file.seek(0)
+        bid_number_match, bid_number_error = check_bid_number_match(excel_file, pdf_bid_number)
+        if not bid_number_match:
+            validation['bid_number_error'] = bid_number_error
+    return validation
+
+
+def _render_template1(rows, header_info, ibm_terms_text, bid_number_error, country):
+    """Template 1 render stage: the styled Excel for the projected rows."""
+    header_info = dict(header_info)  # the Excel writer annotates it; keep the extract stage's copy clean
+    rendered = {'header_info': header_info, 'excel_bytes': None, 'error': None}
+    # Excel generation
+    if header_info and not bid_number_error:
+        output = BytesIO()
+        try:
+            create_styled_excel_v2(
+                data=copy.deepcopy(rows) if rows else [],
+                header_info=header_info,
+                logo_path="image.png",
+                output=output,
+                compliance_text="",
+                ibm_terms_text=ibm_terms_text,
+                country=country
+            )
+            rendered['excel_bytes'] = output.getvalue()
+        except Exception as e:
+            rendered['error'] = f"Failed to create styled Excel: {e}"
+    return rendered
+
+
+def _extract_template2(pdf_file):
+    """Template 2 PDF stage: canonical USD line items, header info and IBM terms (country-independent)."""
+    from ibm_template2 import extract_ibm_template2_items  # loaded only once a Template 2 quote shows up
+    items, header_info = extract_ibm_template2_items(pdf_file)
+    ibm_terms_text = extract_ibm_terms_text(pdf_file)
+    return {'items': items, 'header_info': header_info, 'ibm_terms_text': ibm_terms_text}
+
+
+def _render_template2(data, header_info, ibm_terms_text, country):
+    """Template 2 render stage: display columns and the styled Excel."""
+    # Try to infer columns from data if available, else use generic
+    columns = None
+    if data and isinstance(data, list) and len(data) > 0:
+        if isinstance(data[0], (list, tuple)):
+            columns = [f"Col{i+1}" for i in range(len(data[0]))]
+        elif isinstance(data[0], dict):
+            columns = list(data[0].keys())
+
+    output = BytesIO()
+    create_styled_excel_template2(
+        data=copy.deepcopy(data),  # writers may annotate rows; the memoized extract output stays untouched
+        header_info=dict(header_info),
+        logo_path="image.png",
+        output=output,
+        compliance_text="",
+        ibm_terms_text=ibm_terms_text,
+        country=country
+    )
+    return {'columns': columns, 'excel_bytes': output.getvalue()}
+
+
+def process_ibm_combo(pdf_file, excel_file=None, master_csv=None, country="UAE", stage_cache=None, timings=None,
+                      profile=None, allocations=None, trace=None, pages=None):
     """
     Unified processing for Template 1 (Excel-to-Excel) and Template 2 (PDF-to-Excel).
+    pdf_file may be a memoryview/bytes (e.g. uploaded_pdf.getbuffer()), a BytesIO or a path;
+    every stage reads the same buffer without copying it, so no seek(0) is needed between stages.
     - If excel_file is provided and template is 1: use Excel-to-Excel logic (ibm_v2)
     - If template is 2: use PDF-to-Excel logic (ibm.py)
+    Stages: detect -> extract (PDF, Excel) -> validate -> project (country) -> render. Extraction
+    is country-independent, so switching the country only re-runs projection and render. With stage_cache (a dict,
+    e.g. from st.session_state) each stage is memoized on its inputs, so only the stages whose
+    inputs changed are recomputed (see stages.py). PDF / Excel stages go through workers.call,
+    i.e. run in a recyclable worker process when MINDTOOL_WORKER_PROCESSES is set.
+    timings: record timing spans (timing.py) and return them as 'timings' (default: MINDTOOL_TIMING).
+    profile: run under the profiler (profiling.py) and return its report as 'profile' (default: MINDTOOL_PROFILE);
+    stages served from stage_cache do not show up in it.
+    allocations: track allocations per stage (memtrace.py) and return the report as 'allocations'
+    (default: MINDTOOL_TRACEMALLOC).
+    trace: write the extraction trace (tracing.py) and return its path and event counts as 'trace'
+    (default: MINDTOOL_TRACE); stages served from stage_cache emit no events.
+    pages: page count of the PDF if the caller already knows it (metrics); counted here otherwise.
+    A call that reads the PDF (template detection not served from stage_cache) is counted in the
+    metrics (metrics.record_quote), so reruns that recompute nothing do not count as quotes; slow or
+    failing calls are captured for tools/replay.py (capture.py).
     Returns: dict with keys: 'template', 'header_info', 'data', 'excel_bytes', 'mep_cost_msg', 'bid_number_error', 'error', 'ibm_terms_text'
     """
+    start = time.perf_counter()
+    with capture.request("combo", pdf_file, excel_file, country=country) as bundle, \
+            timing.record(timing.TIMING_DEFAULT if timings is None else timings) as recorder, \
+            profiling.capture(profile, "combo", pdf_file) as profiler, memtrace.track(allocations) as tracker, \
+            tracing.request(trace, "combo", pdf_file) as tracer, computed() as stages_run:
+        result = _process_ibm_combo(pdf_file, excel_file, country, stage_cache)
+        if bundle is not None:
+            bundle.template, bundle.error = result['template'], result['error']
+    if "detect" in stages_run:
+        metrics.record_quote("combo", result['template'], not result['error'], time.perf_counter() - start,
+                             page_count(pdf_file) if pages is None else pages)
+    if recorder is not None:
+        result['timings'] = recorder.breakdown()
+    if profiler is not None:
+        result['profile'] = profiler.report()
+    if tracker is not None:
+        result['allocations'] = tracker.report()
+    if tracer is not None:
+        result['trace'] = tracer.report()
+    return result
+
+
+def _process_ibm_combo(pdf_file, excel_file, country, stage_cache):
     result = {
         'template': None,
         'header_info': {},
@@ -42,205 +237,73 @@ def process_ibm_combo(pdf_file, excel_file=None, master_csv=None, country="UAE")
         'date_validation_msg': None  # Add date validation message
     }
     try:
+        pdf_hash = content_hash(pdf_file)
+        excel_hash = content_hash(excel_file)
+
         # Detect template
-        template = detect_ibm_template(pdf_file)
+        template, detect_key = run_stage(stage_cache, "detect", [pdf_hash], workers.call, detect_ibm_template,
+                                         pdf_file)
         result['template'] = template
-        pdf_file.seek(0)
         # Accept both '1' and 'template1' for template 1, and '2' and 'template2' for template 2
         if template in ('1', 'template1'):
             # Template 1: Excel-to-Excel logic
-            header_info = {}
-            data = []
-            ibm_terms_text = ""
-            # Extract header info from PDF
-            try:
-                _, extracted_header_info = extract_ibm_data_from_pdf(pdf_file)
-                header_info.update(extracted_header_info)
-                pdf_file.seek(0)
-                ibm_terms_text = extract_ibm_terms_text(pdf_file)
-            except Exception as e:
-                result['error'] = f"Failed to extract header info or IBM Terms: {e}"
+            extracted, extract_key = run_stage(stage_cache, "t1.extract", [pdf_hash], workers.call,
+                                               _extract_template1, pdf_file)
+            header_info = extracted['header_info']
+            ibm_terms_text = extracted['ibm_terms_text']
+            if extracted['error']:
+                result['error'] = extracted['error']
             # Extract data from Excel
+            data = []
+            parse_key = None
             if excel_file:
-                try:
-                    data = parse_uploaded_excel(excel_file)
-                except Exception as e:
-                    result['error'] = f"Failed to extract data from Excel: {e}"
+                (data, excel_error), parse_key = run_stage(stage_cache, "t1.parse_excel", [excel_hash],
+                                                           workers.call, _parse_excel, excel_file)
+                if excel_error:
+                    result['error'] = excel_error
             result['header_info'] = header_info
             result['ibm_terms_text'] = ibm_terms_text
 
-            # Date validation: Compare Excel dates with PDF dates for template 1
-            if excel_file and data:
-                try:
-                    logging.info("Starting date validation for template 1")
-                    pdf_file.seek(0)
-                    pdf_data, _ = extract_ibm_data_from_pdf(pdf_file)
-                    pdf_file.seek(0)
-                    logging.info(f"Extracted {len(pdf_data)} rows from PDF")
-
-                    # Create mapping of SKU to (start_date, end_date) from PDF
-                    pdf_sku_dates = {}
-                    for row in pdf_data:
-                        if len(row) >= 5:
-                            sku = str(row[0]).strip() if row[0] else ""
-                            start_date = str(row[3]).strip() if len(row) > 3 and row[3] else ""
-                            end_date = str(row[4]).strip() if len(row) > 4 and row[4] else ""
-                            if sku:
-                                pdf_sku_dates[sku] = (start_date, end_date)
-                    logging.info(f"Created PDF SKU mapping with {len(pdf_sku_dates)} SKUs")
-
-                    # Validate dates for each Excel row
-                    validation_messages = []
-                    for i, row in enumerate(data, 1):
-                        if len(row) >= 5:
-                            sku = str(row[0]).strip() if row[0] else ""
-                            excel_start = str(row[3]).strip() if len(row) > 3 and row[3] else ""
-                            excel_end = str(row[4]).strip() if len(row) > 4 and row[4] else ""
-                            logging.info(f"Validating row {i}: SKU={sku}, Excel dates={excel_start}-{excel_end}")
-
-                            if sku in pdf_sku_dates:
-                                pdf_start, pdf_end = pdf_sku_dates[sku]
-                                logging.info(f"Found PDF dates for SKU {sku}: {pdf_start}-{pdf_end}")
-                                if excel_start == pdf_start and excel_end == pdf_end:
-                                    validation_messages.append(f"Row {i} (SKU {sku}): Dates match between Excel and PDF")
-                                else:
-                                    validation_messages.append(f"Row {i} (SKU {sku}): Dates do NOT match - Excel: {excel_start}-{excel_end}, PDF: {pdf_start}-{pdf_end}")
-                            else:
-                                validation_messages.append(f"Row {i} (SKU {sku}): SKU not found in PDF data")
-                                logging.warning(f"SKU {sku} not found in PDF data")
-
-                    if validation_messages:
-                        result['date_validation_msg'] = "\n".join(validation_messages)
-                        logging.info(f"Generated {len(validation_messages)} validation messages")
-                    else:
-                        result['date_validation_msg'] = "No data to validate"
-                        logging.info("No validation messages generated")
-
-                except Exception as e:
-                    logging.error(f"Date validation failed: {e}")
-                    result['date_validation_msg'] = f"Failed to perform date validation: {e}"
-
-            if country == "Qatar":
-                columns = [
-                    "SKU", "Product Description", "Quantity", "Start Date", "End Date",
-                    "MEP Unit Price in USD", "Extended MEP Price USD", "Unit Partner Price USD", "Total Partner Price in USD"
-                ]
-                filtered_data = []
-            
-                excel_row = 18  # <-- Data starts on row 2 (change if your sheet starts later)
-            
-                for row in data:
-                    sku = row[0] if len(row) > 0 else ""
-                    desc = row[1] if len(row) > 1 else ""
-                    qty  = row[2] if len(row) > 2 else 0
-                    start_date = row[3] if len(row) > 3 else ""
-                    end_date   = row[4] if len(row) > 4 else ""
-                    raw_cost   = row[5] if len(row) > 5 else 0  # This is Extended MEP (total)
-            
-                    # Normalize numeric inputs so Excel formulas can compute correctly
-                    def _to_float(x):
-                        try:
-                            return float(x) if x not in (None, "", "-",) else 0.0
-                        except Exception:
-                            return 0.0
-            
-                    qty_num  = _to_float(qty)
-                    cost_num = _to_float(raw_cost)
-            
-                    # Build A1 references for this row
-                    C = f"C{excel_row}"
-                    F = f"F{excel_row}"
-                    G = f"G{excel_row}"
-                    H = f"H{excel_row}"
-                    I = f"I{excel_row}"
-                    J = f"J{excel_row}"
-                    E= f"E{excel_row}"
-            
-                    # Visible Excel formulas
-                    # unit_price_formula    = f"=IF({C}=0,0,{G}/{C})"     # F = unit price
-                    unit_price_formula    = f"=ROUND({I}/{E},2)"        # F = unit price
-                    unit_partner_formula  = f"=ROUND({H}*0.99,2)"       # H = 1% discount applied to unit price
-                    total_partner_formula = f"={J}*{E}"                 # I = H * qty
-            
-                    filtered_data.append([
-                        sku,                 # A
-                        desc,                # B
-                        qty_num,             # C (numeric)
-                        start_date,          # D
-                        end_date,            # E
-                        unit_price_formula,  # F (formula)
-                        cost_num,            # G (numeric)
-                        unit_partner_formula,# H (formula)
-                        total_partner_formula# I (formula)
-                    ])
-                    excel_row += 1
-            
-                result['data'] = filtered_data
-                result['columns'] = columns
-            else:
-                result['data'] = data
-                result['columns'] = ["SKU", "Description", "Quantity", "Start Date", "End Date", "Cost"]
-        # MEP/cost check
-            if header_info and data:
-                result['mep_cost_msg'] = compare_mep_and_cost(header_info, data)
-            # Bid number check
-            if header_info and data and excel_file:
-                pdf_bid_number = header_info.get('Bid Number', '')
-                excel_file.seek(0)
-                bid_number_match, bid_number_error = check_bid_number_match(excel_file, pdf_bid_number)
-                if not bid_number_match:
-                    result['bid_number_error'] = bid_number_error
-            # Excel generation
-            if header_info and not result['bid_number_error']:
-                output = BytesIO()
-                try:
-                    create_styled_excel_v2(
-                        data=result['data'] if result['data'] else [],
-                        header_info=header_info,
-                        logo_path="image.png",
-                        output=output,
-                        compliance_text="",
-                        ibm_terms_text=ibm_terms_text,
-                        country=country
-                    )
-                    result['excel_bytes'] = output.getvalue()
-                except Exception as e:
-                    result['error'] = f"Failed to create styled Excel: {e}"
+            validation, validate_key = run_stage(stage_cache, "t1.validate", [extract_key, parse_key, excel_hash],
+                                                 _validate_template1, extracted['pdf_data'], data, header_info,
+                                                 excel_file)
+            result.update(validation)
+
+            # Country projection (Qatar formula rows); the parsed Excel is shared by all countries
+            (rows, columns), project_key = run_stage(stage_cache, "t1.project", [parse_key, country],
+                                                     project_template1_rows, data, country)
+            rendered, _ = run_stage(stage_cache, "t1.render", [extract_key, project_key, validate_key, country],
+                                    workers.call, _render_template1, rows, header_info, ibm_terms_text,
+                                    validation['bid_number_error'], country)
+            result['header_info'] = rendered['header_info']
+            result['data'] = rows
+            result['columns'] = columns
+            if rendered['excel_bytes'] is not None:
+                result['excel_bytes'] = rendered['excel_bytes']
+            if rendered['error']:
+                result['error'] = rendered['error']
         elif template in ('2', 'template2'):
             # Template 2: PDF-to-Excel logic (ibm_template2.py)
             try:
-                data, header_info = extract_ibm_template2_from_pdf(pdf_file, country=country)
-                pdf_file.seek(0)
-                ibm_terms_text = extract_ibm_terms_text(pdf_file)
-                result['header_info'] = header_info
+                extracted, extract_key = run_stage(stage_cache, "t2.extract", [pdf_hash],
+                                                   workers.call, _extract_template2, pdf_file)
+                # Country projection: USD -> AED/SAR and partner prices, no PDF re-parse
+                data, project_key = run_stage(stage_cache, "t2.project", [extract_key, country],
+                                              project_template2_items, extracted['items'], country)
+                result['header_info'] = extracted['header_info']
                 result['data'] = data
-                result['ibm_terms_text'] = ibm_terms_text
-                # Try to infer columns from data if available, else use generic
-                if data and isinstance(data, list) and len(data) > 0:
-                    if isinstance(data[0], (list, tuple)):
-                        result['columns'] = [f"Col{i+1}" for i in range(len(data[0]))]
-                    elif isinstance(data[0], dict):
-                        result['columns'] = list(data[0].keys())
-                    else:
-                        result['columns'] = None
-                else:
-                    result['columns'] = None
-
-                output = BytesIO()
-                create_styled_excel_template2(
-                    data=data,
-                    header_info=header_info,
-                    logo_path="image.png",
-                    output=output,
-                    compliance_text="",
-                    ibm_terms_text=ibm_terms_text,
-                    country=country
-                )
-                result['excel_bytes'] = output.getvalue()
+                result['ibm_terms_text'] = extracted['ibm_terms_text']
+                rendered, _ = run_stage(stage_cache, "t2.render", [extract_key, project_key, country],
+                                        workers.call, _render_template2, data, extracted['header_info'],
+                                        extracted['ibm_terms_text'], country)
+                result['columns'] = rendered['columns']
+                result['excel_bytes'] = rendered['excel_bytes']
             except Exception as e:
+                capture.note_exception()
                 result['error'] = f"Failed to process Template 2: {e}"
         else:
             result['error'] = f"Unknown or unsupported template: {template}"
     except Exception as e:
+        capture.note_exception()
         result['error'] = f"Failed to process file: {e}"
     return result
@@ -3,17 +3,29 @@ MIBB Quotation processing module.
 - Uses same header extraction as IBM quotations
 - Custom table structure: Part Number, Description, Start Date, End Date, QTY, Price USD
 - MIBB-specific terms and conditions
+- process_mibb: the whole MIBB pipeline (memoized stages, timings, profiling, capture; a sample of
+  requests also runs sales/mibbtest.py in shadow, see shadow.py)
 """
 
+from contextlib import ExitStack
 from datetime import datetime
 from io import BytesIO
+import copy
 import os
 import re
-import fitz  # PyMuPDF
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.drawing.image import Image
-from openpyxl.utils import get_column_letter
+import time
+from pdf_io import open_pdf, iter_page_text, page_count, register_cache
+from jobs import checkpoint
+from stages import computed, content_hash, run_stage
+from timing import span, timed
+import capture
+import memtrace
+import metrics
+import profiling
+import shadow
+import timing
+import workers
+from tiered_extraction import accept_tier0, remember_layout, tier0_rows, table_clip
 import logging
 from pathlib import Path
 
@@ -52,6 +64,40 @@ def log_debug(message):
     # logging disabled
     return
 
+MASTER_MAP_CACHE_MAX = 8
+_master_maps = {}  # content hash of the pricelist -> {PART: description}
+
+
+@timed(rows=len)
+def load_master_map(master_file) -> dict:
+    """
+    Pricelist / master file as {PART: description} (first two columns only).
+    master_file: an upload or BytesIO with a .name (.xlsx is read as Excel, anything else as CSV).
+    Parsed maps are kept per content hash, so the pricelist preloaded by warmup.py (or
+    uploaded in another session) is not parsed again. The returned dict is shared: read only.
+    """
+    key = content_hash(master_file)
+    master_map = _master_maps.get(key)
+    metrics.cache_lookup("master_map", master_map is not None)
+    if master_map is not None:
+        return master_map
+    import pandas as pd
+    df = pd.read_excel(master_file) if master_file.name.endswith(".xlsx") else pd.read_csv(master_file)
+    df = df.iloc[:, :2]   # FIRST TWO COLUMNS ONLY
+    df.columns = ["part", "desc"]
+    df["part"] = df["part"].astype(str).str.upper().str.replace(" ", "").str.replace("-", "")
+    df["desc"] = df["desc"].fillna("").astype(str)
+    master_map = dict(zip(df["part"], df["desc"]))
+    while len(_master_maps) >= MASTER_MAP_CACHE_MAX:
+        _master_maps.pop(next(iter(_master_maps)))
+    _master_maps[key] = master_map
+    return master_map
+
+
+register_cache("mibb.master_maps", _master_maps.clear)
+
+
+@timed(rows=len)
 def correct_mibb_descriptions(extracted_data, master_map=None):
     """
     MIBB rows: [part_number, description, start_date, end_date, qty, price_usd]
@@ -100,6 +146,42 @@ def parse_euro_number(value: str):
         return None
 
 
+# Tier 0 (words pass) column headings for the Parts Information table
+MIBB_TIER0_COLUMNS = {
+    "sku": ["PART NUMBER"],
+    "desc": ["DESCRIPTION"],
+    "start": ["COVERAGE START"],
+    "end": ["COVERAGE END"],
+    "qty": ["QUANTITY", "QTY"],
+    "price": ["BID EXT SVP", "BID EXTENDED"],
+}
+MIBB_TIER0_REQUIRED = ("sku", "start", "end", "qty", "price")
+MIBB_SKU_RE = re.compile(r'^[A-Z0-9]{6,12}$')
+
+
+def _mibb_tier0_row(cells):
+    """
+    Turn tier 0 cells into a scored row; row["row"] is the usual 6-column MIBB row.
+    A missing qty / price stays None: accept_tier0 then sends the page to tier 1.
+    """
+    try:
+        qty = int(float(cells.get("qty", "").replace(",", "")))
+    except ValueError:
+        qty = None
+    price = parse_euro_number(cells.get("price")) if cells.get("price") else None
+    row = {
+        "sku": cells["sku"],
+        "start": cells.get("start", "").replace(" ", ""),
+        "end": cells.get("end", "").replace(" ", ""),
+        "qty": qty,
+        "price": price,
+    }
+    row["row"] = [row["sku"], cells.get("desc", ""), row["start"], row["end"], qty, price]
+    return row
+
+
+@timed()
+@metrics.extraction("mibb_header")
 def extract_mibb_header_from_pdf(file_like) -> dict:
     """
     Extract header information from MIBB quotation PDF.
@@ -108,21 +190,16 @@ def extract_mibb_header_from_pdf(file_like) -> dict:
     """
 
     
+    # Collect lines (document is closed as soon as the text is read)
+    lines = []
     try:
-        doc = fitz.open(stream=file_like.read(), filetype="pdf")
-     
+        with open_pdf(file_like) as doc:
+            for page_num, page_text in iter_page_text(doc, ocr=True):
+                for l in page_text.splitlines():
+                    if l and l.strip():
+                        lines.append(l.rstrip())
     except Exception as e:
         return {}
-    
-    # Collect lines
-    lines = []
-    for page_num, page in enumerate(doc):
-        page_text = page.get_text("text") or page.get_text()
-        page_lines = []
-        for l in page_text.splitlines():
-            if l and l.strip():
-                lines.append(l.rstrip())
-                page_lines.append(l.rstrip())
         
     for idx, line in enumerate(lines[:50]):
         log_debug(f"  Line {idx:3d}: {line}")
@@ -215,6 +292,8 @@ def extract_mibb_header_from_pdf(file_like) -> dict:
     return header_info
 
 
+@timed(rows=len)
+@metrics.extraction("mibb_table")
 def extract_mibb_table_from_pdf(file_like) -> list:
     """
     Extract table data from MIBB quotation PDF.
@@ -225,13 +304,18 @@ def extract_mibb_table_from_pdf(file_like) -> list:
     log_debug("MIBB TABLE EXTRACTION STARTED")
     log_debug("=" * 80)
 
-    try:
-        doc = fitz.open(stream=file_like.read(), filetype="pdf")
+    with ExitStack() as stack:
+        try:
+            doc = stack.enter_context(open_pdf(file_like))
+        except Exception as e:  # only an unreadable PDF means "no rows"; parse errors surface
+            log_debug(f"ERROR opening PDF for table extraction: {e}")
+            return []
         log_debug(f"PDF opened for table extraction: {len(doc)} pages")
-    except Exception as e:
-        log_debug(f"ERROR opening PDF for table extraction: {e}")
-        return []
+        return _extract_mibb_table_from_doc(doc)
 
+
+def _extract_mibb_table_from_doc(doc) -> list:
+    """Table extraction body for an already-open document (see extract_mibb_table_from_pdf)."""
     if len(doc) == 0:
         log_debug("ERROR: PDF has 0 pages")
         return []
@@ -243,13 +327,11 @@ def extract_mibb_table_from_pdf(file_like) -> list:
     header_signals = ["part number", "coverage start", "coverage end", "quantity", "qty", "bid ext", "bid extended"]
 
     candidate_pages: list[tuple[int, int, int]] = []  # (page_index, marker_score, header_score)
+    page_texts = {}  # page_index -> text (OCR'd for scanned pages), reused by Strategy 2
 
-    for page_idx in range(len(doc)):
-        try:
-            page_text = (doc[page_idx].get_text("text") or doc[page_idx].get_text() or "")
-        except Exception as e:
-            log_debug(f"[PAGE SCAN] Could not read text for page {page_idx+1}: {e}")
-            continue
+    for page_idx, page_text in iter_page_text(doc, ocr=True):
+        page_text = page_text or ""
+        page_texts[page_idx] = page_text
 
         text_lower = page_text.lower()
         marker_score = sum(1 for p in marker_patterns if p in text_lower)
@@ -261,12 +343,12 @@ def extract_mibb_table_from_pdf(file_like) -> list:
 
     if candidate_pages:
         candidate_pages.sort(key=lambda t: (-t[1], -t[2], t[0]))
-        pages_to_process = [doc[p[0]] for p in candidate_pages]
+        pages_to_process = [p[0] for p in candidate_pages]
         log_debug(f"[PAGE SELECT] Will process pages: {[p[0] + 1 for p in candidate_pages]}")
     else:
         # fallback if scan fails
         fallback_idx = 1 if len(doc) >= 2 else 0
-        pages_to_process = [doc[fallback_idx]]
+        pages_to_process = [fallback_idx]
         log_debug(f"[PAGE SELECT] No candidates found; falling back to page {fallback_idx+1}")
 
     # -----------------------------
@@ -275,24 +357,43 @@ def extract_mibb_table_from_pdf(file_like) -> list:
     all_extracted: list[list] = []
     
 
-    for page in pages_to_process:
-        page_no = page.number + 1
+    for n, page_idx in enumerate(pages_to_process):
+        checkpoint(done=n, total=len(pages_to_process))
+        # Load one page at a time so earlier pages (and their table objects) can be freed
+        page = doc.load_page(page_idx)
+        page_no = page_idx + 1
         log_debug(f"\n==================== PROCESSING PAGE {page_no} ====================")
 
         extracted_data: list[list] = []
 
+        # -------------------------
+        # TIER 0: words pass - accepted when the rows are complete enough
+        # -------------------------
+        tier0, tier0_score, layout = tier0_rows(page, MIBB_TIER0_COLUMNS, MIBB_SKU_RE.match, _mibb_tier0_row,
+                                                MIBB_TIER0_REQUIRED, cache_namespace="mibb")
+        known = bool(layout and layout["known"])
+        log_debug(f"[TIER 0] page {page_no}: {len(tier0)} rows, score={tier0_score:.2f}, known_layout={known}")
+        if accept_tier0(tier0, tier0_score, layout):
+            metrics.TIER_PAGES.inc(extractor="mibb", tier="tier0")
+            all_extracted.extend(r["row"] for r in tier0)
+            del page
+            continue
+
         # -------------------------
         # STRATEGY 1: Table detection (preferred)
         # -------------------------
         try:
             log_debug(f"[STRATEGY 1] Table detection on page {page_no}...")
-            tf = page.find_tables()
+            clip = table_clip(page, layout)
+            with span("find_tables"):
+                tf = page.find_tables(clip=clip) if clip else page.find_tables()
             tables = getattr(tf, "tables", [])
             log_debug(f"Found {len(tables)} table(s) using PyMuPDF")
 
             if tables:
                 # ✅ Pick ONLY the "Subscription Quotation - Parts Information" table
                 best_rows = None
+                best_table = None
                 best_score = -1
             
                 for t_idx, t in enumerate(tables):
@@ -317,6 +418,7 @@ def extract_mibb_table_from_pdf(file_like) -> list:
                     if score > best_score:
                         best_score = score
                         best_rows = r
+                        best_table = t
             
                 # If we couldn't identify Parts Information, treat as failure -> fallback to Strategy 2
                 if best_score < 5 or not best_rows:
@@ -347,7 +449,19 @@ def extract_mibb_table_from_pdf(file_like) -> list:
                     elif "BID EXT SVP" in h or "BID EXTENDED" in h:
                         bid_ext_svp_col = idx
 
+                # Learn this layout's columns so the next quote with the same header is sliced in tier 0
+                table_header = getattr(best_table, "header", None)
+                header_cells = [] if table_header is None or table_header.external else table_header.cells
+                table_fields = {"sku": part_num_col, "desc": desc_col, "start": start_date_col,
+                                "end": end_date_col, "qty": qty_col, "price": bid_ext_svp_col}
+                if header_cells and all(c is not None for c in header_cells) and \
+                        all(table_fields[f] is not None for f in MIBB_TIER0_REQUIRED):
+                    remember_layout("mibb", layout, bounds=[(c[0], c[2]) for c in header_cells],
+                                    fields={f: i for f, i in table_fields.items() if i is not None},
+                                    source="find_tables")
+
                 for r in rows[1:]:
+                    checkpoint()
                     if not r:
                         continue
 
@@ -383,6 +497,7 @@ def extract_mibb_table_from_pdf(file_like) -> list:
                 raise Exception("Strategy 1 got 0 rows")
 
             log_debug(f"[STRATEGY 1 SUCCESS] Extracted {len(extracted_data)} rows from page {page_no}")
+            metrics.TIER_PAGES.inc(extractor="mibb", tier="find_tables")
 
         except Exception as e:
             # -------------------------
@@ -391,7 +506,7 @@ def extract_mibb_table_from_pdf(file_like) -> list:
             log_debug(f"[STRATEGY 1 FAILED] {e}")
             log_debug(f"[STRATEGY 2] Text extraction on page {page_no}...")
 
-            page_text = page.get_text("text") or page.get_text()
+            page_text = page_texts.get(page_idx) or page.get_text("text") or page.get_text()
             lines = [l.rstrip() for l in page_text.splitlines() if l and l.strip()]
 
             # ✅ Anchor Strategy 2 to "Subscription Quotation" / "Parts Information" (ignore Overage)
@@ -431,6 +546,7 @@ def extract_mibb_table_from_pdf(file_like) -> list:
                 i = header_line_idx + 1
 
                 while i < len(lines):
+                    checkpoint()
                     part_match = part_number_pattern.search(lines[i])
                     if not part_match:
                         i += 1
@@ -465,9 +581,11 @@ def extract_mibb_table_from_pdf(file_like) -> list:
                     i += 1
 
             log_debug(f"[STRATEGY 2 COMPLETE] Extracted {len(extracted_data)} rows from page {page_no}")
+            metrics.TIER_PAGES.inc(extractor="mibb", tier="text")
 
         # Merge results (dedupe by part number)
         all_extracted.extend(extracted_data)
+        del page
 
     log_debug(f"\n[FINAL] Total extracted rows from all pages: {len(all_extracted)}")
     return all_extracted
@@ -554,6 +672,18 @@ def estimate_line_count(text, max_chars_per_line=80):
     return total_lines
 
 
+def mibb_excel_bytes(data: list, header_info: dict, logo_path: str) -> bytes:
+    """
+    create_mibb_excel() into memory; returns the .xlsx bytes (module-level, so it can run in a worker).
+    The writer annotates its inputs, so it gets copies: the caller's (cached) rows stay as they are.
+    """
+    output = BytesIO()
+    create_mibb_excel(data=copy.deepcopy(data), header_info=dict(header_info), logo_path=logo_path, output=output)
+    return output.getvalue()
+
+
+@timed()
+@metrics.render("create_mibb_excel")
 def create_mibb_excel(
     data: list,
     header_info: dict,
@@ -569,6 +699,12 @@ def create_mibb_excel(
         logo_path: path to logo image
         output: BytesIO object to write Excel to
     """
+    # openpyxl is only needed here; extraction-only callers never load it
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.drawing.image import Image
+    from openpyxl.utils import get_column_letter
+
     wb = Workbook()
     ws = wb.active
     ws.title = "Quotation"
@@ -800,5 +936,72 @@ def create_mibb_excel(
     ws.sheet_properties.pageSetUpPr.fitToPage = True
 
     wb.calculation.fullCalcOnLoad = True
-    wb.save(output)
+    with span("wb.save"):
+        wb.save(output)
     output.seek(0)
+
+
+# ----------------------------------------------------------------------
+# Pipeline (app.py MIBB tool, tools/replay.py)
+# ----------------------------------------------------------------------
+def process_mibb(pdf_bytes, master_file, stage_cache, logo_path, timings=False, profile=False, allocations=False,
+                 pages=None):
+    """
+    MIBB pipeline: header, table, master map, description correction, Excel (each stage memoized
+    in stage_cache, see stages.py; PDF / Excel stages go through workers.call).
+    timings: also return the timing spans of this run as "timings" (see timing.py).
+    profile: run under the profiler and return its report as "profile" (see profiling.py).
+    allocations: track allocations per stage and return the report as "allocations" (see memtrace.py).
+    pages: page count of the PDF if the caller already knows it (metrics); counted here otherwise.
+    Slow or failing runs are captured for tools/replay.py (see capture.py).
+    """
+    start = time.perf_counter()
+    with capture.request("mibb", pdf_bytes, master=master_file), timing.record(timings) as recorder, \
+            profiling.capture(profile, "mibb", pdf_bytes) as profiler, memtrace.track(allocations) as tracker, \
+            computed() as stages_run:
+        result = _process_mibb(pdf_bytes, master_file, stage_cache, logo_path)
+    if "table" in stages_run:  # a rerun served from stage_cache is not a new quote
+        metrics.record_quote("mibb", "mibb", bool(result["table_data"]), time.perf_counter() - start,
+                             page_count(pdf_bytes) if pages is None else pages)
+    if recorder is not None:
+        result["timings"] = recorder.breakdown()
+    if profiler is not None:
+        result["profile"] = profiler.report()
+    if tracker is not None:
+        result["allocations"] = tracker.report()
+    return result
+
+
+def _process_mibb(pdf_bytes, master_file, stage_cache, logo_path):
+    # Extract header (zero-copy view of the upload, shared by both extractors)
+    pdf_hash = content_hash(pdf_bytes)
+    header_info, header_key = run_stage(stage_cache, "header", [pdf_hash], workers.call,
+                                        extract_mibb_header_from_pdf, pdf_bytes)
+
+    # Extract table data
+    with computed() as table_run:
+        table_data, table_key = run_stage(stage_cache, "table", [pdf_hash], workers.call,
+                                          extract_mibb_table_from_pdf, pdf_bytes)
+    extracted = table_data
+
+    master_map, master_key = None, None
+    if master_file:
+        master_map, master_key = run_stage(stage_cache, "master_map", [master_file.name, content_hash(master_file)],
+                                           load_master_map, master_file)
+
+    # Correct descriptions (on a copy: the cached table stays as extracted)
+    table_data, corrected_key = run_stage(stage_cache, "corrected", [table_key, master_key],
+                                          lambda rows, mm: correct_mibb_descriptions(copy.deepcopy(rows), mm),
+                                          table_data, master_map)
+
+    # Create Excel
+    excel_bytes = None
+    if table_data:
+        excel_bytes, _ = run_stage(stage_cache, "excel", [header_key, corrected_key], workers.call, mibb_excel_bytes,
+                                   table_data, header_info, logo_path)
+    # Candidate extractor in the background, against the rows as extracted (before correction);
+    # only when the table was extracted, so a rerun served from stage_cache is not sampled again
+    if table_run:
+        shadow.submit("mibb_table", pdf_bytes, extracted)
+    return {"header_info": header_info, "table_data": table_data, "master_map": master_map,
+            "excel_bytes": excel_bytes}
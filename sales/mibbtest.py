@@ -9,7 +9,7 @@ from datetime import datetime
 from io import BytesIO
 import os
 import re
-import fitz  # PyMuPDF
+from pdf_io import open_pdf, iter_page_text
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.drawing.image import Image
@@ -17,34 +17,34 @@ from openpyxl.utils import get_column_letter
 import logging
 from pathlib import Path
 
-# Configure MIBB-specific logging
-MIBB_LOG_DIR = Path("mibb_logs")
-MIBB_LOG_DIR.mkdir(exist_ok=True)
-
-# Create logger for MIBB extraction
+# MIBB-specific debug log (mibb_logs/ + console), only with MINDTOOL_MIBB_DEBUG=1: this module
+# also runs in shadow on the live server (shadow.py), where it must stay quiet
+MIBB_DEBUG = os.environ.get("MINDTOOL_MIBB_DEBUG", "0") == "1"
 mibb_logger = logging.getLogger('mibb_extraction')
-mibb_logger.setLevel(logging.DEBUG)
 
-# Remove existing handlers to avoid duplicates
-for handler in mibb_logger.handlers[:]:
-    mibb_logger.removeHandler(handler)
+if MIBB_DEBUG:
+    MIBB_LOG_DIR = Path("mibb_logs")
+    MIBB_LOG_DIR.mkdir(exist_ok=True)
+    mibb_logger.setLevel(logging.DEBUG)
 
-# Create file handler with timestamp
-log_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-log_file_path = MIBB_LOG_DIR / f'mibb_extraction_{log_timestamp}.log'
-file_handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8')
-file_handler.setLevel(logging.DEBUG)
+    # Remove existing handlers to avoid duplicates
+    for handler in mibb_logger.handlers[:]:
+        mibb_logger.removeHandler(handler)
 
-# Create formatter
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
+    # Create file handler with timestamp
+    log_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    log_file_path = MIBB_LOG_DIR / f'mibb_extraction_{log_timestamp}.log'
+    file_handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8')
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    mibb_logger.addHandler(file_handler)
+    mibb_logger.propagate = False
 
-# Add handler to logger
-mibb_logger.addHandler(file_handler)
-mibb_logger.propagate = False
 
 def log_debug(message):
-    """Helper function to log debug messages"""
+    """Helper function to log debug messages (MINDTOOL_MIBB_DEBUG=1)"""
+    if not MIBB_DEBUG:
+        return
     mibb_logger.debug(message)
     print(f"[MIBB DEBUG] {message}")  # Also print to console for immediate feedback
 
@@ -77,24 +77,22 @@ def extract_mibb_header_from_pdf(file_like) -> dict:
     log_debug("MIBB HEADER EXTRACTION STARTED")
     log_debug("="*80)
     
+    # Collect lines (document is closed as soon as the text is read)
+    lines = []
     try:
-        doc = fitz.open(stream=file_like.read(), filetype="pdf")
-        log_debug(f"PDF opened successfully: {len(doc)} pages")
+        with open_pdf(file_like) as doc:
+            log_debug(f"PDF opened successfully: {len(doc)} pages")
+            for page_num, page_text in iter_page_text(doc):
+                page_lines = []
+                for l in page_text.splitlines():
+                    if l and l.strip():
+                        lines.append(l.rstrip())
+                        page_lines.append(l.rstrip())
+                log_debug(f"Page {page_num + 1}: Extracted {len(page_lines)} lines")
     except Exception as e:
         log_debug(f"ERROR opening PDF: {e}")
         return {}
     
-    # Collect lines
-    lines = []
-    for page_num, page in enumerate(doc):
-        page_text = page.get_text("text") or page.get_text()
-        page_lines = []
-        for l in page_text.splitlines():
-            if l and l.strip():
-                lines.append(l.rstrip())
-                page_lines.append(l.rstrip())
-        log_debug(f"Page {page_num + 1}: Extracted {len(page_lines)} lines")
-    
     log_debug(f"Total lines extracted: {len(lines)}")
     log_debug("\nFirst 50 lines of PDF:")
     for idx, line in enumerate(lines[:50]):
@@ -199,12 +197,16 @@ def extract_mibb_table_from_pdf(file_like) -> list:
     log_debug("="*80)
     
     try:
-        doc = fitz.open(stream=file_like.read(), filetype="pdf")
-        log_debug(f"PDF opened for table extraction: {len(doc)} pages")
+        with open_pdf(file_like) as doc:
+            log_debug(f"PDF opened for table extraction: {len(doc)} pages")
+            return _extract_mibb_table_from_doc(doc)
     except Exception as e:
         log_debug(f"ERROR opening PDF for table extraction: {e}")
         return []
 
+
+def _extract_mibb_table_from_doc(doc) -> list:
+    """Table extraction body for an already-open document (see extract_mibb_table_from_pdf)."""
     if len(doc) == 0:
         log_debug("ERROR: PDF has 0 pages")
         return []
@@ -231,12 +233,8 @@ def extract_mibb_table_from_pdf(file_like) -> list:
     candidate_pages: list[tuple[int, int, int]] = []
     # (page_index, marker_score, header_score)
 
-    for page_idx in range(len(doc)):
-        try:
-            page_text = (doc[page_idx].get_text("text") or doc[page_idx].get_text() or "")
-        except Exception as e:
-            log_debug(f"[PAGE SCAN] Could not read text for page {page_idx+1}: {e}")
-            continue
+    for page_idx, page_text in iter_page_text(doc):
+        page_text = page_text or ""
 
         text_lower = page_text.lower()
         marker_score = sum(1 for p in marker_patterns if p in text_lower)
@@ -0,0 +1,220 @@
+# shadow.py
+"""
+Shadow runs: a candidate extractor next to the primary one, on a sample of real requests.
+- CANDIDATES: shadow name -> (primary, candidate) extractors as "module:function"; both take
+  the PDF and return rows. "mibb_table" runs sales/mibbtest.py against sales/mibb.py.
+- submit(name, pdf, rows): called by the pipeline with the rows the user got, when it extracted
+  them (not on reruns served from the stage cache, which would sample one upload again); with
+  probability MINDTOOL_SHADOW_RATE (default 0: off) it queues a shadow run and returns at once. Shadow runs
+  go one at a time on their own background thread, so they never take a job slot (jobs.py);
+  at most MINDTOOL_SHADOW_QUEUE_MAX wait, further ones are dropped.
+- A shadow run times the primary and the candidate on the same PDF, back to back in the same
+  process (a worker process when workers are enabled, workers.call) with metrics paused and
+  without learning (pdf_io.no_learning: the layout cache and boilerplate store stay as they
+  are), and diffs the candidate's rows against the user's (diff_rows).
+- Each run appends one JSON line to MINDTOOL_SHADOW_DIR/<name>.jsonl; summary() aggregates them
+  into agreement, speed and a promotion verdict (tools/shadow_report.py).
+A shadow run never touches the user's result: it starts after the result is built, works on a
+copy of the PDF, and its failures are only logged and recorded.
+"""
+import importlib
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from stages import content_hash
+import metrics
+import workers
+
+logger = logging.getLogger("shadow")
+
+SHADOW_RATE = float(os.environ.get("MINDTOOL_SHADOW_RATE", "0") or 0)
+SHADOW_DIR = os.environ.get("MINDTOOL_SHADOW_DIR", "shadow")
+SHADOW_QUEUE_MAX = int(os.environ.get("MINDTOOL_SHADOW_QUEUE_MAX", "4") or 0)
+SHADOW_EXAMPLES = 5  # differing rows kept per run
+
+# Promotion: enough runs, rows agreeing on (nearly) every run, and not slower
+PROMOTE_MIN_RUNS = 20
+PROMOTE_MIN_AGREEMENT = 0.99
+PROMOTE_MAX_SLOWDOWN = 1.0  # candidate median / primary median
+
+CANDIDATES = {
+    "mibb_table": ("sales.mibb:extract_mibb_table_from_pdf", "sales.mibbtest:extract_mibb_table_from_pdf"),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+
+
+def _resolve(target):
+    module, name = target.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def compare(primary, candidate, pdf) -> dict:
+    """
+    Run both extractors ("module:function") on pdf, timed back to back in this process.
+    Module-level so that workers.call can run it in a worker process.
+    """
+    from pdf_io import no_learning
+    primary_fn, candidate_fn = _resolve(primary), _resolve(candidate)  # imports are not timed
+    with metrics.paused(), no_learning():
+        start = time.perf_counter()
+        primary_rows = primary_fn(pdf)
+        primary_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        try:
+            candidate_rows, error = candidate_fn(pdf), None
+        except Exception as e:
+            candidate_rows, error = None, f"{type(e).__name__}: {e}"
+        candidate_ms = (time.perf_counter() - start) * 1000
+    return {"primary_rows": primary_rows, "primary_ms": round(primary_ms, 2),
+            "candidate_rows": candidate_rows, "candidate_ms": round(candidate_ms, 2), "error": error}
+
+
+def _cell(row, i):
+    value = row[i] if i < len(row) else None
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def diff_rows(primary, candidate) -> dict:
+    """
+    Row-level diff of two extractions. Rows are paired by part number (first column; the n-th
+    row of a part number in one with the n-th in the other), so a dropped row does not shift
+    the rest. agreement: rows equal in both / rows in the larger extraction.
+    """
+    def by_part(rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault(_cell(row, 0), []).append(row)
+        return groups
+
+    a, b = by_part(primary), by_part(candidate)
+    same, changed, only_primary, only_candidate = 0, [], [], []
+    for part in list(a) + [p for p in b if p not in a]:
+        rows_a, rows_b = a.get(part, []), b.get(part, [])
+        for x, y in zip(rows_a, rows_b):
+            columns = [i for i in range(max(len(x), len(y))) if _cell(x, i) != _cell(y, i)]
+            if columns:
+                changed.append({"columns": columns, "primary": x, "candidate": y})
+            else:
+                same += 1
+        only_primary.extend(rows_a[len(rows_b):])
+        only_candidate.extend(rows_b[len(rows_a):])
+    total = max(len(primary), len(candidate))
+    return {"same": same, "changed": len(changed), "only_primary": len(only_primary),
+            "only_candidate": len(only_candidate), "agreement": round(same / total, 4) if total else 1.0,
+            "examples": {"changed": changed[:SHADOW_EXAMPLES], "only_primary": only_primary[:SHADOW_EXAMPLES],
+                         "only_candidate": only_candidate[:SHADOW_EXAMPLES]}}
+
+
+def run(name, pdf, rows=None) -> dict:
+    """One shadow run of CANDIDATES[name] on pdf, diffed against rows (None: the primary's own rows); recorded."""
+    primary, candidate = CANDIDATES[name]
+    outcome = workers.call(compare, primary, candidate, pdf)
+    if rows is None:
+        rows = outcome["primary_rows"]
+    record = {"at": time.strftime("%Y-%m-%dT%H:%M:%S"), "shadow": name, "input": content_hash(pdf)[:12],
+              "primary": primary, "candidate": candidate, "primary_ms": outcome["primary_ms"],
+              "candidate_ms": outcome["candidate_ms"], "primary_rows": len(rows), "error": outcome["error"]}
+    if outcome["error"] is None:
+        record["candidate_rows"] = len(outcome["candidate_rows"] or [])
+        record.update(diff_rows(rows, outcome["candidate_rows"] or []))
+    _record(name, record)
+    return record
+
+
+def _record(name, record):
+    if record["error"] is not None:
+        result = "error"
+    else:
+        result = "agree" if record["agreement"] == 1.0 and record["primary_rows"] == record["candidate_rows"] else "differ"
+    metrics.SHADOW_RUNS.inc(shadow=name, result=result)
+    metrics.SHADOW_SECONDS.observe(record["primary_ms"] / 1000, shadow=name, side="primary")
+    metrics.SHADOW_SECONDS.observe(record["candidate_ms"] / 1000, shadow=name, side="candidate")
+    os.makedirs(SHADOW_DIR, exist_ok=True)
+    with open(os.path.join(SHADOW_DIR, f"{name}.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    logger.info(f"Shadow {name} {record['input']}: {result}, primary {record['primary_ms']:.0f} ms, "
+                f"candidate {record['candidate_ms']:.0f} ms")
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mindtool-shadow")
+        return _executor
+
+
+def _background(name, pdf, rows):
+    global _pending
+    try:
+        run(name, pdf, rows)
+    except Exception as e:  # a shadow run must never surface anywhere but the log
+        logger.warning(f"Shadow {name} failed: {type(e).__name__}: {e}")
+        metrics.SHADOW_RUNS.inc(shadow=name, result="error")
+    finally:
+        with _executor_lock:
+            _pending -= 1
+
+
+def submit(name, pdf, rows) -> bool:
+    """Queue a shadow run for a sampled fraction (MINDTOOL_SHADOW_RATE) of requests; True if queued."""
+    global _pending
+    if SHADOW_RATE <= 0 or name not in CANDIDATES or random.random() >= SHADOW_RATE:
+        return False
+    with _executor_lock:
+        if SHADOW_QUEUE_MAX and _pending >= SHADOW_QUEUE_MAX:
+            metrics.SHADOW_RUNS.inc(shadow=name, result="dropped")
+            return False
+        _pending += 1
+    from pdf_io import pdf_buffer
+    # own copies: the upload's buffer and the rows belong to the user's request
+    _get_executor().submit(_background, name, bytes(pdf_buffer(pdf)), [list(row) for row in rows or []])
+    return True
+
+
+def load(name, path=None) -> list:
+    """The recorded runs of a shadow (MINDTOOL_SHADOW_DIR/<name>.jsonl, or path)."""
+    path = path or os.path.join(SHADOW_DIR, f"{name}.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summary(records) -> dict:
+    """Agreement and speed over recorded runs, with the promotion verdict (see PROMOTE_*)."""
+    ok = [r for r in records if r.get("error") is None]
+    result = {"runs": len(records), "errors": len(records) - len(ok)}
+    if not ok:
+        result["verdict"] = "no data"
+        return result
+    exact = sum(r["agreement"] == 1.0 and r["primary_rows"] == r["candidate_rows"] for r in ok)
+    primary_ms = statistics.median(r["primary_ms"] for r in ok)
+    candidate_ms = statistics.median(r["candidate_ms"] for r in ok)
+    ratio = candidate_ms / primary_ms if primary_ms else 1.0
+    result.update({"exact_runs": exact, "exact_share": round(exact / len(records), 4),
+                   "mean_agreement": round(statistics.mean(r["agreement"] for r in ok), 4),
+                   "primary_median_ms": round(primary_ms, 2), "candidate_median_ms": round(candidate_ms, 2),
+                   "speed_ratio": round(ratio, 3)})
+    if len(records) < PROMOTE_MIN_RUNS:
+        result["verdict"] = f"wait ({len(records)} of {PROMOTE_MIN_RUNS} runs)"
+    elif result["exact_share"] < PROMOTE_MIN_AGREEMENT:
+        result["verdict"] = "keep primary (rows differ)"
+    elif ratio > PROMOTE_MAX_SLOWDOWN:
+        result["verdict"] = "keep primary (candidate slower)"
+    else:
+        result["verdict"] = "promote candidate"
+    return result
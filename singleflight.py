@@ -0,0 +1,81 @@
+# singleflight.py
+"""
+Process-wide single-flight for identical extraction work.
+When several sessions process the same inputs at once (a shared quote uploaded by a
+few reps), the first caller computes and the others wait for and share its result.
+stages.run_stage() goes through do() with the stage key (stage name - which carries the
+template - plus the content hashes of the PDF / Excel and the country), so N identical
+uploads cost one detection, one extraction and one render, and every session still
+fills its own stage cache.
+- Only in-flight calls are shared; finished results are not kept here.
+- Results are shared objects: callers must treat them as read-only.
+- If the computing job is cancelled (jobs.JobCancelled) the waiters do not inherit
+  the cancellation: one of them takes over and computes.
+"""
+import logging
+import threading
+
+import metrics
+from jobs import JobCancelled, checkpoint
+
+logger = logging.getLogger("singleflight")
+
+WAIT_INTERVAL = 0.1  # seconds between cancellation checks while waiting
+
+_calls = {}  # key -> _Call
+_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+def do(key, fn, *args, **kwargs):
+    """
+    Return fn(*args, **kwargs), sharing the computation with concurrent calls for the same key.
+    """
+    while True:
+        with _lock:
+            call = _calls.get(key)
+            leader = call is None
+            if leader:
+                call = _calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if leader:
+            return _lead(key, call, fn, args, kwargs)
+
+        logger.info(f"Waiting for in-flight {key} ({call.waiters} waiting)")
+        while not call.done.wait(WAIT_INTERVAL):
+            checkpoint()  # a waiter can still be superseded in its own session
+        if isinstance(call.error, JobCancelled):
+            continue  # the computing session moved on; take over
+        if call.error is not None:
+            raise call.error
+        metrics.CACHE_REQUESTS.inc(cache="singleflight", result="shared")
+        return call.value
+
+
+def _lead(key, call, fn, args, kwargs):
+    try:
+        call.value = fn(*args, **kwargs)
+        return call.value
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.done.set()
+        if call.waiters:
+            logger.info(f"Shared in-flight {key} with {call.waiters} request(s)")
+
+
+def in_flight() -> int:
+    """Number of distinct computations currently running."""
+    with _lock:
+        return len(_calls)
@@ -0,0 +1,97 @@
+# stages.py
+"""
+Memoized processing stages for the Streamlit flows.
+Each stage's output is cached on a key derived from its inputs (content hashes of
+uploads, plain values, and the keys of the upstream stages it depends on).
+The cache is a plain dict - app.py keeps it in st.session_state - holding the latest
+result per stage, so a rerun only recomputes the stages whose inputs changed:
+switching the country re-renders the Excel, a download click recomputes nothing.
+Identical stages running at the same time in different sessions are computed once
+(see singleflight.py). Each stage is a timing span (see timing.py); cache hits show as "cached".
+Computed stages are also allocation-tracking boundaries (see memtrace.py).
+computed() collects the names of the stages a block really ran (not served from the cache),
+so the pipelines can tell a new request from a rerun that recomputed nothing.
+Pass cache=None to run a stage without memoization.
+"""
+import contextvars
+import hashlib
+import logging
+import pickle
+from contextlib import contextmanager
+
+import memtrace
+import metrics
+import singleflight
+from jobs import checkpoint
+from timing import span
+
+logger = logging.getLogger("stages")
+
+_computed = contextvars.ContextVar("mindtool_stages_computed", default=None)
+
+
+def content_hash(value) -> str:
+    """Stable hash of an upload or a plain value (bytes-like objects are hashed without copying)."""
+    if value is None:
+        return "none"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.sha1(value).hexdigest()
+    if hasattr(value, "getbuffer"):
+        return hashlib.sha1(value.getbuffer()).hexdigest()
+    if isinstance(value, (str, int, float, bool)):
+        return f"{type(value).__name__}:{value}"
+    return hashlib.sha1(pickle.dumps(value, protocol=4)).hexdigest()
+
+
+def stage_key(name, inputs) -> str:
+    """Key of a stage run: its name plus the hashes of its inputs."""
+    parts = [name] + [content_hash(v) for v in inputs]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def run_stage(cache, name, inputs, fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) unless the cache already holds its result for these inputs.
+    inputs: values that determine the output (upload hashes, options, upstream stage keys);
+    args/kwargs: what fn actually receives (may be large upstream outputs that are not hashed).
+    Returns (value, key); pass key as an input of downstream stages.
+    """
+    key = stage_key(name, inputs)
+    if cache is not None:
+        entry = cache.get(name)
+        if entry is not None and entry[0] == key:
+            logger.debug(f"stage {name}: cached")
+            metrics.cache_lookup("stage", True)
+            with span(name, note="cached"):
+                pass
+            return entry[1], key
+    logger.debug(f"stage {name}: computing")
+    if cache is not None:
+        metrics.cache_lookup("stage", False)
+    checkpoint(stage=name)
+    # Concurrent sessions computing the same stage on the same inputs share one run
+    with span(name), memtrace.stage(name):
+        value = singleflight.do(f"{name}:{key}", fn, *args, **kwargs)
+    if cache is not None:
+        cache[name] = (key, value)
+    names = _computed.get()
+    if names is not None:
+        names.add(name)
+    return value, key
+
+
+@contextmanager
+def computed():
+    """
+    Yields the set of names of the stages computed (not served from the cache) within the block.
+    Blocks nest: an enclosing computed() sees the stages of the inner one too.
+    """
+    names = set()
+    token = _computed.set(names)
+    try:
+        yield names
+    finally:
+        _computed.reset(token)
+        outer = _computed.get()
+        if outer is not None:
+            outer |= names
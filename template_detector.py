@@ -1,7 +1,11 @@
 # extractors/template_detector.py
-import fitz
+from pdf_io import open_pdf, iter_page_text
+from timing import timed
+import metrics
 import re
 
+@timed()
+@metrics.extraction("detect")
 def detect_ibm_template(file_like) -> str:
     """
     Auto-detect IBM template based on structural differences
@@ -10,13 +14,10 @@ def detect_ibm_template(file_like) -> str:
     Returns: 'template1' or 'template2'
     """
     try:
-        doc = fitz.open(stream=file_like.read(), filetype="pdf")
         sample_text = ""
-        for page_num in range(min(3, len(doc))):
-            page = doc[page_num]
-            sample_text += page.get_text("text") or page.get_text()
-        doc.close()
-        file_like.seek(0)
+        with open_pdf(file_like) as doc:
+            for _, page_text in iter_page_text(doc, range(min(3, len(doc)))):
+                sample_text += page_text
         
         text_lower = sample_text.lower()
         
@@ -1,8 +1,7 @@
+from currency_projection import currency_label, local_mep, usd_to_local_rate
+
 
 def get_terms_section(header_info, total_price_sum):
-        # DEBUG: Print all header_info keys and values to diagnose extraction issues
-    print("[DEBUG] header_info keys:", list(header_info.keys()))
-    print("[DEBUG] header_info values:", header_info)
     quote_validity = header_info.get("Bid Expiration Date", "N/A")
     company_name = header_info.get("Reseller Name", "Company")
     end_user = header_info.get("Customer Name", "End User")
@@ -10,18 +9,18 @@ def get_terms_section(header_info, total_price_sum):
     mep_value = header_info.get("Maximum End User Price (MEP)", "")
     if not mep_value:
          mep_value = header_info.get("Total Value Seller Revenue Opportunity", "")
-    # Conversion rate and currency by country: KSA -> 3.75 SAR; UAE/Qatar -> 3.6725 AED
+    # Conversion rate and currency by country: KSA -> 3.75 SAR; UAE -> 3.6725 AED; Qatar -> USD only
     c = (header_info.get('country') or '').strip().upper()
-    rate = 3.75 if c == 'KSA' else 3.6725
-    currency = 'SAR' if c == 'KSA' else 'AED'
+    rate = usd_to_local_rate(c)
+    currency = currency_label(c)
     # Create text with MEP placeholder - will be processed to include formula
     if mep_value:
                 # Store MEP value in header_info for formula use in Excel generation
                 try:
                         mep_numeric = float(mep_value.replace(",", ""))
                         header_info["_MEP_NUMERIC"] = mep_numeric
-                        mep_local = mep_numeric * rate
-                        if header_info.get('country', '').lower() == 'qatar':
+                        mep_local = local_mep(mep_numeric, c)
+                        if mep_local is None:
                                 formatted_price = f"USD {mep_value}"
                         else:
                                 formatted_price = f"USD {mep_value} ({currency} {mep_local:,.2f})"
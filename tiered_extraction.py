@@ -0,0 +1,368 @@
+# tiered_extraction.py
+"""
+Tiered line-item extraction.
+- Tier 0: fast words pass. Header words give the column positions, every visual row
+  below the header is sliced into cells, and each row is scored on completeness
+  (SKU, two dates, qty, price). Pages at or above TIER0_MIN_PAGE_SCORE whose every
+  row has the ROW_REQUIRED fields are done; any other page goes on to tier 1.
+- Tier 1: table detection (find_tables) clipped to the region under the header.
+- Tier 2: OCR / text heuristics (see ocr.py and the per-template fallbacks).
+The extractors in ibm.py and sales/mibb.py decide what tier 1/2 mean for them;
+this module only provides the tier 0 pass and the scoring.
+
+Layout cache: IBM quotes come from a handful of fixed layouts. Each header band is
+fingerprinted from its words and their x-positions; once a layout has been sliced
+successfully (or its columns were learned from find_tables) the column boundaries
+are persisted in MINDTOOL_LAYOUT_CACHE, and later pages with the same fingerprint
+are sliced straight into cells with the cached column bands, without header clustering, table
+detection or heuristics - as long as every row has the ROW_REQUIRED fields and the page scores
+TIER0_KNOWN_MIN_SCORE (lower than TIER0_MIN_PAGE_SCORE); a known layout scoring below that is forgotten,
+so a wrongly learned fingerprint cannot keep tier 1 away from its pages.
+The cache is shared by the job threads (jobs.py) under one lock; changes are written by a
+persisted.Writer, debounced and merged into the file under a file lock, so layouts other
+processes learned meanwhile are kept (a process only reads the file when it first needs it).
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+
+from pdf_io import learning_enabled
+import persisted
+from timing import timed
+import metrics
+
+logger = logging.getLogger("tiered_extraction")
+
+TIER0_MIN_PAGE_SCORE = float(os.environ.get("MINDTOOL_TIER0_MIN_SCORE", "0.8"))
+# Lower bar for a known layout (its columns were already proven; every row still needs the
+# ROW_REQUIRED fields), never above TIER0_MIN_PAGE_SCORE
+TIER0_KNOWN_MIN_SCORE = min(TIER0_MIN_PAGE_SCORE, float(os.environ.get("MINDTOOL_TIER0_KNOWN_MIN_SCORE", "0.7")))
+
+LAYOUT_CACHE_PATH = os.environ.get(
+    "MINDTOOL_LAYOUT_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "layout_cache.json")
+)
+LAYOUT_CACHE_MAX = 500
+
+# Completeness fields scored per row, and the ones every row needs for its page to skip tier 1
+ROW_FIELDS = ("sku", "start", "end", "qty", "price")
+ROW_REQUIRED = ("sku", "qty", "price")
+
+any_date_re = re.compile(r'^(\d{2}[‐‑–-][A-Za-z]{3}[‐‑–-]\d{4}|\d{2}/\d{2}/\d{4})$')
+number_re = re.compile(r'^-?\d[\d.,]*$')
+
+HEADER_GAP = 6.0     # header words closer than this (pt) belong to the same column heading
+LINE_TOLERANCE = 3.0  # words whose vertical centres differ by less than this are on one row
+FINGERPRINT_GRID = 4  # x-positions are snapped to this many points before hashing
+TABLE_CLIP_MARGIN = 36.0  # room above the header text for the table's top rule / padding
+
+_layout_cache = None  # {namespace: {fingerprint: {"bounds": [...], "fields": {...}, "source": str}}}
+_cache_lock = threading.RLock()  # _layout_cache and _changes
+_changes = {}  # (namespace, fingerprint) -> entry, or None when forgotten; not yet written
+_cleared = False  # clear_layout_cache(persist=True) since the last write: replace the file
+
+
+def _visual_lines(words):
+    """Group PyMuPDF words (x0, y0, x1, y1, text, ...) into rows by vertical centre."""
+    lines = []
+    for w in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        yc = (w[1] + w[3]) / 2
+        if lines and abs(lines[-1]["yc"] - yc) <= LINE_TOLERANCE:
+            lines[-1]["words"].append(w)
+        else:
+            lines.append({"yc": yc, "words": [w]})
+    for line in lines:
+        line["words"].sort(key=lambda w: w[0])
+        line["text"] = " ".join(w[4] for w in line["words"])
+        line["y0"] = min(w[1] for w in line["words"])
+        line["y1"] = max(w[3] for w in line["words"])
+    return lines
+
+
+def _header_clusters(header_words):
+    """Merge header words that overlap horizontally (stacked or adjacent) into column headings."""
+    clusters = []
+    for w in sorted(header_words, key=lambda w: w[0]):
+        if clusters and w[0] <= clusters[-1]["x1"] + HEADER_GAP:
+            c = clusters[-1]
+            c["x1"] = max(c["x1"], w[2])
+            c["words"].append(w)
+        else:
+            clusters.append({"x0": w[0], "x1": w[2], "words": [w]})
+    for c in clusters:
+        c["text"] = " ".join(w[4] for w in sorted(c["words"], key=lambda w: (round(w[1]), w[0]))).upper()
+    return clusters
+
+
+def layout_fingerprint(header_words, page_width=0) -> str:
+    """Hash of the header words and their (snapped) x-positions, plus the page width."""
+    parts = [str(round(page_width / FINGERPRINT_GRID))]
+    for w in sorted(header_words, key=lambda w: (round(w[0] / FINGERPRINT_GRID), w[4])):
+        parts.append(f"{w[4].upper()}@{round(w[0] / FINGERPRINT_GRID)}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+# ----------------------------------------------------------------------
+# Persisted layout cache
+# ----------------------------------------------------------------------
+def _load_layout_cache():
+    global _layout_cache
+    with _cache_lock:
+        if _layout_cache is None:
+            _layout_cache = persisted.read(LAYOUT_CACHE_PATH)
+        return _layout_cache
+
+
+def _merge_layout_cache(on_disk):
+    """The file's layouts with this process's changes since its last write applied (persisted.Writer)."""
+    global _cleared
+    with _cache_lock:
+        if not _changes and not _cleared:
+            return None
+        merged = {} if _cleared else {ns: dict(entries) for ns, entries in on_disk.items() if isinstance(entries, dict)}
+        for (namespace, fingerprint), entry in _changes.items():
+            entries = merged.setdefault(namespace, {})
+            entries.pop(fingerprint, None)  # re-learned layouts move to the end, like in memory
+            if entry is not None:
+                entries[fingerprint] = entry
+        _changes.clear()
+        _cleared = False
+    for entries in merged.values():
+        while len(entries) > LAYOUT_CACHE_MAX:
+            entries.pop(next(iter(entries)))
+    return merged
+
+
+_writer = persisted.Writer(LAYOUT_CACHE_PATH, _merge_layout_cache, "layout cache", indent=1, sort_keys=True)
+
+
+def cached_layout(namespace, fingerprint):
+    """Cached {"bounds", "fields"} for a fingerprint, or None."""
+    with _cache_lock:
+        return _load_layout_cache().get(namespace, {}).get(fingerprint)
+
+
+def remember_layout(namespace, layout, bounds=None, fields=None, source="tier0"):
+    """
+    Store the column boundaries of a layout that extracted cleanly.
+    bounds/fields default to the ones found by the words pass; pass them explicitly
+    to learn a layout from another source (e.g. find_tables header cells).
+    """
+    if not layout or not layout.get("fingerprint") or layout.get("known") or not learning_enabled():
+        return
+    bounds = bounds if bounds is not None else layout.get("bounds")
+    fields = fields if fields is not None else layout.get("fields")
+    if not bounds or not fields:
+        return
+    with _cache_lock:
+        entries = _load_layout_cache().setdefault(namespace, {})
+        if entries.get(layout["fingerprint"], {}).get("bounds") == [list(b) for b in bounds]:
+            return
+        while len(entries) >= LAYOUT_CACHE_MAX:
+            entries.pop(next(iter(entries)))
+        entries[layout["fingerprint"]] = {
+            "bounds": [list(b) for b in bounds],
+            "fields": dict(fields),
+            "source": source,
+        }
+        _changes[(namespace, layout["fingerprint"])] = entries[layout["fingerprint"]]
+    logger.info(f"Learned {namespace} layout {layout['fingerprint']} from {source}")
+    _writer.schedule()
+
+
+def forget_layout(namespace, fingerprint):
+    """Drop a learned layout (its pages go through the tiers again and may be re-learned)."""
+    with _cache_lock:
+        if _load_layout_cache().get(namespace, {}).pop(fingerprint, None) is None:
+            return
+        _changes[(namespace, fingerprint)] = None
+    logger.warning(f"Forgot {namespace} layout {fingerprint}: its rows no longer score")
+    _writer.schedule()
+
+
+def clear_layout_cache(persist=False):
+    """Forget every learned layout (persist=True also empties the cache file)."""
+    global _layout_cache, _cleared
+    with _cache_lock:
+        _layout_cache = {}
+        _changes.clear()
+        if persist:
+            _cleared = True
+    if persist:
+        _writer.flush()
+
+
+# ----------------------------------------------------------------------
+# Header detection and slicing
+# ----------------------------------------------------------------------
+def find_header_columns(words, column_spec, required=("sku",), anchor="PART NUMBER",
+                        page_width=0, cache_namespace=None):
+    """
+    Locate the table header and return its column layout, or None if there is no header.
+    column_spec: {field: [header phrases]} e.g. {"sku": ["PART NUMBER"], ...}
+    required: fields whose heading must be present for the header to count
+    Returns dict with:
+      - fingerprint: layout fingerprint of the header band
+      - known: True when bounds/fields came from the layout cache
+      - header_y0 / header_y1: vertical extent of the header band
+      - region_y1: top of the next header on the page (None = to the bottom)
+      - bounds: [(x0, x1), ...] for every header column (wanted or not), None if unresolved
+      - fields: {field: index into bounds}, None if the required headings were not found
+    """
+    lines = _visual_lines(words)
+    anchor_tops = [l["y0"] for l in lines if anchor in l["text"].upper()]
+    first = None
+    for idx, line in enumerate(lines):
+        if anchor not in line["text"].upper():
+            continue
+        band = list(line["words"])
+        y1 = line["y1"]
+        # Two-line headings ("Coverage" / "Start"): absorb the next line if it has no data in it
+        if idx + 1 < len(lines):
+            nxt = lines[idx + 1]
+            if nxt["y0"] - y1 < 12 and not any(any_date_re.match(w[4]) or number_re.match(w[4]) for w in nxt["words"]):
+                band.extend(nxt["words"])
+                y1 = nxt["y1"]
+        below = [y for y in anchor_tops if y > y1]
+        layout = {
+            "fingerprint": layout_fingerprint(band, page_width),
+            "known": False,
+            "header_y0": line["y0"],
+            "header_y1": y1,
+            "region_y1": min(below) if below else None,
+            "bounds": None,
+            "fields": None,
+        }
+        if cache_namespace:
+            cached = cached_layout(cache_namespace, layout["fingerprint"])
+            metrics.cache_lookup("layout", bool(cached))
+            if cached:
+                layout.update(known=True, bounds=[tuple(b) for b in cached["bounds"]], fields=cached["fields"])
+                return layout
+        clusters = _header_clusters(band)
+        fields = {}
+        for field, phrases in column_spec.items():
+            for ci, c in enumerate(clusters):
+                if any(p in c["text"] for p in phrases) and ci not in fields.values():
+                    fields[field] = ci
+                    break
+        if all(f in fields for f in required):
+            layout.update(bounds=[(c["x0"], c["x1"]) for c in clusters], fields=fields)
+            return layout
+        first = first or layout
+    return first
+
+
+def _column_for(x0, x1, bounds):
+    """Index of the header column a word belongs to (containing span, else nearest)."""
+    xc = (x0 + x1) / 2
+    best, best_dist = None, None
+    for i, (b0, b1) in enumerate(bounds):
+        if b0 - 2 <= xc <= b1 + 2:
+            return i
+        dist = min(abs(xc - b0), abs(xc - b1))
+        if best_dist is None or dist < best_dist:
+            best, best_dist = i, dist
+    return best
+
+
+def slice_rows(words, layout, is_sku):
+    """
+    Slice every visual row under the header into {field: text} cells.
+    A row whose SKU cell passes is_sku starts a new record; rows with text only in
+    the description column are appended (newline-joined, like find_tables cells) to
+    the previous record's description. Slicing stops at the next header on the page.
+    """
+    bounds, fields = layout["bounds"], layout["fields"]
+    index_to_field = {i: f for f, i in fields.items()}
+    records = []
+    for line in _visual_lines(words):
+        if line["y0"] <= layout["header_y1"]:
+            continue
+        if layout.get("region_y1") is not None and line["y0"] >= layout["region_y1"]:
+            break
+        cells = {}
+        for w in line["words"]:
+            field = index_to_field.get(_column_for(w[0], w[2], bounds))
+            if field:
+                cells[field] = (cells.get(field, "") + " " + w[4]).strip()
+        sku = cells.get("sku", "")
+        if sku and is_sku(sku):
+            records.append(cells)
+        elif records and set(cells) == {"desc"}:
+            records[-1]["desc"] = (records[-1].get("desc", "") + "\n" + cells["desc"]).strip()
+    return records
+
+
+def _field_ok(row, field) -> bool:
+    """Field of a tier 0 row present and well-formed."""
+    value = row.get(field)
+    if field in ("start", "end"):
+        return bool(any_date_re.match(str(value or "").replace(" ", "")))
+    if field == "qty":
+        return isinstance(value, int) and value >= 1
+    if field == "price":
+        return isinstance(value, (int, float))
+    return bool(value)
+
+
+def score_row(row) -> float:
+    """Completeness of one row (0..1): SKU, two dates, qty and price present and well-formed."""
+    return sum(_field_ok(row, field) for field in ROW_FIELDS) / len(ROW_FIELDS)
+
+
+def rows_complete(rows) -> bool:
+    """Every row has the ROW_REQUIRED fields (a high page score alone may hide a missing price on each row)."""
+    return all(_field_ok(row, field) for row in rows for field in ROW_REQUIRED)
+
+
+def score_page(rows) -> float:
+    """Mean row completeness; a page with no rows scores 0."""
+    if not rows:
+        return 0.0
+    return sum(score_row(r) for r in rows) / len(rows)
+
+
+@timed(rows=lambda result: len(result[0]))
+def tier0_rows(page, column_spec, is_sku, parse_row, required=("sku",), cache_namespace=None):
+    """
+    Run the tier 0 words pass on one page.
+    parse_row(cells) -> scored dict with keys sku/start/end/qty/price (plus anything else), or None
+    Returns (rows, page_score, layout). layout is None when no header was found.
+    With cache_namespace set, a known layout is sliced with its cached columns
+    (layout["known"] is True) and a new layout that scores well is remembered; a known
+    layout whose rows score below TIER0_KNOWN_MIN_SCORE (or that finds none) is forgotten (layout["known"] is
+    then False again, so tier 1 may learn the layout afresh).
+    """
+    words = page.get_text("words")
+    layout = find_header_columns(words, column_spec, required, page_width=page.rect.width,
+                                 cache_namespace=cache_namespace)
+    if layout is None or layout["fields"] is None:
+        return [], 0.0, layout
+    rows = [r for r in (parse_row(cells) for cells in slice_rows(words, layout, is_sku)) if r]
+    score = score_page(rows)
+    if cache_namespace and layout["known"] and score < TIER0_KNOWN_MIN_SCORE and learning_enabled():
+        forget_layout(cache_namespace, layout["fingerprint"])
+        layout["known"] = False
+    elif cache_namespace and rows and score >= TIER0_MIN_PAGE_SCORE and rows_complete(rows):
+        remember_layout(cache_namespace, layout)
+    return rows, score, layout
+
+
+def accept_tier0(rows, score, layout) -> bool:
+    """
+    A page is done after tier 0 if every row has the ROW_REQUIRED fields and the rows score
+    high enough (TIER0_KNOWN_MIN_SCORE for a known layout).
+    """
+    if not rows or not rows_complete(rows):
+        return False
+    return score >= (TIER0_KNOWN_MIN_SCORE if layout and layout.get("known") else TIER0_MIN_PAGE_SCORE)
+
+
+def table_clip(page, layout):
+    """Clip rectangle for tier 1 table detection: everything from the header down."""
+    import fitz
+    if not layout:
+        return None
+    return fitz.Rect(page.rect.x0, max(page.rect.y0, layout["header_y0"] - TABLE_CLIP_MARGIN), page.rect.x1, page.rect.y1)
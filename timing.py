@@ -0,0 +1,223 @@
+# timing.py
+"""
+Per-request timing spans for the quotation pipelines.
+- record(): collects the spans of one request into a Recorder (process_ibm_combo and
+  app.process_mibb use it when timings are requested: UI toggle or MINDTOOL_TIMING=1)
+- span(name): context manager timing a block - wall time and CPU time of the thread;
+  s.count(pages=..., rows=...) adds page / row counts to it
+- timed(name, rows=fn): decorator form; rows(result) gives the row count of the result
+- phases(): for long functions - ph.next("header") ends the previous phase and starts
+  the next one as a child span, ph.end() closes the last one
+- count(pages=, rows=): add to the innermost open span (e.g. pdf_io.open_pdf adds pages)
+Without an active recorder (the default) span() returns a shared no-op object and timed()
+costs one context-variable lookup per call. Spans recorded in a worker process
+(workers.call) are sent back and nested under the caller's open span.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+TIMING_DEFAULT = os.environ.get("MINDTOOL_TIMING", "0") == "1"
+
+_recorder = contextvars.ContextVar("mindtool_timing", default=None)
+
+
+class Span:
+    __slots__ = ("name", "depth", "note", "wall", "cpu", "pages", "rows", "_recorder", "_wall0", "_cpu0")
+
+    def __init__(self, recorder, name, note=None):
+        self.name = name
+        self.note = note
+        self.depth = 0
+        self.wall = None  # seconds; None while open (or if the block never closed it)
+        self.cpu = None
+        self.pages = None
+        self.rows = None
+        self._recorder = recorder
+
+    def count(self, pages=None, rows=None):
+        if pages is not None:
+            self.pages = (self.pages or 0) + pages
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+
+    def __enter__(self):
+        self._recorder._open(self)
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self._wall0
+        self.cpu = time.thread_time() - self._cpu0
+        self._recorder._close(self)
+        return False
+
+    def as_dict(self) -> dict:
+        return {
+            "span": self.name,
+            "depth": self.depth,
+            "wall_ms": round(self.wall * 1000, 2) if self.wall is not None else None,
+            "cpu_ms": round(self.cpu * 1000, 2) if self.cpu is not None else None,
+            "pages": self.pages,
+            "rows": self.rows,
+            "note": self.note,
+        }
+
+
+class _NullSpan:
+    """Returned when no recorder is active: every operation is a no-op."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, pages=None, rows=None):
+        pass
+
+    def next(self, name, note=None):
+        pass
+
+    def end(self):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class Recorder:
+    """Spans of one request, in start order, with their nesting depth."""
+
+    def __init__(self):
+        self.spans = []
+        self._stack = []
+        self._started = time.perf_counter()
+
+    def _open(self, span):
+        span.depth = len(self._stack)
+        self.spans.append(span)
+        self._stack.append(span)
+
+    def _close(self, span):
+        # Spans left open by an exception (e.g. an unfinished phase) are dropped from the stack
+        while self._stack:
+            if self._stack.pop() is span:
+                break
+
+    def current(self):
+        return self._stack[-1] if self._stack else None
+
+    def merge(self, spans):
+        """Add spans exported by another recorder (a worker process) under the open span."""
+        depth = len(self._stack)
+        for item in spans:
+            span = Span(self, item["span"], item.get("note"))
+            span.depth = depth + item["depth"]
+            span.wall = item["wall_ms"] / 1000 if item["wall_ms"] is not None else None
+            span.cpu = item["cpu_ms"] / 1000 if item["cpu_ms"] is not None else None
+            span.pages, span.rows = item["pages"], item["rows"]
+            self.spans.append(span)
+
+    def export(self) -> list:
+        return [span.as_dict() for span in self.spans]
+
+    def breakdown(self) -> dict:
+        """Per-request timing breakdown: {"total_ms", "spans": [span dicts in start order]}."""
+        return {"total_ms": round((time.perf_counter() - self._started) * 1000, 2), "spans": self.export()}
+
+
+class _Phases:
+    def __init__(self, recorder):
+        self._recorder = recorder
+        self._span = None
+
+    def next(self, name, note=None):
+        self.end()
+        self._span = Span(self._recorder, name, note).__enter__()
+
+    def count(self, pages=None, rows=None):
+        if self._span is not None:
+            self._span.count(pages, rows)
+
+    def end(self):
+        if self._span is not None:
+            self._span.__exit__(None, None, None)
+            self._span = None
+
+
+def active() -> bool:
+    return _recorder.get() is not None
+
+
+@contextmanager
+def record(enabled=True):
+    """Collect the spans of the enclosed block; yields the Recorder, or None when not enabled."""
+    if not enabled:
+        yield None
+        return
+    recorder = Recorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def span(name, note=None):
+    """Time the enclosed block as a child of the open span (no-op without a recorder)."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NULL
+    return Span(recorder, name, note)
+
+
+def phases():
+    """Sequential child spans for the phases of a long function (no-op without a recorder)."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NULL
+    return _Phases(recorder)
+
+
+def count(pages=None, rows=None):
+    """Add pages / rows to the innermost open span."""
+    recorder = _recorder.get()
+    if recorder is not None and recorder.current() is not None:
+        recorder.current().count(pages, rows)
+
+
+def merge(spans):
+    """Nest spans recorded elsewhere (see Recorder.export) under the open span."""
+    recorder = _recorder.get()
+    if recorder is not None and spans:
+        recorder.merge(spans)
+
+
+def timed(name=None, rows=None):
+    """
+    Decorator: time each call as a span named name (default: the function's qualified name).
+    rows: optional function of the return value giving the number of rows produced.
+    """
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder.get()
+            if recorder is None:
+                return fn(*args, **kwargs)
+            with Span(recorder, label) as s:
+                result = fn(*args, **kwargs)
+                if rows is not None:
+                    try:
+                        s.count(rows=rows(result))
+                    except Exception:
+                        pass
+                return result
+        return wrapper
+    return decorate
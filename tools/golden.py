@@ -0,0 +1,244 @@
+"""
+Golden-corpus regression check: outputs, time and memory of every case against a stored baseline.
+A case is a directory in the corpus (MINDTOOL_CORPUS_DIR, default corpus/) laid out like a
+capture bundle (capture.py): bundle.json + input.pdf [+ input.xlsx / master.csv], plus
+- expected.json   header info, columns and rows the pipeline must produce (--accept writes it)
+- baseline.json   best-of-N seconds and Python peak memory of the case (--update-baseline)
+A run fails when
+- any header field or row field differs from expected.json (numbers within 1e-6)
+- a case, or the sum over the cases of a template, is more than --max-slowdown percent slower
+  than its baseline (and at least --min-delta-ms slower: small documents are noisy)
+- a case's peak memory (tracemalloc, i.e. Python allocations - not MuPDF's heap) grew more
+  than --max-memory-growth percent
+Baselines are machine specific: record them on the machine that runs the check.
+Pipelines run in this process, after warmup.warm_up(), with empty layout cache / boilerplate
+store and no capture, so results do not depend on what this machine has learned.
+
+Usage:
+    python tools/golden.py --seed                      # synthetic cases (tools/synthetic.py)
+    python tools/golden.py --add captures/<id> --name customer-x   # anonymized captured bundle
+    python tools/golden.py --accept --update-baseline  # record outputs and budgets
+    python tools/golden.py                             # check; exit code 1 on any failure
+    python tools/golden.py --only t1-text-uae --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+_state = tempfile.mkdtemp(prefix="golden_")
+os.environ["MINDTOOL_CAPTURE"] = "0"
+os.environ["MINDTOOL_WORKER_PROCESSES"] = "0"
+os.environ["MINDTOOL_LAYOUT_CACHE"] = os.path.join(_state, "layout_cache.json")
+os.environ["MINDTOOL_BOILERPLATE_STORE"] = os.path.join(_state, "boilerplate_store.json")
+
+import capture  # noqa: E402
+
+CORPUS_DIR = os.environ.get("MINDTOOL_CORPUS_DIR", os.path.join(REPO_ROOT, "corpus"))
+
+# name -> (tool, country, items, files: {field: (filename, synthetic builder)})
+SEED_CASES = {
+    "t1-text-uae": ("combo", "UAE", 8, {"pdf": ("input.pdf", "template1_pdf"),
+                                         "excel": ("input.xlsx", "template1_excel")}),
+    "t1-text-qatar": ("combo", "Qatar", 8, {"pdf": ("input.pdf", "template1_pdf"),
+                                             "excel": ("input.xlsx", "template1_excel")}),
+    "t1-grid-ksa": ("combo", "KSA", 30, {"pdf": ("input.pdf", "template1_grid_pdf"),
+                                          "excel": ("input.xlsx", "template1_excel")}),
+    "t2-uae": ("combo", "UAE", 12, {"pdf": ("input.pdf", "template2_pdf")}),
+    "t2-ksa": ("combo", "KSA", 40, {"pdf": ("input.pdf", "template2_pdf")}),
+    "mibb": ("mibb", None, 40, {"pdf": ("input.pdf", "mibb_pdf"), "master": ("master.csv", "pricelist_csv")}),
+}
+
+
+# ----------------------------------------------------------------------
+# Corpus management
+# ----------------------------------------------------------------------
+def seed(corpus):
+    import synthetic
+    for name, (tool, country, items, files) in SEED_CASES.items():
+        path = os.path.join(corpus, name)
+        os.makedirs(path, exist_ok=True)
+        info = {"tool": tool, "reason": "synthetic", "seconds": 0, "template": None, "error": None,
+                "traceback": None, "params": {"country": country} if country else {},
+                "captured_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": {}}
+        for field, (filename, builder) in files.items():
+            with open(os.path.join(path, filename), "wb") as f:
+                f.write(getattr(synthetic, builder)(items))
+            info["files"][field] = {"file": filename, "name": filename}
+        with open(os.path.join(path, "bundle.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, indent=2)
+        print(f"seeded {path}")
+
+
+def add(corpus, bundle, name):
+    path = os.path.join(corpus, name or os.path.basename(os.path.normpath(bundle)))
+    shutil.copytree(bundle, path, ignore=shutil.ignore_patterns("lines.json"), dirs_exist_ok=True)
+    print(f"added {path} - check that it holds no customer data, then run --accept --only {os.path.basename(path)}")
+
+
+def cases(corpus, only):
+    if not os.path.isdir(corpus):
+        return []
+    names = sorted(n for n in os.listdir(corpus) if os.path.exists(os.path.join(corpus, n, "bundle.json")))
+    return [os.path.join(corpus, n) for n in names if not only or n in only]
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write(path, value):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False, indent=1, default=str)
+
+
+# ----------------------------------------------------------------------
+# Measuring and comparing
+# ----------------------------------------------------------------------
+def measure(info, repeat):
+    """(result, output, best seconds, peak KB of Python allocations) of a case."""
+    best = None
+    with contextlib.redirect_stdout(io.StringIO()):  # the extractors print their progress
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            result, output = capture.rerun(info)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            capture.rerun(info)
+            peak_kb = (tracemalloc.get_traced_memory()[1] - base) / 1024
+        finally:
+            tracemalloc.stop()
+    # JSON round trip: compare with expected.json on the same types
+    return result, json.loads(json.dumps(output, default=str)), best, peak_kb
+
+
+def _same(a, b) -> bool:
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        return abs(a - b) <= 1e-6 * max(1.0, abs(a), abs(b))
+    return a == b
+
+
+def _field(value, key):
+    if isinstance(value, dict):
+        return value.get(key)
+    return value[key] if key < len(value) else None
+
+
+def diff(expected, actual, limit=20) -> list:
+    """Field-by-field differences between two outputs, as readable lines."""
+    problems = []
+    if expected.get("error") != actual.get("error"):
+        problems.append(f"error: expected {expected.get('error')!r}, got {actual.get('error')!r}")
+    header_e, header_a = expected.get("header_info") or {}, actual.get("header_info") or {}
+    for key in sorted(set(header_e) | set(header_a)):
+        if not _same(header_e.get(key), header_a.get(key)):
+            problems.append(f"header {key!r}: expected {header_e.get(key)!r}, got {header_a.get(key)!r}")
+    rows_e, rows_a = expected.get("data") or [], actual.get("data") or []
+    if len(rows_e) != len(rows_a):
+        problems.append(f"rows: expected {len(rows_e)}, got {len(rows_a)}")
+    columns = actual.get("columns") or expected.get("columns")
+    for r, (row_e, row_a) in enumerate(zip(rows_e, rows_a), 1):
+        keys = sorted(set(row_e) | set(row_a)) if isinstance(row_e, dict) else range(max(len(row_e), len(row_a)))
+        for key in keys:
+            if not _same(_field(row_e, key), _field(row_a, key)):
+                label = columns[key] if columns and isinstance(key, int) and key < len(columns) else key
+                problems.append(f"row {r} field {label!r}: expected {_field(row_e, key)!r}, got {_field(row_a, key)!r}")
+    if len(problems) > limit:
+        problems = problems[:limit] + [f"... {len(problems) - limit} more differences"]
+    return problems
+
+
+def _template(info, result) -> str:
+    return f"combo/template {result.get('template')}" if info["tool"] == "combo" else info["tool"]
+
+
+def _over(value, baseline, percent, floor) -> bool:
+    return value > baseline * (1 + percent / 100) and value - baseline > floor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--seed", action="store_true", help="write the synthetic cases into the corpus")
+    parser.add_argument("--add", metavar="BUNDLE", help="copy a captured bundle into the corpus")
+    parser.add_argument("--name", help="case name for --add (default: the bundle id)")
+    parser.add_argument("--only", action="append", help="run only this case (repeatable)")
+    parser.add_argument("--accept", action="store_true", help="write expected.json from this run")
+    parser.add_argument("--update-baseline", action="store_true", help="write baseline.json from this run")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case; the fastest counts")
+    parser.add_argument("--max-slowdown", type=float, default=20.0, help="percent over the baseline seconds")
+    parser.add_argument("--min-delta-ms", type=float, default=50.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--max-memory-growth", type=float, default=20.0, help="percent over the baseline peak")
+    args = parser.parse_args(argv)
+
+    if args.seed:
+        seed(args.corpus)
+    if args.add:
+        add(args.corpus, args.add, args.name)
+    if args.seed or args.add:
+        return 0
+
+    import warmup
+    with contextlib.redirect_stdout(io.StringIO()):
+        warmup.warm_up()
+    failures = 0
+    totals = {}  # template -> [seconds, baseline seconds]
+    for path in cases(args.corpus, args.only):
+        name = os.path.basename(path)
+        info = capture.load(path)
+        result, output, seconds, peak_kb = measure(info, args.repeat)
+        problems = []
+        expected = _read(os.path.join(path, "expected.json"))
+        if args.accept:
+            _write(os.path.join(path, "expected.json"), output)
+        elif expected is None:
+            problems.append("no expected.json (run with --accept)")
+        else:
+            problems += diff(expected, output)
+        baseline = _read(os.path.join(path, "baseline.json"))
+        if args.update_baseline or baseline is None:
+            if args.update_baseline:
+                _write(os.path.join(path, "baseline.json"), {"seconds": seconds, "peak_kb": peak_kb,
+                                                             "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+            budget = "new baseline" if args.update_baseline else "no baseline"
+        else:
+            if _over(seconds, baseline["seconds"], args.max_slowdown, args.min_delta_ms / 1000):
+                problems.append(f"{seconds * 1000:.0f} ms is more than {args.max_slowdown:.0f}% over the baseline "
+                                f"{baseline['seconds'] * 1000:.0f} ms")
+            if _over(peak_kb, baseline["peak_kb"], args.max_memory_growth, 256):
+                problems.append(f"peak {peak_kb:.0f} KB is more than {args.max_memory_growth:.0f}% over the "
+                                f"baseline {baseline['peak_kb']:.0f} KB")
+            total = totals.setdefault(_template(info, result), [0.0, 0.0])
+            total[0] += seconds
+            total[1] += baseline["seconds"]
+            budget = f"baseline {baseline['seconds'] * 1000:8.1f} ms {baseline['peak_kb']:9.0f} KB"
+        status = "FAIL" if problems else "ok  "
+        print(f"{status} {name:24s} {seconds * 1000:8.1f} ms {peak_kb:9.0f} KB  ({budget})")
+        for problem in problems:
+            print(f"       {problem}")
+        failures += bool(problems)
+    for template, (seconds, baseline) in sorted(totals.items()):
+        if _over(seconds, baseline, args.max_slowdown, args.min_delta_ms / 1000):
+            print(f"FAIL {template}: {seconds * 1000:.0f} ms in total, more than {args.max_slowdown:.0f}% over "
+                  f"the baseline {baseline * 1000:.0f} ms")
+            failures += 1
+    shutil.rmtree(_state, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Import-time budget and side-effect check.
+Each scenario imports a set of modules in a fresh interpreter, started in an empty
+temporary directory, and fails when:
+- the import takes longer than its budget (best of --repeat runs, seconds)
+- a module the scenario must not load shows up in sys.modules
+  (e.g. the MIBB tool pulling in Template 2 code)
+- the import created or modified files (cwd or the repository)
+
+Usage:
+    python tools/import_budget.py                # all scenarios
+    python tools/import_budget.py --scale 2      # looser budgets on a slow machine
+    python tools/import_budget.py --only mibb
+Exit code 1 when any scenario fails.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (modules to import, modules that must stay unloaded, budget in seconds)
+SCENARIOS = {
+    # What app.py imports before a tool is chosen: the page must render without extractors
+    "app-shell": (["stages", "jobs", "singleflight", "workers", "warmup", "metrics", "timing", "profiling", "memtrace"],
+                  ["fitz", "pandas", "openpyxl", "ibm", "ibm_template2", "sales.mibb", "sales.ibm_v2"], 0.25),
+    # MIBB tool: PyMuPDF + MIBB extractor only
+    "mibb": (["stages", "jobs", "workers", "pdf_io", "sales.mibb"],
+             ["ibm", "ibm_template2", "sales.ibm_v2", "sales.ibm_v2_combo", "pandas", "openpyxl"], 0.6),
+    # Combo tool: Template 2 code is loaded only when a Template 2 quote arrives
+    "combo": (["sales.ibm_v2_combo"], ["ibm_template2"], 1.5),
+    "template2": (["ibm_template2"], [], 1.5),
+    "ibm": (["ibm"], [], 1.5),
+    "terms": (["extract_ibm_terms", "tiered_extraction", "page_classifier", "ocr"], ["pandas", "openpyxl"], 0.6),
+}
+
+CHILD = r"""
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+modules = {modules!r}
+start = time.perf_counter()
+for name in modules:
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": sorted(m for m in {forbidden!r} if m in sys.modules)}}))
+"""
+
+
+def _snapshot(directory):
+    state = {}
+    for base, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in (".git", "__pycache__")]
+        for name in files:
+            path = os.path.join(base, name)
+            try:
+                state[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+    return state
+
+
+def run_scenario(modules, forbidden):
+    with tempfile.TemporaryDirectory(prefix="import_budget_") as cwd:
+        repo_before = _snapshot(REPO_ROOT)
+        code = CHILD.format(root=REPO_ROOT, modules=modules, forbidden=forbidden)
+        proc = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        created = sorted(os.listdir(cwd))
+        repo_after = _snapshot(REPO_ROOT)
+    changed = sorted(os.path.relpath(p, REPO_ROOT) for p, m in repo_after.items() if repo_before.get(p) != m)
+    result["files"] = created + changed
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this factor")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario; the fastest counts")
+    parser.add_argument("--only", action="append", help="run only this scenario (repeatable)")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for name, (modules, forbidden, budget) in SCENARIOS.items():
+        if args.only and name not in args.only:
+            continue
+        budget *= args.scale
+        runs = [run_scenario(modules, forbidden) for _ in range(max(1, args.repeat))]
+        errors = [r["error"] for r in runs if "error" in r]
+        if errors:
+            print(f"FAIL {name:10s} import error: {errors[0]}")
+            failures += 1
+            continue
+        best = min(r["seconds"] for r in runs)
+        problems = []
+        if best > budget:
+            problems.append(f"{best:.3f}s > budget {budget:.2f}s")
+        loaded = sorted({m for r in runs for m in r["loaded"]})
+        if loaded:
+            problems.append(f"loaded {', '.join(loaded)}")
+        files = sorted({f for r in runs for f in r["files"]})
+        if files:
+            problems.append(f"touched files {', '.join(files)}")
+        status = "FAIL" if problems else "ok  "
+        print(f"{status} {name:10s} {best:.3f}s (budget {budget:.2f}s)" + (f" - {'; '.join(problems)}" if problems else ""))
+        failures += bool(problems)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Concurrent-session load test: how many simultaneous reps one instance can serve.
+N sessions (threads, as Streamlit runs sessions) each loop: think (exponential, mean --think
+seconds), upload a quote and wait for the result - through the same path as app.py:
+jobs.submit / jobs.wait with a slot per session and tool, the job's memory estimate, and a
+stage cache per session. With --rerun-share of the results the session then reruns on the same
+inputs, like a download click (stage cache hits).
+Quotes are synthetic (tools/synthetic.py): a pool of --pool documents per kind with item counts
+spread over --items, picked at random, mixed by --mix weights (Template 1 text / column layout
+with its Excel export, Template 2, MIBB with a pricelist).
+Admission and workers come from the usual settings, so compare runs with different
+MINDTOOL_JOB_THREADS, MINDTOOL_JOB_MEMORY_MB, MINDTOOL_WORKER_PROCESSES,
+MINDTOOL_WORKER_MAX_JOBS, MINDTOOL_MAX_RSS_MB ...
+Reported: throughput, latency percentiles (submit to result, queueing included) per kind, error
+rate (pipeline errors, exceptions, QueueFull rejections), and every --sample seconds the RSS of
+this process and of the worker processes with the running / queued jobs.
+Layout cache and boilerplate store are temporary files and capture is off, so a load test
+leaves no trace.
+
+Usage:
+    python tools/loadtest.py --sessions 8 --duration 120 --think 5
+    MINDTOOL_WORKER_PROCESSES=4 MINDTOOL_JOB_THREADS=4 python tools/loadtest.py --sessions 16 --json load.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+_state = tempfile.mkdtemp(prefix="loadtest_")
+os.environ["MINDTOOL_CAPTURE"] = "0"
+os.environ["MINDTOOL_LAYOUT_CACHE"] = os.path.join(_state, "layout_cache.json")
+os.environ["MINDTOOL_BOILERPLATE_STORE"] = os.path.join(_state, "boilerplate_store.json")
+
+import synthetic  # noqa: E402
+
+MIBB_LOGO = os.path.join(REPO_ROOT, "image.png")
+COUNTRIES = ["UAE", "Qatar", "KSA"]
+
+
+def _named(data, name):
+    upload = io.BytesIO(data)
+    upload.name = name
+    return upload
+
+
+def build_pool(kinds, pool, low, high, rng) -> dict:
+    """kind -> list of (pdf bytes, second upload bytes or None), distinct item counts per kind."""
+    builders = {"t1": (synthetic.template1_pdf, synthetic.template1_excel),
+                "t1-grid": (synthetic.template1_grid_pdf, synthetic.template1_excel),
+                "t2": (synthetic.template2_pdf, None),
+                "mibb": (synthetic.mibb_pdf, synthetic.pricelist_csv)}
+    documents = {}
+    for kind in kinds:
+        pdf_builder, other_builder = builders[kind]
+        sizes = rng.sample(range(low, high + 1), min(pool, high - low + 1))
+        documents[kind] = [(pdf_builder(n), other_builder(n) if other_builder else None) for n in sizes]
+    return documents
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Discard what the extractors print, in worker processes too (they inherit file descriptor 1)."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+def _rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class Session(threading.Thread):
+    """One simulated rep: think, upload, wait; until the stop event is set."""
+
+    def __init__(self, documents, weights, args, stop, results, seed):
+        super().__init__(name=f"session-{seed}", daemon=True)
+        self.documents = documents
+        self.kinds = list(weights)
+        self.weights = [weights[k] for k in self.kinds]
+        self.args = args
+        self.stop = stop
+        self.results = results
+        self.rng = random.Random(seed)
+        self.slot = uuid.uuid4().hex
+        self.stages = {"combo": {}, "mibb": {}}  # st.session_state combo_stages / mibb_stages
+
+    def request(self, kind, pdf, other, country) -> dict:
+        import jobs
+        from pdf_io import page_count
+        from stages import content_hash
+        other_upload = _named(other, "pricelist.csv" if kind == "mibb" else "quote.xlsx") if other else None
+        memory_mb = jobs.estimate_job_mb(page_count(pdf), len(pdf), len(other) if other else 0)
+        if kind == "mibb":
+            from sales.mibb import process_mibb
+            key = (content_hash(pdf), content_hash(other_upload), False, False, False)
+            job = jobs.submit(f"{self.slot}:mibb", key, process_mibb, pdf, other_upload, self.stages["mibb"],
+                              MIBB_LOGO, memory_mb=memory_mb)
+        else:
+            from sales.ibm_v2_combo import process_ibm_combo
+            key = (content_hash(pdf), content_hash(other_upload), country, False, False, False)
+            job = jobs.submit(f"{self.slot}:combo", key, process_ibm_combo, pdf, other_upload, country=country,
+                              stage_cache=self.stages["combo"], memory_mb=memory_mb)
+        return jobs.wait(job)
+
+    def run(self):
+        import jobs
+        time.sleep(self.rng.uniform(0, self.args.ramp))
+        while not self.stop.is_set():
+            if self.stop.wait(self.rng.expovariate(1 / self.args.think) if self.args.think > 0 else 0):
+                break
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            pdf, other = self.rng.choice(self.documents[kind])
+            country = self.rng.choice(COUNTRIES)
+            rerun = False
+            while True:
+                entry = {"kind": kind, "rerun": rerun, "start": time.perf_counter(), "outcome": "ok"}
+                try:
+                    result = self.request(kind, pdf, other, country)
+                    if kind != "mibb" and result.get("error"):
+                        entry["outcome"] = "error"
+                        entry["error"] = result["error"]
+                except jobs.QueueFull:
+                    entry["outcome"] = "rejected"
+                except Exception as e:
+                    entry["outcome"] = "error"
+                    entry["error"] = f"{type(e).__name__}: {e}"
+                entry["seconds"] = time.perf_counter() - entry["start"]
+                self.results.append(entry)
+                if rerun or entry["outcome"] != "ok" or self.rng.random() >= self.args.rerun_share:
+                    break
+                rerun = True
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(entries, seconds) -> dict:
+    latencies = [e["seconds"] for e in entries if e["outcome"] == "ok"]
+    summary = {"requests": len(entries), "ok": len(latencies),
+               "errors": sum(e["outcome"] == "error" for e in entries),
+               "rejected": sum(e["outcome"] == "rejected" for e in entries),
+               "throughput_per_s": round(len(latencies) / seconds, 3) if seconds else 0.0}
+    summary["error_rate"] = round((summary["errors"] + summary["rejected"]) / len(entries), 4) if entries else 0.0
+    for q in (50, 90, 95, 99):
+        summary[f"p{q}_s"] = round(_percentile(latencies, q), 3)
+    summary["max_s"] = round(max(latencies), 3) if latencies else float("nan")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds before sessions stop uploading")
+    parser.add_argument("--think", type=float, default=5.0, help="mean think time between uploads (seconds)")
+    parser.add_argument("--ramp", type=float, default=5.0, help="sessions start spread over this many seconds")
+    parser.add_argument("--rerun-share", type=float, default=0.3, help="share of results followed by a rerun")
+    parser.add_argument("--mix", default="t1=3,t1-grid=1,t2=3,mibb=3", help="kind=weight,...")
+    parser.add_argument("--items", default="5,60", help="min,max line items of the synthetic quotes")
+    parser.add_argument("--pool", type=int, default=8, help="distinct documents per kind")
+    parser.add_argument("--sample", type=float, default=1.0, help="seconds between RSS samples")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write summary, per-request results and the RSS timeline here")
+    args = parser.parse_args(argv)
+    weights = {kind: float(weight) for kind, weight in (part.split("=") for part in args.mix.split(","))}
+    low, high = (int(n) for n in args.items.split(","))
+
+    import jobs
+    import warmup
+    import workers
+    from pdf_io import current_rss_mb
+    rng = random.Random(args.seed)
+    print(f"building {args.pool} documents per kind ({', '.join(weights)}) with {low}-{high} items")
+    documents = build_pool(weights, args.pool, low, high, rng)
+    print(f"jobs: {jobs.JOB_THREADS} threads, {jobs.JOB_MEMORY_MB} MB budget, queue {jobs.JOB_QUEUE_MAX}; "
+          f"workers: {workers.WORKER_PROCESSES} (max {workers.WORKER_MAX_JOBS} jobs / {workers.WORKER_MAX_RSS_MB} MB)")
+    print(f"{args.sessions} sessions, think {args.think}s mean, {args.duration:.0f}s")
+
+    stop = threading.Event()
+    results = []
+    timeline = []
+    sessions = [Session(documents, weights, args, stop, results, args.seed * 1000 + k) for k in range(args.sessions)]
+    with _quiet():
+        workers.start()
+        warmup.warm_up()
+        start = time.perf_counter()
+        for session in sessions:
+            session.start()
+        while True:
+            elapsed = time.perf_counter() - start
+            load = jobs.load()
+            worker_rss = [_rss_mb(pid) for pid in workers.pids()]
+            timeline.append({"t": round(elapsed, 1), "rss_mb": round(current_rss_mb() or 0.0, 1),
+                             "workers_rss_mb": round(sum(worker_rss), 1), "workers": len(worker_rss),
+                             "running": load["running"], "queued": load["queued"],
+                             "done": len(results)})
+            if elapsed >= args.duration:
+                stop.set()
+            if stop.is_set() and not any(s.is_alive() for s in sessions):
+                break
+            time.sleep(args.sample)
+    seconds = time.perf_counter() - start
+
+    summaries = {"all": summarize(results, seconds)}
+    for kind in weights:
+        summaries[kind] = summarize([e for e in results if e["kind"] == kind and not e["rerun"]], seconds)
+    summaries["reruns"] = summarize([e for e in results if e["rerun"]], seconds)
+    print(f"\n{len(results)} requests in {seconds:.1f}s")
+    print(f"{'':8s}{'requests':>9s}{'ok':>6s}{'errors':>7s}{'rejected':>9s}{'req/s':>8s}"
+          f"{'p50':>8s}{'p90':>8s}{'p95':>8s}{'p99':>8s}{'max':>8s}")
+    for name, s in summaries.items():
+        print(f"{name:8s}{s['requests']:9d}{s['ok']:6d}{s['errors']:7d}{s['rejected']:9d}{s['throughput_per_s']:8.2f}"
+              + "".join(f"{s[k]:8.2f}" for k in ("p50_s", "p90_s", "p95_s", "p99_s", "max_s")))
+    print(f"error rate {summaries['all']['error_rate']:.1%}")
+    errors = sorted({e["error"] for e in results if e.get("error")})
+    for error in errors[:5]:
+        print(f"  {error}")
+
+    print(f"\n{'t (s)':>7s}{'RSS MB':>9s}{'workers MB':>12s}{'running':>9s}{'queued':>8s}{'done':>6s}")
+    step = max(1, len(timeline) // 20)
+    for sample in timeline[::step] + ([timeline[-1]] if (len(timeline) - 1) % step else []):
+        print(f"{sample['t']:7.1f}{sample['rss_mb']:9.0f}{sample['workers_rss_mb']:12.0f}{sample['running']:9d}"
+              f"{sample['queued']:8d}{sample['done']:6d}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "summary": summaries, "requests": results, "timeline": timeline},
+                      f, indent=1, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Offline replay of a captured request (see capture.py).
+Re-runs a bundle from the capture spool with timings, optionally under the profiler
+(profiling.py), with allocation tracking (memtrace.py) or writing the extraction trace
+(tracing.py; --raw-lines adds every line read to it). The stage cache is off, the
+persisted layout cache / boilerplate store are read but not updated (pdf_io.no_learning),
+and capture is disabled, so a replay never writes into the spool.
+--from-lines skips PDF parsing: it re-runs only the line heuristics
+(ibm.parse_template1_lines / ibm_template2.parse_template2_lines) on the bundle's lines.json,
+which makes iterating on them a matter of milliseconds per run. A bundle captured without
+line lists gets them from its input.pdf on the first --from-lines run.
+
+Usage:
+    python tools/replay.py --list
+    python tools/replay.py captures/<id>                          # full pipeline, timing breakdown
+    python tools/replay.py captures/<id> --profile --allocations
+    python tools/replay.py captures/<id> --from-lines --repeat 50 --out rows.json
+    python tools/replay.py captures/<id> --from-lines --trace     # JSONL events of the heuristics
+    python tools/replay.py <id>                                   # id under MINDTOOL_CAPTURE_DIR
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ["MINDTOOL_CAPTURE"] = "0"
+
+import capture  # noqa: E402
+
+
+def _bundle_path(name):
+    if os.path.isdir(name):
+        return name
+    return os.path.join(capture.CAPTURE_DIR, name)
+
+
+def _print_timings(timings):
+    print(f"total {timings['total_ms']:.1f} ms")
+    for s in timings["spans"]:
+        label = "  " * s["depth"] + s["span"] + (f" ({s['note']})" if s["note"] else "")
+        extra = "".join(f" {k}={s[k]}" for k in ("pages", "rows") if s[k] is not None)
+        print(f"  {label:50s} {s['wall_ms'] or 0:10.1f} ms{extra}")
+
+
+def _print_reports(result):
+    profile = result.get("profile")
+    if profile:
+        print(f"\nprofile: {profile['files'].get('pstats')}  collapsed: {profile['files'].get('collapsed')}")
+        for h in profile["hotspots"]:
+            print(f"  {h['own_ms']:10.1f} ms own {h['cumulative_ms']:10.1f} ms cum {h['calls']:8d}x  "
+                  f"{h['function']} ({h['location']})")
+    allocations = result.get("allocations")
+    if allocations:
+        print(f"\nallocations: net {allocations['net_kb']:.0f} KB, peak {allocations['peak_kb']:.0f} KB")
+        for s in allocations["stages"]:
+            top = s["top"][0] if s["top"] else None
+            print(f"  {'  ' * s['depth']}{s['stage']:30s} net {s['net_kb']:10.1f} KB peak {s['peak_kb']:10.1f} KB"
+                  + (f"  top {top['site']} ({top['size_kb']} KB, via {top['via']})" if top else ""))
+    trace = result.get("trace")
+    if trace:
+        print(f"\ntrace: {trace['path']}  {trace['events']} events  "
+              + ", ".join(f"{kind}={n}" for kind, n in sorted(trace["counts"].items())))
+
+
+def replay_pipeline(info, args) -> dict:
+    """Re-run the captured request through its entry point (stage cache off)."""
+    result, output = capture.rerun(info, timings=True, profile=args.profile, allocations=args.allocations,
+                                   trace=args.trace, raw_lines=args.raw_lines)
+    print(f"template {result.get('template', info['tool'])}, {len(output['data'])} rows, error: {output['error']}")
+    _print_timings(result["timings"])
+    _print_reports(result)
+    return output
+
+
+def _line_lists(info):
+    """(extractor, lines) of the bundle; derived from input.pdf (and saved) when lines.json is missing."""
+    lines = info["lines"] or {}
+    template = str(info.get("template") or "")
+    if info["tool"] != "combo":
+        raise SystemExit("--from-lines replays the Template 1 / Template 2 line heuristics (combo bundles)")
+    extractor = "template2" if template in ("2", "template2") or "template2" in lines else "template1"
+    if extractor not in lines:
+        pdf = capture.upload(info, "pdf").getbuffer()
+        if extractor == "template1":
+            from ibm import read_template1_pages as read_pages
+        else:
+            from ibm_template2 import read_template2_pages as read_pages
+        lines[extractor] = read_pages(pdf)
+        with open(os.path.join(info["path"], "lines.json"), "w", encoding="utf-8") as f:
+            json.dump(lines, f, ensure_ascii=False)
+        print(f"line lists read from input.pdf and saved to {info['path']}/lines.json")
+    return extractor, lines[extractor]
+
+
+def replay_lines(info, args) -> dict:
+    """Re-run only the line heuristics on the captured line lists, --repeat times."""
+    import profiling
+    import timing
+    import tracing
+    extractor, pages = _line_lists(info)
+    if extractor == "template1":
+        from ibm import parse_template1_lines as parse
+    else:
+        from ibm_template2 import parse_template2_lines as parse
+    seconds = []
+    reports = {}
+    pdf = capture.upload(info, "pdf").getbuffer()
+    with profiling.capture(args.profile, f"replay-{extractor}", pdf) as profiler:
+        for run in range(max(1, args.repeat)):
+            # only the first run is traced: the events of every repeat would be the same
+            with tracing.request(args.trace and run == 0, f"replay-{extractor}", pdf, args.raw_lines) as tracer, \
+                    timing.record() as recorder:
+                start = time.perf_counter()
+                rows, header_info = parse(pages)
+                seconds.append(time.perf_counter() - start)
+            if tracer is not None:
+                reports["trace"] = tracer.report()
+    print(f"{extractor}: {len(rows)} rows from {len(pages['lines'])} lines; "
+          f"best {min(seconds) * 1000:.2f} ms, median {statistics.median(seconds) * 1000:.2f} ms over {len(seconds)} runs")
+    _print_timings(recorder.breakdown())
+    if profiler is not None:
+        reports["profile"] = profiler.report()
+    _print_reports(reports)
+    return {"header_info": header_info, "data": rows}
+
+
+def list_bundles():
+    if not os.path.isdir(capture.CAPTURE_DIR):
+        print(f"no captures in {capture.CAPTURE_DIR}")
+        return
+    for name in sorted(os.listdir(capture.CAPTURE_DIR)):
+        path = os.path.join(capture.CAPTURE_DIR, name)
+        if os.path.exists(os.path.join(path, "bundle.json")):
+            info = capture.load(path)
+            print(f"{name}  {info['captured_at']}  {info['tool']:6s} {info['reason']:9s} {info['seconds']:8.1f}s  "
+                  f"template={info['template']} lines={'yes' if info['lines'] else 'no'}"
+                  + (f"  error: {info['error']}" if info["error"] else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("bundle", nargs="?", help="bundle directory, or its id under MINDTOOL_CAPTURE_DIR")
+    parser.add_argument("--list", action="store_true", help="list the captured bundles")
+    parser.add_argument("--from-lines", action="store_true", help="re-run only the line heuristics on lines.json")
+    parser.add_argument("--repeat", type=int, default=1, help="--from-lines runs (timings of the last one are shown)")
+    parser.add_argument("--profile", action="store_true", help="run under the profiler (profiling.py)")
+    parser.add_argument("--allocations", action="store_true", help="track allocations per stage (memtrace.py; full pipeline only)")
+    parser.add_argument("--trace", action="store_true", help="write the extraction trace (tracing.py)")
+    parser.add_argument("--raw-lines", action="store_true", help="with --trace: add every line read to the trace")
+    parser.add_argument("--out", help="write header info and rows as JSON, for diffing runs")
+    args = parser.parse_args(argv)
+    if args.list or not args.bundle:
+        list_bundles()
+        return 0
+
+    from pdf_io import no_learning
+    info = capture.load(_bundle_path(args.bundle))
+    print(f"{info['tool']} bundle captured {info['captured_at']} ({info['reason']}, {info['seconds']}s)"
+          + (f"\n  error: {info['error']}" if info["error"] else ""))
+    with no_learning():
+        output = replay_lines(info, args) if args.from_lines else replay_pipeline(info, args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=1, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
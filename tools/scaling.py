@@ -0,0 +1,179 @@
+"""
+Scaling check: runs the same synthetic quote (tools/synthetic.py) at growing sizes through each
+pipeline and fits how the time of every stage grows with the number of line items.
+For each timing span of the pipeline (extractors, header parsers, window loop, Excel render ...)
+it reports the least-squares exponent k of time ~ n^k over all sizes, and the exponent between the
+two largest sizes (fixed costs flatten the fit at small sizes; a quadratic term shows in the tail).
+A stage fails when its tail exponent is more than --tolerance above that of n*log(n) between the
+same sizes (about 1.13 for 1,000 -> 5,000). Stages faster than --floor-ms at the largest size are
+reported but not judged: their timings are mostly noise.
+A size whose run takes longer than --budget-seconds ends the case: larger sizes are not run and the
+case fails.
+
+Usage:
+    python tools/scaling.py                                   # 10, 100, 1000, 5000 items
+    python tools/scaling.py --sizes 10,100,1000 --only t2 --json scaling.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+_state = tempfile.mkdtemp(prefix="scaling_")
+os.environ["MINDTOOL_CAPTURE"] = "0"
+os.environ["MINDTOOL_WORKER_PROCESSES"] = "0"
+os.environ["MINDTOOL_LAYOUT_CACHE"] = os.path.join(_state, "layout_cache.json")
+os.environ["MINDTOOL_BOILERPLATE_STORE"] = os.path.join(_state, "boilerplate_store.json")
+
+import synthetic  # noqa: E402
+
+MIBB_LOGO = os.path.join(REPO_ROOT, "image.png")
+
+
+def _named(data, name):
+    upload = io.BytesIO(data)
+    upload.name = name
+    return upload
+
+
+def _combo(pdf_builder, excel=True):
+    def run(n):
+        from sales.ibm_v2_combo import process_ibm_combo
+        pdf = pdf_builder(n)
+        xlsx = _named(synthetic.template1_excel(n), "quote.xlsx") if excel else None
+        return lambda: process_ibm_combo(pdf, xlsx, timings=True)
+    return run
+
+
+def _mibb(n):
+    from sales.mibb import process_mibb
+    pdf = synthetic.mibb_pdf(n)
+    master = synthetic.pricelist_csv(n)
+    return lambda: process_mibb(pdf, _named(master, "pricelist.csv"), None, MIBB_LOGO, timings=True)
+
+
+# case -> function of n returning the call to time (inputs are built outside the timing)
+CASES = {
+    "t1": _combo(synthetic.template1_pdf),
+    "t1-grid": _combo(synthetic.template1_grid_pdf),
+    "t2": _combo(synthetic.template2_pdf, excel=False),
+    "mibb": _mibb,
+}
+
+
+def _span_times(timings) -> dict:
+    """Total wall ms per span path ("t1.extract/extract_ibm_data_from_pdf/header")."""
+    times = {"total": timings["total_ms"]}
+    stack = []
+    for s in timings["spans"]:
+        del stack[s["depth"]:]
+        stack.append(s["span"])
+        path = "/".join(stack)
+        times[path] = times.get(path, 0.0) + (s["wall_ms"] or 0.0)
+    return times
+
+
+def _slope(points) -> float:
+    """Least-squares slope of log(ms) over log(n)."""
+    xs = [math.log(n) for n, _ in points]
+    ys = [math.log(max(ms, 1e-3)) for _, ms in points]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx if sxx else 0.0
+
+
+def _nlogn_exponent(n1, n2) -> float:
+    return math.log(n2 * math.log(n2) / (n1 * math.log(n1))) / math.log(n2 / n1)
+
+
+def run_case(name, sizes, budget):
+    """{size: {span path: ms}} for the sizes that ran, and the size that blew the budget (or None)."""
+    results = {}
+    for n in sizes:
+        call = CASES[name](n)
+        with contextlib.redirect_stdout(io.StringIO()):  # the extractors print their progress
+            start = time.perf_counter()
+            result = call()
+            seconds = time.perf_counter() - start
+        rows = result.get("data") or result.get("table_data") or []
+        if len(rows) != n:
+            print(f"  {name} n={n}: {len(rows)} rows extracted (expected {n}) - error: {result.get('error')}")
+        results[n] = _span_times(result["timings"])
+        print(f"  {name} n={n}: {seconds:.2f}s")
+        if seconds > budget:
+            return results, n
+    return results, None
+
+
+def judge(results, tolerance, floor_ms) -> list:
+    """Per stage: {stage, ms: {n: ms}, exponent, tail_exponent, limit, status}."""
+    sizes = sorted(results)
+    if len(sizes) < 2:
+        return []
+    n1, n2 = sizes[-2], sizes[-1]
+    limit = _nlogn_exponent(n1, n2) + tolerance
+    stages = []
+    for path in results[n2]:
+        points = [(n, results[n][path]) for n in sizes if path in results[n]]
+        if len(points) < 2 or points[-2][0] != n1:
+            continue
+        tail = math.log(max(points[-1][1], 1e-3) / max(points[-2][1], 1e-3)) / math.log(n2 / n1)
+        if points[-1][1] < floor_ms:
+            status = "noise"
+        else:
+            status = "FAIL" if tail > limit else "ok"
+        stages.append({"stage": path, "ms": dict(points), "exponent": round(_slope(points), 2),
+                       "tail_exponent": round(tail, 2), "limit": round(limit, 2), "status": status})
+    return stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="comma separated line item counts")
+    parser.add_argument("--only", action="append", choices=sorted(CASES), help="run only this case (repeatable)")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed exponent above n*log(n)")
+    parser.add_argument("--floor-ms", type=float, default=50.0, help="do not judge stages faster than this")
+    parser.add_argument("--budget-seconds", type=float, default=300.0, help="stop a case after a slower run")
+    parser.add_argument("--json", help="write the per-stage results to this file")
+    args = parser.parse_args(argv)
+    sizes = sorted(int(n) for n in args.sizes.split(","))
+
+    import warmup
+    from pdf_io import no_learning
+    with contextlib.redirect_stdout(io.StringIO()):
+        warmup.warm_up()
+    failures = 0
+    report = {}
+    with no_learning():
+        for name in args.only or CASES:
+            print(f"{name}:")
+            results, blown = run_case(name, sizes, args.budget_seconds)
+            stages = judge(results, args.tolerance, args.floor_ms)
+            report[name] = {"sizes": sorted(results), "over_budget_at": blown, "stages": stages}
+            header = "".join(f"{n:>10d}" for n in sorted(results))
+            print(f"  {'stage':60s}{header}   fit  tail  limit")
+            for s in stages:
+                label = s["stage"] if len(s["stage"]) <= 60 else "..." + s["stage"][-57:]
+                times = "".join(f"{s['ms'].get(n, float('nan')):10.1f}" for n in sorted(results))
+                print(f"  {label:60s}{times} {s['exponent']:5.2f} {s['tail_exponent']:5.2f} {s['limit']:5.2f}"
+                      f"  {s['status']}")
+            failures += sum(s["status"] == "FAIL" for s in stages)
+            if blown is not None:
+                print(f"  FAIL {name}: over {args.budget_seconds:.0f}s at {blown} items, larger sizes not run")
+                failures += 1
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    print(f"{failures} stage(s) grow faster than n*log(n)" if failures else "all stages within n*log(n)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
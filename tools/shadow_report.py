@@ -0,0 +1,94 @@
+"""
+Shadow-run report (see shadow.py): agreement and speed of each candidate extractor against its
+primary, from the runs recorded in MINDTOOL_SHADOW_DIR, with the promotion verdict:
+- "promote candidate": at least shadow.PROMOTE_MIN_RUNS runs, rows identical on at least
+  shadow.PROMOTE_MIN_AGREEMENT of them, candidate median time not above the primary's
+- "keep primary (...)" / "wait (...)" otherwise
+--run records shadow runs offline, one per bundle (capture spool or golden corpus, tool "mibb"),
+in this process and in the foreground, e.g. to judge a candidate before sampling live traffic.
+
+Usage:
+    python tools/shadow_report.py                             # every shadow with recorded runs
+    python tools/shadow_report.py --examples 3                # and the latest differing rows
+    python tools/shadow_report.py --run captures/* corpus/mibb --shadow mibb_table
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ["MINDTOOL_CAPTURE"] = "0"
+os.environ["MINDTOOL_WORKER_PROCESSES"] = "0"
+
+import shadow  # noqa: E402
+
+# shadow -> capture tool whose bundles it can run on
+SHADOW_TOOLS = {"mibb_table": "mibb"}
+
+
+def run_bundles(name, paths):
+    import capture
+    for path in paths:
+        if not os.path.exists(os.path.join(path, "bundle.json")):
+            continue
+        info = capture.load(path)
+        if info["tool"] != SHADOW_TOOLS[name]:
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):  # the candidates print their progress
+            record = shadow.run(name, bytes(capture.upload(info, "pdf").getbuffer()))
+        result = record["error"] or f"agreement {record['agreement']:.2%}"
+        print(f"  {os.path.basename(path.rstrip('/'))}: {result}, primary {record['primary_ms']:.1f} ms, "
+              f"candidate {record['candidate_ms']:.1f} ms")
+
+
+def print_examples(records, count):
+    differing = [r for r in records if r.get("error") or r.get("agreement", 1.0) < 1.0
+                 or r["primary_rows"] != r.get("candidate_rows")]
+    for r in differing[-count:]:
+        print(f"  {r['at']} input {r['input']}: {r['error'] or ''}")
+        for kind in ("changed", "only_primary", "only_candidate"):
+            for example in r.get("examples", {}).get(kind, []):
+                print(f"    {kind:15s} {json.dumps(example, ensure_ascii=False, default=str)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shadow", action="append", choices=sorted(shadow.CANDIDATES), help="only this shadow")
+    parser.add_argument("--run", nargs="+", metavar="BUNDLE", help="record shadow runs on these bundles first")
+    parser.add_argument("--examples", type=int, default=0, help="show the differing rows of the latest N runs")
+    parser.add_argument("--json", help="write the summaries to this file")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for name in args.shadow or shadow.CANDIDATES:
+        primary, candidate = shadow.CANDIDATES[name]
+        if args.run:
+            from pdf_io import no_learning
+            print(f"{name}: running {len(args.run)} bundle(s)")
+            with no_learning():
+                run_bundles(name, args.run)
+        records = shadow.load(name)
+        s = report[name] = shadow.summary(records)
+        print(f"{name}: {candidate} vs {primary}")
+        if s["runs"] > s["errors"]:
+            print(f"  runs {s['runs']} (errors {s['errors']}), identical rows on {s['exact_runs']} "
+                  f"({s['exact_share']:.1%}), mean row agreement {s['mean_agreement']:.1%}")
+            print(f"  median ms: primary {s['primary_median_ms']:.1f}, candidate {s['candidate_median_ms']:.1f} "
+                  f"(x{s['speed_ratio']:.2f})")
+        else:
+            print(f"  runs {s['runs']} (errors {s['errors']})")
+        print(f"  verdict: {s['verdict']}")
+        if args.examples:
+            print_examples(records, args.examples)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
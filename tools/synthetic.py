@@ -0,0 +1,192 @@
+"""
+Synthetic IBM / MIBB quotations of any size, for the corpus, scaling and load tools.
+Every document carries made-up customers and part numbers only:
+- template1_pdf(n)       Template 1 quote in the text-line layout (window heuristics)
+- template1_grid_pdf(n)  Template 1 quote in the column layout (tier 0 words pass)
+- template1_excel(n)     the matching Template 1 Excel export
+- template2_pdf(n)       Template 2 (Software as a Service) quote, one service block per item
+- mibb_pdf(n)            MIBB quote with a ruled parts table over as many pages as needed
+- pricelist_csv(n)       MIBB pricelist covering the part numbers of mibb_pdf(n)
+Usage:
+    python tools/synthetic.py OUTDIR --items 50   # writes one of each into OUTDIR
+"""
+import argparse
+import io
+import os
+import sys
+
+PAGE_BOTTOM = 800
+LINE_HEIGHT = 11
+
+
+def _text_pdf(sections) -> bytes:
+    """Each section starts a new page; long sections flow onto further pages."""
+    import fitz
+    doc = fitz.open()
+    for lines in sections:
+        page = doc.new_page()
+        y = 40
+        for line in lines:
+            if y > PAGE_BOTTOM:
+                page = doc.new_page()
+                y = 40
+            page.insert_text((40, y), line, fontsize=8)
+            y += LINE_HEIGHT
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _sku(prefix, k):
+    """7-character part number, unique per item: D012ZLL for the first 100, then D0123ZX."""
+    return f"{prefix}{k:04d}ZX" if k >= 100 else f"{prefix}0{k:02d}ZLL"
+
+
+def _euro(value) -> str:
+    """1234.5 -> '1.234,50' (the number format of the IBM quotes)."""
+    return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def template1_pdf(n=5) -> bytes:
+    header = ["IBM Ireland Product Distribution Limited", "Customer Name:", "ACME LLC", "Reseller Name:",
+              "Reseller Co", "Bid Number:", "1234567", "PA Site Number:", "555", "City:", "Dubai", "Country:", "UAE",
+              "Bid Expiration Date:", "31-Dec-2025", "Maximum End User Price (MEP):", "12.345,67 USD"]
+    rows = ["Parts Information",
+            "Part Number Coverage Start Coverage End Entitled Unit SVP Entitled Ext SVP Disc % Bid Unit SVP Bid Ext SVP"]
+    for k in range(n):
+        q = k % 50 + 2
+        rows += [f"{k + 1}", _sku("D", k), f"IBM Widget Suite Subscription {k}", "01-Jan-2025", "31-Dec-2025",
+                 f"{q} 12", "100,00", _euro(q * 100), "10,00", "90,00", _euro(q * 90)]
+    terms = ["IBM Terms and Conditions", "IBM International Passport Advantage Agreement applies.",
+             "The quote or order is subject to terms.", "Page 3 of 3"]
+    return _text_pdf([header, rows, terms])
+
+
+def template1_grid_pdf(n=4) -> bytes:
+    import fitz
+    doc = fitz.open()
+    page = doc.new_page(width=842, height=595)
+    y = 30
+    for line in ["IBM Ireland Product Distribution Limited", "Customer Name:", "ACME LLC", "Bid Number:", "1234567"]:
+        page.insert_text((30, y), line, fontsize=8)
+        y += LINE_HEIGHT
+    cols = ["Part Number", "Description", "Quantity", "Coverage Start", "Coverage End", "Entitled Unit SVP",
+            "Entitled Ext SVP", "Bid Unit SVP", "Bid Ext SVP"]
+    xs = [30, 100, 260, 320, 400, 480, 560, 640, 720]
+    per_page = 20
+    for start in range(0, max(n, 1), per_page):
+        page = doc.new_page(width=842, height=595)
+        page.insert_text((30, 30), "Parts Information", fontsize=8)
+        for c, title in enumerate(cols):
+            page.insert_text((xs[c], 60), title, fontsize=7)
+        for r, k in enumerate(range(start, min(start + per_page, n))):
+            yy = 80 + r * 24
+            q = k % 50 + 2
+            values = [_sku("D", k), f"IBM Widget Suite {k}", str(q), "01-Jan-2025", "31-Dec-2025", "100,00",
+                      _euro(q * 100), "90,00", _euro(q * 90)]
+            for c, value in enumerate(values):
+                page.insert_text((xs[c], yy), value, fontsize=7)
+            page.insert_text((xs[1], yy + 9), "Subscription License", fontsize=7)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def template1_excel(n=5) -> bytes:
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Quote"
+    ws["A1"] = "IBM Quote"
+    ws["B13"] = "Quote number:"
+    ws["C13"] = "1234567"
+    ws["C13"].number_format = "@"
+    parts = wb.create_sheet("Parts")
+    for k in range(n):
+        q = k % 50 + 2
+        values = [_sku("D", k), f"Widget {k}", "IBM", "SW", "grp", "terms", q, "01-Jan-2025", "31-Dec-2025", 12, 0, "",
+                  0, 100.0, 0, 90.0, q * 100.0, 0.1, q * 90.0, 0, 0, q * 90.0, 0, 0, "No"]
+        for c, value in enumerate(values, 1):
+            parts.cell(row=10 + k, column=c, value=value)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def template2_pdf(n=1) -> bytes:
+    header = ["Customer Name:", "ACME LLC", "Bid Number:", "7654321", "Bid Expiration Date:", "30-Jun-2025",
+              "Maximum End User Price:", "25.000,00 USD", "Software as a Service", "IBM Opportunity Number:",
+              "ABCDEF123456"]
+    services = []
+    for k in range(n):  # item numbers run 001-099 (the Template 2 row pattern), then start over
+        q = k % 200 + 1
+        services += [f"IBM Maximo Application Suite Premium AppPoints {k}", f"Subscription Part#: {_sku('D', k)}",
+                     "Projected Service Start Date: 01-Jul-2025", "Service Level Agreement: 99.9",
+                     "Subscription Length: 12 Months", "Billing: Upfront", "Renewal Type: Auto",
+                     "Channel Discount: 8%", "Customer Unit Price", f"{k % 99 + 1:03d}", str(q), "1-12", "100,00",
+                     _euro(q * 100), "90,00", _euro(q * 90), "0,00"]
+    terms = ["IBM Terms and Conditions", "IBM International Passport Advantage Agreement applies.",
+             "Useful/Important web resources:", "http://ibm.com/x"]
+    return _text_pdf([header, services, terms])
+
+
+def mibb_pdf(n=6) -> bytes:
+    import fitz
+    doc = fitz.open()
+    cols = ["Part Number", "Description", "Transaction Type", "Coverage Start", "Coverage End", "Quantity",
+            "Discount%", "Bid Ext SVP"]
+    xs = [30, 110, 300, 380, 460, 540, 600, 680, 800]
+    per_page = 28
+    for start in range(0, max(n, 1), per_page):
+        page = doc.new_page(width=842, height=595)
+        y = 30
+        if start == 0:
+            for line in ["MIBB Quotation", "Customer Name: ACME", "Bid Number: 998877",
+                         "Bid Expiration Date: 31/12/2025", "Subscription Quotation - Parts Information"]:
+                page.insert_text((30, y), line, fontsize=8)
+                y += LINE_HEIGHT
+        top, height = y + 5, 16
+        rows = [cols] + [[_sku("E", k), f"Widget svc {k}", "New", "01/01/2025", "31/12/2025", str(k % 50 + 1), "10",
+                          _euro(1200 + k)] for k in range(start, min(start + per_page, n))]
+        for r, row in enumerate(rows):
+            for c, value in enumerate(row):
+                page.insert_text((xs[c] + 2, top + r * height + 11), value, fontsize=7)
+        for r in range(len(rows) + 1):
+            page.draw_line((xs[0], top + r * height), (xs[-1], top + r * height))
+        for x in xs:
+            page.draw_line((x, top), (x, top + len(rows) * height))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def pricelist_csv(n=6) -> bytes:
+    lines = ["Part Number,Description"] + [f"{_sku('E', k)},Widget service {k} (pricelist)" for k in range(n)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+BUILDERS = {
+    "template1.pdf": template1_pdf,
+    "template1_grid.pdf": template1_grid_pdf,
+    "template1.xlsx": template1_excel,
+    "template2.pdf": template2_pdf,
+    "mibb.pdf": mibb_pdf,
+    "pricelist.csv": pricelist_csv,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("outdir")
+    parser.add_argument("--items", type=int, default=5, help="line items per document")
+    args = parser.parse_args(argv)
+    os.makedirs(args.outdir, exist_ok=True)
+    for name, build in BUILDERS.items():
+        with open(os.path.join(args.outdir, name), "wb") as f:
+            f.write(build(args.items))
+        print(os.path.join(args.outdir, name))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
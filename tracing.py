@@ -0,0 +1,108 @@
+# tracing.py
+"""
+Structured extraction trace: typed events of one request as JSON lines, off by default.
+Enabled per request (process_ibm_combo(trace=True), the hidden "?profile=1" UI toggle,
+tools/replay.py --trace) or for every request with MINDTOOL_TRACE=1. request() writes
+MINDTOOL_TRACE_DIR/<input hash>-<tool>-<time>.jsonl, one event per line:
+    {"t_ms": 12.31, "event": "sku", "sku": "D0123ZX", "candidates": ["D0123ZX"], ...}
+Events (EVENTS):
+- page       kinds of a page and whether its lines go to the line heuristics
+- tier0      rows and score of the tier 0 words pass on a table page
+- raw_lines  every line the heuristics read; large, so only with raw_lines=True or
+             MINDTOOL_TRACE_RAW_LINES=1
+- header     the header fields found
+- chunk      a window of lines (Template 1) or service block (Template 2) being matched
+- sku        the part number chosen for it, with the other candidates
+- qty        the quantity and the rule that solved it
+- price      unit / extended price and the rule that chose them
+- skip       a chunk or block dropped, and why
+- row        a row emitted
+Call sites look the trace up once per function and build payloads only when it is on:
+    tr = tracing.current()
+    ...
+    if tr is not None:
+        tr.event("sku", sku=sku, candidates=[c for c, _, _ in found])
+so a request without tracing pays one ContextVar lookup per function - no formatting, no I/O.
+Stages served from the stage cache emit nothing. While tracing, workers.call() runs in this
+process (workers.inline()), so the extractors' events land in this request's trace.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import workers
+from stages import content_hash
+
+logger = logging.getLogger("tracing")
+
+TRACE_DEFAULT = os.environ.get("MINDTOOL_TRACE", "0") == "1"
+TRACE_DIR = os.environ.get("MINDTOOL_TRACE_DIR", "traces")
+TRACE_RAW_LINES = os.environ.get("MINDTOOL_TRACE_RAW_LINES", "0") == "1"
+
+EVENTS = frozenset({"page", "tier0", "raw_lines", "header", "chunk", "sku", "qty", "price", "skip", "row"})
+
+_trace = contextvars.ContextVar("mindtool_trace", default=None)
+
+
+class Trace:
+    def __init__(self, tool, source, raw_lines):
+        self.tool = tool
+        self.raw_lines = raw_lines
+        self.input_hash = content_hash(source)
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        self.path = os.path.join(TRACE_DIR, f"{self.input_hash[:12]}-{tool}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+        self.counts = Counter()
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._start = time.perf_counter()
+
+    def event(self, kind, **fields):
+        """Write one event; kind is one of EVENTS."""
+        if kind not in EVENTS:
+            raise ValueError(f"unknown trace event {kind!r}")
+        record = {"t_ms": round((time.perf_counter() - self._start) * 1000, 2), "event": kind}
+        record.update(fields)
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.counts[kind] += 1
+
+    def close(self):
+        self._file.close()
+
+    def report(self) -> dict:
+        return {"path": self.path, "events": sum(self.counts.values()), "counts": dict(self.counts)}
+
+
+def current():
+    """The Trace of the running request, or None when tracing is off."""
+    return _trace.get()
+
+
+@contextmanager
+def request(enabled, tool, source, raw_lines=None):
+    """
+    Trace the enclosed block when enabled (None: MINDTOOL_TRACE); yields the Trace or None.
+    raw_lines: also emit the raw_lines event (None: MINDTOOL_TRACE_RAW_LINES).
+    The file is complete when the block exits, also when it raised.
+    """
+    if enabled is None:
+        enabled = TRACE_DEFAULT
+    if not enabled:
+        yield None
+        return
+    try:
+        trace = Trace(tool, source, TRACE_RAW_LINES if raw_lines is None else raw_lines)
+    except OSError as e:  # tracing must never fail the request itself
+        logger.warning(f"Could not open trace file: {e}")
+        yield None
+        return
+    token = _trace.set(trace)
+    try:
+        with workers.inline():
+            yield trace
+    finally:
+        _trace.reset(token)
+        trace.close()
+        logger.info(f"Trace of {tool} {trace.input_hash[:12]} ({sum(trace.counts.values())} events) saved to {trace.path}")
@@ -0,0 +1,224 @@
+# warmup.py
+"""
+Start-up warm-up, so the first quotation after a deploy runs at steady-state speed.
+warm_up() runs once per process (later calls return the first report) and:
+- imports the extraction modules (PyMuPDF, openpyxl, pandas, extractors and their regexes)
+- loads the persisted layout cache and boilerplate store
+- runs a tiny synthetic PDF through extract_ibm_data_from_pdf, extract_ibm_template2_from_pdf
+  and extract_mibb_table_from_pdf, inside pdf_io.no_learning() and metrics.paused() so nothing
+  synthetic is persisted or counted
+- builds the Excel skeletons (Template 1 / 2 and MIBB workbooks with the logo)
+- preloads the pricelist at MINDTOOL_MASTER_PRICELIST (if set) into sales.mibb.load_master_map
+Each step is timed; the report is logged and returned. A failing step is logged and skipped.
+- app.py: start_background() on the first script run (MINDTOOL_WARMUP=0 disables it)
+- workers.py: every worker process calls warm_up() before taking jobs
+- batch entry points: call warm_up(), or run `python warmup.py` to print the report
+"""
+import importlib
+import io
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("warmup")
+
+WARMUP_ENABLED = os.environ.get("MINDTOOL_WARMUP", "1") != "0"
+MASTER_PRICELIST = os.environ.get("MINDTOOL_MASTER_PRICELIST", "")
+WARMUP_MODULES = ("fitz", "openpyxl", "pandas", "template_detector", "ibm", "ibm_template2",
+                  "extract_ibm_terms", "sales.ibm_v2", "sales.ibm_v2_combo", "sales.mibb")
+LOGO_PATH = "image.png"
+WARMUP_COUNTRY = "UAE"
+
+_lock = threading.Lock()
+_report = None
+_thread = None
+_thread_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+# Synthetic documents (a page or two in the shape of each template)
+# ----------------------------------------------------------------------
+def _text_pdf(pages) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        y = 40
+        for line in lines:
+            page.insert_text((40, y), line, fontsize=8)
+            y += 11
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _template1_pdf() -> bytes:
+    header = ["IBM Ireland Product Distribution Limited", "Customer Name:", "Warm-up LLC",
+              "Bid Number:", "1000000", "Bid Expiration Date:", "31-Dec-2030",
+              "Maximum End User Price (MEP):", "1.000,00 USD"]
+    parts = ["Parts Information",
+             "Part Number Coverage Start Coverage End Entitled Unit SVP Entitled Ext SVP Disc % Bid Unit SVP Bid Ext SVP",
+             "1", "D0000LL", "Warm-up Subscription", "01-Jan-2030", "31-Dec-2030", "1 12",
+             "100,00", "100,00", "10,00", "90,00", "90,00"]
+    terms = ["IBM Terms and Conditions", "IBM International Passport Advantage Agreement applies.", "Page 3 of 3"]
+    return _text_pdf([header, parts, terms])
+
+
+def _template2_pdf() -> bytes:
+    header = ["Customer Name:", "Warm-up LLC", "Bid Number:", "1000000", "Bid Expiration Date:", "31-Dec-2030",
+              "Maximum End User Price:", "1.000,00 USD", "Software as a Service"]
+    service = ["IBM Warm-up Service", "Subscription Part#: D0000ZX", "Projected Service Start Date: 01-Jan-2030",
+               "Subscription Length: 12 Months", "Channel Discount: 8%", "Customer Unit Price",
+               "001", "1", "1-12", "100,00", "100,00", "90,00", "90,00", "0,00"]
+    terms = ["IBM Terms and Conditions", "IBM International Passport Advantage Agreement applies.",
+             "Useful/Important web resources:"]
+    return _text_pdf([header, service, terms])
+
+
+def _mibb_pdf() -> bytes:
+    """Landscape page with a ruled table, so the table-detection path runs too."""
+    import fitz
+    doc = fitz.open()
+    page = doc.new_page(width=842, height=595)
+    y = 30
+    for line in ["MIBB Quotation", "Customer Name: Warm-up", "Bid Number: 1000000",
+                 "Subscription Quotation - Parts Information"]:
+        page.insert_text((30, y), line, fontsize=8)
+        y += 11
+    xs = [30, 110, 300, 380, 460, 540, 600, 680, 800]
+    rows = [["Part Number", "Description", "Transaction Type", "Coverage Start", "Coverage End",
+             "Quantity", "Discount%", "Bid Ext SVP"],
+            ["E0000LL", "Warm-up service", "New", "01/01/2030", "31/12/2030", "1", "10", "100,00"]]
+    top, height = y + 5, 16
+    for r, row in enumerate(rows):
+        for c, value in enumerate(row):
+            page.insert_text((xs[c] + 2, top + r * height + 11), value, fontsize=7)
+    for r in range(len(rows) + 1):
+        page.draw_line((xs[0], top + r * height), (xs[-1], top + r * height))
+    for x in xs:
+        page.draw_line((x, top), (x, top + len(rows) * height))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+# ----------------------------------------------------------------------
+# Steps
+# ----------------------------------------------------------------------
+def _import_modules():
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+
+
+def _load_stores():
+    from tiered_extraction import _load_layout_cache
+    from extract_ibm_terms import _load_store
+    _load_layout_cache()
+    _load_store()
+
+
+def _warm_template1(pdf):
+    from ibm import extract_ibm_data_from_pdf
+    from extract_ibm_terms import extract_ibm_terms_text
+    from template_detector import detect_ibm_template
+    detect_ibm_template(pdf)
+    extract_ibm_data_from_pdf(pdf)
+    extract_ibm_terms_text(pdf)
+
+
+def _warm_template2(pdf):
+    from ibm_template2 import extract_ibm_template2_from_pdf
+    extract_ibm_template2_from_pdf(pdf, WARMUP_COUNTRY)
+
+
+def _warm_mibb(pdf):
+    from sales.mibb import extract_mibb_header_from_pdf, extract_mibb_table_from_pdf
+    extract_mibb_header_from_pdf(pdf)
+    extract_mibb_table_from_pdf(pdf)
+
+
+def _build_excel_skeletons():
+    from ibm_template2 import extract_ibm_template2_items
+    from currency_projection import project_template2_items
+    from sales.ibm_v2_combo import _render_template1, _render_template2
+    from sales.mibb import mibb_excel_bytes
+    header_info = {"Customer Name": "Warm-up LLC", "Bid Number": "1000000"}
+    _render_template1([], header_info, "", None, WARMUP_COUNTRY)
+    items, t2_header = extract_ibm_template2_items(_template2_pdf())
+    _render_template2(project_template2_items(items, WARMUP_COUNTRY), t2_header, "", WARMUP_COUNTRY)
+    mibb_excel_bytes([["E0000LL", "Warm-up service", "01/01/2030", "31/12/2030", 1, 100.0]],
+                     header_info, LOGO_PATH)
+
+
+def _preload_pricelist():
+    if not MASTER_PRICELIST:
+        return
+    from sales.mibb import load_master_map
+    with open(MASTER_PRICELIST, "rb") as f:
+        upload = io.BytesIO(f.read())
+    upload.name = os.path.basename(MASTER_PRICELIST)
+    load_master_map(upload)
+
+
+def _timed(report, name, fn, *args):
+    start = time.perf_counter()
+    try:
+        fn(*args)
+    except Exception as e:
+        report["errors"][name] = str(e)
+        logger.warning(f"Warm-up step {name} failed: {e}")
+    report["steps"][name] = time.perf_counter() - start
+
+
+def warm_up(force=False) -> dict:
+    """
+    Warm this process (see module docstring). Runs once; force=True runs again.
+    Returns {"steps": {name: seconds}, "errors": {name: message}, "total": seconds}.
+    """
+    global _report
+    with _lock:
+        if _report is not None and not force:
+            return _report
+        report = {"steps": {}, "errors": {}, "total": 0.0}
+        start = time.perf_counter()
+        _timed(report, "imports", _import_modules)
+        _timed(report, "stores", _load_stores)
+        from pdf_io import no_learning
+        from metrics import paused
+        with no_learning(), paused():
+            _timed(report, "template1", _warm_template1, _template1_pdf())
+            _timed(report, "template2", _warm_template2, _template2_pdf())
+            _timed(report, "mibb", _warm_mibb, _mibb_pdf())
+            _timed(report, "excel", _build_excel_skeletons)
+        _timed(report, "pricelist", _preload_pricelist)
+        report["total"] = time.perf_counter() - start
+        _report = report
+    steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in report["steps"].items())
+    logger.info(f"Warm-up done in {report['total']:.2f}s ({steps})")
+    return report
+
+
+def start_background():
+    """Run warm_up() in a daemon thread, once per process (no-op with MINDTOOL_WARMUP=0)."""
+    global _thread
+    if not WARMUP_ENABLED:
+        return
+    with _thread_lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=warm_up, name="mindtool-warmup", daemon=True)
+    _thread.start()
+
+
+def last_report():
+    """The warm-up report, or None while it has not finished."""
+    return _report
+
+
+if __name__ == "__main__":
+    result = warm_up()
+    for name, seconds in result["steps"].items():
+        error = result["errors"].get(name)
+        print(f"{name:10s} {seconds:7.3f}s" + (f"  FAILED: {error}" if error else ""))
+    print(f"{'total':10s} {result['total']:7.3f}s")
@@ -0,0 +1,211 @@
+# workers.py
+"""
+Optional pool of recyclable worker processes for PyMuPDF / openpyxl work.
+Long-lived Streamlit processes grow RSS through native-heap fragmentation from
+repeated fitz.open / find_tables / Workbook builds, and a MuPDF crash takes every
+session down with it. With MINDTOOL_WORKER_PROCESSES > 0, call(fn, ...) runs fn in
+one of that many worker processes instead:
+- workers are spawned pre-warmed (warmup.warm_up(): extractors imported and run once)
+- a worker is replaced after MINDTOOL_WORKER_MAX_JOBS jobs or once its RSS passes
+  MINDTOOL_WORKER_MAX_RSS_MB; a crashed worker fails only its own job (WorkerCrashed)
+- inputs and results cross the process boundary pickled: PDFs as bytes, rows as
+  plain lists/dicts, Excel files as bytes; fn must be a module-level function
+- a cancelled job (jobs.JobCancelled) kills its worker instead of waiting for it
+- when the caller records timings (timing.py) the worker records the job's spans too and
+  sends them back with the result; metrics recorded in the worker (metrics.py) go back
+  with every result and are added to this process's registry
+With MINDTOOL_WORKER_PROCESSES=0 (default), or inside inline() (profiling.py), call() just
+runs fn in this process.
+"""
+import atexit
+import contextvars
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+from contextlib import contextmanager
+
+from jobs import checkpoint, JobCancelled
+import metrics
+import timing
+
+logger = logging.getLogger("workers")
+
+WORKER_PROCESSES = int(os.environ.get("MINDTOOL_WORKER_PROCESSES", "0") or 0)
+WORKER_MAX_JOBS = int(os.environ.get("MINDTOOL_WORKER_MAX_JOBS", "50") or 0)
+WORKER_MAX_RSS_MB = int(os.environ.get("MINDTOOL_WORKER_MAX_RSS_MB", "768") or 0)
+POLL_INTERVAL = 0.1  # seconds between cancellation checks while a worker runs
+
+_ctx = multiprocessing.get_context("spawn")  # never fork the threaded Streamlit server
+_idle = []
+_all = set()
+_cond = threading.Condition()
+_inline = contextvars.ContextVar("mindtool_workers_inline", default=False)
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker process died while running the job (e.g. a MuPDF crash)."""
+
+
+def _worker_main(conn):
+    from warmup import warm_up
+    warm_up()
+    from pdf_io import current_rss_mb
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        module, name, args, kwargs, timed = message
+        with timing.record(timed) as recorder:
+            try:
+                fn = getattr(importlib.import_module(module), name)
+                reply = ("ok", fn(*args, **kwargs))
+            except Exception as e:
+                reply = ("error", e)
+        spans = recorder.export() if recorder is not None else None
+        drained = metrics.drain()
+        try:
+            conn.send(reply + (current_rss_mb(), spans, drained))
+        except Exception as e:  # unpicklable result or exception
+            conn.send(("error", RuntimeError(f"{name}: {reply[1]!r} could not be returned ({e})"),
+                       current_rss_mb(), spans, drained))
+    conn.close()
+
+
+class _Worker:
+    def __init__(self):
+        self.conn, child_conn = _ctx.Pipe()
+        self.process = _ctx.Process(target=_worker_main, args=(child_conn,), daemon=True,
+                                    name="mindtool-worker")
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.rss_mb = 0.0
+
+    def worn_out(self) -> bool:
+        return ((WORKER_MAX_JOBS and self.jobs >= WORKER_MAX_JOBS)
+                or (WORKER_MAX_RSS_MB and self.rss_mb >= WORKER_MAX_RSS_MB))
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+def start():
+    """Spawn (pre-warm) the configured number of workers; safe to call on every rerun."""
+    if WORKER_PROCESSES <= 0:
+        return
+    with _cond:
+        while len(_all) < WORKER_PROCESSES:
+            worker = _Worker()
+            _all.add(worker)
+            _idle.append(worker)
+            _cond.notify()
+
+
+def _acquire():
+    start()
+    with _cond:
+        while not _idle:
+            _cond.wait(POLL_INTERVAL)
+            checkpoint()  # a queued call can be cancelled too
+        return _idle.pop()
+
+
+def _release(worker, broken=False):
+    if broken or worker.worn_out():
+        reason = "broken" if broken else f"{worker.jobs} jobs, {worker.rss_mb:.0f} MB RSS"
+        logger.info(f"Recycling worker {worker.process.pid} ({reason})")
+        with _cond:
+            _all.discard(worker)
+        worker.stop(kill=broken)
+        start()  # the replacement is pre-warmed before the next job needs it
+        return
+    with _cond:
+        _idle.append(worker)
+        _cond.notify()
+
+
+def _plain(value):
+    # memoryviews (zero-copy uploads) cannot be pickled: they cross the boundary as bytes
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    return value
+
+
+def call(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in a worker process (or in-process when workers are disabled)."""
+    if WORKER_PROCESSES <= 0 or _inline.get():
+        return fn(*args, **kwargs)
+    args = tuple(_plain(a) for a in args)
+    kwargs = {k: _plain(v) for k, v in kwargs.items()}
+    worker = _acquire()
+    broken = True
+    try:
+        worker.conn.send((fn.__module__, fn.__qualname__, args, kwargs, timing.active()))
+        while not worker.conn.poll(POLL_INTERVAL):
+            if not worker.process.is_alive():
+                raise WorkerCrashed(f"worker {worker.process.pid} exited with code {worker.process.exitcode}"
+                                    f" while running {fn.__qualname__}")
+            checkpoint()
+        try:
+            status, value, rss_mb, spans, drained = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            raise WorkerCrashed(f"worker {worker.process.pid} died while running {fn.__qualname__}: {e}")
+        broken = False
+        worker.jobs += 1
+        worker.rss_mb = rss_mb or 0.0
+        timing.merge(spans)
+        metrics.absorb(drained)
+    except JobCancelled:
+        logger.info(f"Killing worker {worker.process.pid}: job cancelled")
+        raise
+    finally:
+        _release(worker, broken)
+    if status == "error":
+        raise value
+    return value
+
+
+@contextmanager
+def inline():
+    """Within the block, call() runs fn in this process even when workers are enabled."""
+    token = _inline.set(True)
+    try:
+        yield
+    finally:
+        _inline.reset(token)
+
+
+def pids() -> list:
+    """Process ids of the live workers (tools/loadtest.py samples their RSS)."""
+    with _cond:
+        return [worker.process.pid for worker in _all]
+
+
+metrics.gauge_function("mindtool_worker_processes", "Live extraction worker processes", lambda: len(_all))
+
+
+def shutdown():
+    with _cond:
+        workers = list(_all)
+        _all.clear()
+        _idle.clear()
+    for worker in workers:
+        worker.stop()
+
+
+atexit.register(shutdown)